@@ -0,0 +1,333 @@
+import argparse
+import hashlib
+import io
+import json
+import os
+import struct
+import sys
+import zlib
+
+import pygame
+
+from race_engine import WIDTH, HEIGHT
+
+ASSET_DIR = "assets"
+
+# 馬の画像（6頭以上は同じ絵を暗くして使い回す）
+CACTUS_FILES = [
+    "cactus_red.png",
+    "cactus_blue.png",
+    "cactus_yellow.png",
+    "cactus_green.png",
+    "cactus_white.png",
+]
+BG_FILE = "horce_race.webp"
+TITLE_FILE = "tennoji.webp"
+TITLE_SCALE = 0.7
+TITLE_KEYS = range(50, 101)     # タイトル拡縮の段階（倍率 0.50～1.00 を 0.01 刻み）
+
+# 拡縮済み画像のディスクキャッシュ置き場。Web版はファイルが残らないので既定で使わない
+#   CACTUS_ASSET_CACHE=path : 置き場を変える（空文字で無効）
+CACHE_DIR = os.environ.get("CACTUS_ASSET_CACHE", "" if sys.platform == "emscripten" else ".asset_cache")
+CACHE_HEADER = struct.Struct("<HH?")   # 幅, 高さ, アルファ有無（後ろに生の画素列）
+
+# アセットパック：表示サイズに拡縮済みの馬アトラス・背景・タイトル拡縮フレームをまとめた1ファイル。
+#   python assets.py build [--field-size 5 50 200] [--compress]
+# ヘッダ＋索引(JSON)の後に各画像が並ぶ。馬アトラスは BGRA 画素列で、無圧縮のまま mmap して
+# Surface にし、1頭ずつは subsurface で切り出す（--compress なら zlib で縮め、読むときに戻す）。
+# 背景とタイトルは表示サイズに拡縮済みの PNG で持ち、起動時には拡縮しない。どれも読んだら convert する
+PACK_FILE = "assets.pack"
+PACK_MAGIC = b"APAK"
+PACK_VERSION = 3
+PACK_HEADER = struct.Struct("<4sBI")   # magic, version, 索引の長さ
+
+
+def sprite_size(num_horses):
+    # 大人数ほど小さく描く
+    base = len(CACTUS_FILES)
+    return 160 if num_horses <= base else max(40, 160 * base // num_horses)
+
+
+def tint_shade(gen):
+    # gen 世代目（0 が元の色）の暗くする度合い
+    return 255 - (gen * 37) % 150
+
+
+def source_digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()[:16]
+
+
+def packed_name(name, size, alpha):
+    # 拡縮済みの画像をパックに入れるときの名前（AssetManager.image(name, size, alpha) と対応）
+    return f"{name}@{size[0]}x{size[1]}{'a' if alpha else ''}"
+
+
+def encode_png(surface, alpha):
+    # pygame（libpng）の PNG と、フィルタなし＋zlib 9 の PNG の小さい方
+    # （ほぼ透明なタイトルは後者、写真のような背景は前者が小さい）
+    out = io.BytesIO()
+    pygame.image.save(surface, out, "image.png")
+    saved = out.getvalue()
+    width, height = surface.get_size()
+    mode, color_type = ("RGBA", 6) if alpha else ("RGB", 2)
+    stride = width * len(mode)
+    pixels = memoryview(pygame.image.tobytes(surface, mode))
+    rows = b"".join(b"\x00" + pixels[y * stride:(y + 1) * stride] for y in range(height))
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    plain = (b"\x89PNG\r\n\x1a\n"
+             + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0))
+             + chunk(b"IDAT", zlib.compress(rows, 9))
+             + chunk(b"IEND", b""))
+    return min(saved, plain, key=len)
+
+
+class AssetPack:
+    """assets.py build で作ったパックを mmap して、画像を取り出す。"""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            try:
+                import mmap
+                self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ImportError, OSError, ValueError):
+                # mmap できない環境（Web版など）は丸ごと読む
+                self.buf = f.read()
+        magic, version, index_len = PACK_HEADER.unpack_from(self.buf)
+        if magic != PACK_MAGIC or version != PACK_VERSION:
+            raise ValueError(f"not an asset pack: {path}")
+        index = json.loads(bytes(self.buf[PACK_HEADER.size:PACK_HEADER.size + index_len]))
+        self.entries = index["entries"]
+        self.sources = index["sources"]
+        self.view = memoryview(self.buf)
+        self.surfaces = {}
+
+    def is_fresh(self, asset_dir):
+        # 元画像があるのに中身が変わっていたら使わない（元画像を同梱しない Web版は常に使う）
+        for name, digest in self.sources.items():
+            path = os.path.join(asset_dir, name)
+            if os.path.exists(path) and source_digest(path) != digest:
+                return False
+        return True
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def image(self, name):
+        # 画面の形式に convert 済みの Surface（画面を作ってから呼ぶ）
+        surface = self.surfaces.get(name)
+        if surface is None:
+            entry = self.entries[name]
+            data = self.view[entry["offset"]:entry["offset"] + entry["length"]]
+            if entry.get("format") == "png":
+                surface = pygame.image.load(io.BytesIO(data), "image.png")
+            elif entry["zlib"]:
+                surface = pygame.image.frombytes(zlib.decompress(data), tuple(entry["size"]), "BGRA")
+            else:
+                surface = pygame.image.frombuffer(data, tuple(entry["size"]), "BGRA")
+            surface = surface.convert_alpha() if entry.get("alpha", True) else surface.convert()
+            self.surfaces[name] = surface
+        return surface
+
+    def field_sprites(self, num_horses, size):
+        name = f"field{num_horses}@{size}"
+        if name not in self.entries:
+            return None
+        atlas = self.image(name)
+        cols = len(CACTUS_FILES)
+        return [atlas.subsurface(((i % cols) * size, (i // cols) * size, size, size)) for i in range(num_horses)]
+
+
+class AssetManager:
+    """画像を初回使用時に読み込み・拡縮し、convert 済みの Surface を覚えておく。
+
+    拡縮した画像は「元ファイルのハッシュ＋サイズ」をキーに生の画素列でディスクに置き、
+    次回起動からはデコードも拡縮もせずに読み込む。
+    """
+
+    def __init__(self, asset_dir=ASSET_DIR, cache_dir=CACHE_DIR, pack_file=PACK_FILE):
+        self.asset_dir = asset_dir
+        self.cache_dir = cache_dir
+        self.pack = None
+        if pack_file and os.path.exists(self.path(pack_file)):
+            try:
+                pack = AssetPack(self.path(pack_file))
+            except (ValueError, struct.error):
+                pack = None   # 古い形式・壊れたパックは使わない（python assets.py build で作り直す）
+            if pack is not None and pack.is_fresh(asset_dir):
+                self.pack = pack
+        self.images = {}      # (name, size, alpha, scale) -> Surface
+        self.sources = {}     # name -> 読み込んだままの元画像
+        self.digests = {}     # name -> 元ファイルのハッシュ
+        self.disk_hits = 0
+        self.decodes = 0
+
+    def path(self, name):
+        return os.path.join(self.asset_dir, name)
+
+    def source(self, name):
+        surface = self.sources.get(name)
+        if surface is None:
+            surface = self.sources[name] = pygame.image.load(self.path(name))
+            self.decodes += 1
+        return surface
+
+    def image(self, name, size=None, alpha=False, scale=None):
+        # size=(w, h) か scale=倍率 で拡縮（scale は元画像の大きさを知らなくてもキャッシュを引ける）
+        key = (name, size, alpha, scale)
+        surface = self.images.get(key)
+        if surface is None and size is not None and self.pack is not None:
+            packed = packed_name(name, size, alpha)
+            if packed in self.pack:
+                surface = self.images[key] = self.pack.image(packed)   # 拡縮・convert 済み
+        if surface is None:
+            surface = self._load_cached(name, size, alpha, scale)
+            if surface is None:
+                surface = self.source(name)
+                if scale is not None:
+                    size = (int(surface.get_width() * scale), int(surface.get_height() * scale))
+                if size is not None and surface.get_size() != size:
+                    surface = pygame.transform.scale(surface, size)
+                self._store_cached(name, size, alpha, scale, surface)
+            surface = surface.convert_alpha() if alpha else surface.convert()
+            self.images[key] = surface
+        return surface
+
+    def title(self, key):
+        # タイトルの拡縮フレーム（key は倍率×100）
+        name = f"title{key}"
+        if self.pack is not None and name in self.pack:
+            return self.pack.image(name)
+        return self.image(TITLE_FILE, alpha=True, scale=round(TITLE_SCALE * key / 100, 4))
+
+    def field_sprites(self, num_horses, size):
+        # 出走馬ごとの画像（パックに無ければ元画像から拡縮・色違いを作る）
+        if self.pack is not None:
+            sprites = self.pack.field_sprites(num_horses, size)
+            if sprites is not None:
+                return sprites
+        base = [self.image(f, (size, size), alpha=True) for f in CACTUS_FILES]
+        sprites = []
+        for i in range(num_horses):
+            gen = i // len(base)
+            img = base[i % len(base)]
+            if gen > 0:
+                img = img.copy()
+                shade = tint_shade(gen)
+                img.fill((shade, shade, shade), special_flags=pygame.BLEND_RGB_MULT)
+            sprites.append(img)
+        return sprites
+
+    def _digest(self, name):
+        digest = self.digests.get(name)
+        if digest is None:
+            if self.pack is not None and name in self.pack.sources:
+                digest = self.pack.sources[name]   # is_fresh で元画像と同じと確かめてある
+            else:
+                digest = source_digest(self.path(name))
+            self.digests[name] = digest
+        return digest
+
+    def _cache_path(self, name, size, alpha, scale):
+        stem = os.path.splitext(name)[0]
+        tag = f"x{scale:g}" if scale is not None else f"{size[0]}x{size[1]}"
+        return os.path.join(self.cache_dir, f"{stem}-{self._digest(name)}-{tag}{'a' if alpha else ''}.raw")
+
+    def _load_cached(self, name, size, alpha, scale):
+        if not self.cache_dir or (size is None and scale is None):
+            return None
+        try:
+            with open(self._cache_path(name, size, alpha, scale), "rb") as f:
+                data = f.read()
+            w, h, has_alpha = CACHE_HEADER.unpack_from(data)
+            surface = pygame.image.frombytes(data[CACHE_HEADER.size:], (w, h), "RGBA" if has_alpha else "RGB")
+        except (OSError, struct.error, ValueError):
+            return None
+        self.disk_hits += 1
+        return surface
+
+    def _store_cached(self, name, size, alpha, scale, surface):
+        if not self.cache_dir or (size is None and scale is None):
+            return
+        path = self._cache_path(name, size, alpha, scale)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            w, h = surface.get_size()
+            pixels = pygame.image.tobytes(surface, "RGBA" if alpha else "RGB")
+            # 書きかけのファイルを読まないよう一時名で書いてから置き換える
+            with open(path + ".tmp", "wb") as f:
+                f.write(CACHE_HEADER.pack(w, h, alpha) + pixels)
+            os.replace(path + ".tmp", path)
+        except OSError:
+            pass
+
+
+def build_pack(field_sizes, asset_dir=ASSET_DIR, out=PACK_FILE, compress=False):
+    # 元画像から作るのでディスクキャッシュと既存パックは使わない
+    # compress=True ならアトラスも zlib で縮める（mmap しない Web版で配る大きさを抑える）
+    manager = AssetManager(asset_dir, cache_dir="", pack_file=None)
+    images = {}
+    cols = len(CACTUS_FILES)
+    for n in field_sizes:
+        size = sprite_size(n)
+        rows = (n + cols - 1) // cols
+        atlas = pygame.Surface((cols * size, rows * size), pygame.SRCALPHA)
+        for i, sprite in enumerate(manager.field_sprites(n, size)):
+            atlas.blit(sprite, ((i % cols) * size, (i // cols) * size))
+        images[f"field{n}@{size}"] = atlas
+
+    entries, blobs = {}, []
+    offset = 0
+    for name, surface in images.items():
+        data = pygame.image.tobytes(surface, "BGRA")
+        if compress:
+            data = zlib.compress(data, 9)
+        entries[name] = {"offset": offset, "length": len(data), "size": list(surface.get_size()), "zlib": compress}
+        blobs.append(data)
+        offset += len(data)
+    # 背景とタイトル拡縮フレームは表示サイズにしてから PNG で
+    encoded = {packed_name(BG_FILE, (WIDTH, HEIGHT), False): (manager.image(BG_FILE, (WIDTH, HEIGHT)), False)}
+    for key in TITLE_KEYS:
+        encoded[f"title{key}"] = (manager.title(key), True)
+    for name, (surface, alpha) in encoded.items():
+        data = encode_png(surface, alpha)
+        entries[name] = {"offset": offset, "length": len(data), "format": "png", "alpha": alpha}
+        blobs.append(data)
+        offset += len(data)
+    sources = {name: manager._digest(name) for name in CACTUS_FILES + [TITLE_FILE, BG_FILE]}
+
+    # 画素列の先頭（16バイト境界）は索引の長さで決まり、索引の長さは offset の桁数で変わるので収まるまで回す
+    base = PACK_HEADER.size
+    while True:
+        shifted = {name: dict(entry, offset=entry["offset"] + base) for name, entry in entries.items()}
+        index = json.dumps({"entries": shifted, "sources": sources}).encode()
+        if PACK_HEADER.size + len(index) <= base:
+            break
+        base = PACK_HEADER.size + len(index)
+        base += -base % 16
+    index = index.ljust(base - PACK_HEADER.size)
+    path = os.path.join(asset_dir, out)
+    with open(path, "wb") as f:
+        f.write(PACK_HEADER.pack(PACK_MAGIC, PACK_VERSION, len(index)))
+        f.write(index)
+        for data in blobs:
+            f.write(data)
+    return path, PACK_HEADER.size + len(index) + offset
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="アセットパックの作成")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build")
+    build.add_argument("--field-size", type=int, nargs="+", default=[len(CACTUS_FILES)])
+    build.add_argument("--compress", action="store_true", help="アトラスも zlib で縮める（Web版向け）")
+    args = parser.parse_args()
+
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    pygame.display.init()
+    pygame.display.set_mode((1, 1))
+    path, nbytes = build_pack(args.field_size, compress=args.compress)
+    print(f"wrote {path} ({nbytes} bytes)")
@@ -0,0 +1,280 @@
+import argparse
+import time
+
+import numpy as np
+
+from race_engine import (
+    GOAL_X, DEADHEAT_START_X, DEADHEAT_END_X, DEADHEAT_UPDATE_INTERVAL,
+    STRATEGIES, TICK_DT, COUNTDOWN_FRAMES, START_X,
+    BALANCE, RaceEngine, load_balance, opening_frames,
+)
+
+# 戦術コード（STRATEGIES のインデックス）
+SAN, ICHI, NI, YON = range(4)
+
+NOT_FINISHED = np.iinfo(np.int32).max
+DTYPE = np.float32
+PAIRWISE_MAX_HORSES = 8     # これより多い頭数は総当たりでなくソートで前の馬を探す
+
+
+def strategy_table(values, dtype=np.float64):
+    # 戦術名 → 値の辞書を STRATEGIES の並び（戦術コード）の配列に
+    return np.array([values[s] for s in STRATEGIES], dtype=dtype)
+
+
+class RaceBatch:
+    """N レース × 頭数を配列で持ち、全レースを同じティックで進める。"""
+
+    # 配列は (頭数, N) で持つ（馬ごとの行が連続になるので列演算が速い）
+
+    def __init__(self, n_races, num_horses=5, seed=None, wait_ticks=0, engine=None, balance=None):
+        self.n_races = n_races
+        self.num_horses = num_horses
+        self.wait_ticks = wait_ticks
+        self.balance = balance if balance is not None else BALANCE   # race_engine.BALANCE と同じ形
+        self.rng = np.random.default_rng(seed)
+        if engine is None:
+            self.reset()
+        else:
+            self.load_engine(engine)
+
+    def _uniform(self, low, high, shape=None):
+        # float32 の一様乱数（Generator.uniform は dtype を取れないため）
+        out = self.rng.random(shape or self.positions.shape, dtype=DTYPE)
+        out *= high - low
+        out += low
+        return out
+
+    def reset(self):
+        rng = self.rng
+        shape = (self.num_horses, self.n_races)
+        self.positions = np.full(shape, START_X, dtype=DTYPE)
+
+        self.stamina = self._uniform(50, 100)
+        self.burst = self._uniform(3, 6)
+        self.strategy = rng.integers(0, len(STRATEGIES), shape, dtype=np.int8)
+        self.sprint_times = self._uniform(22, 25)
+        self.advantaged = rng.integers(0, len(STRATEGIES), self.n_races, dtype=np.int8)
+
+        # --- デッドヒート範囲を戦術別に設定 ---
+        balance = self.balance
+        deadheat = strategy_table(balance["deadheat"])     # (戦術, [下限, 上限])
+        self.deadheat_lo = deadheat[self.strategy, 0].astype(DTYPE)
+        self.deadheat_hi = deadheat[self.strategy, 1].astype(DTYPE)
+        self.deadheat_targets = self.deadheat_lo + (self.deadheat_hi - self.deadheat_lo) * self._uniform(0, 1)
+
+        # --- 有利戦術による補正 ---
+        adv = self.strategy == self.advantaged
+        bonus = self._uniform(*balance["advantaged_burst"])
+        bonus *= np.where(self.advantaged == YON, self._uniform(*balance["yon_advantaged_bonus"]), DTYPE(1))
+        other = strategy_table(balance["other_burst"], DTYPE)[self.strategy]   # (頭数, N, [下限, 上限])
+        lo = other[..., 0]
+        self.burst *= np.where(adv, bonus, lo + (other[..., 1] - lo) * self._uniform(0, 1))
+        self._prepare()
+
+    def load_engine(self, engine):
+        # reset() 直後の RaceEngine の状態を N レース分に複製（乱数の続きだけが違う）
+        def column(values, dtype=DTYPE):
+            return np.repeat(np.asarray(values, dtype=dtype)[:, None], self.n_races, axis=1)
+
+        self.num_horses = engine.num_horses
+        self.positions = column([pos[0] for pos in engine.positions])
+        self.stamina = column([stat["stamina"] for stat in engine.stats_list])
+        self.burst = column([stat["burst"] for stat in engine.stats_list])
+        self.strategy = column([STRATEGIES.index(stat["strategy"]) for stat in engine.stats_list], np.int8)
+        self.sprint_times = column(engine.sprint_times)
+        self.advantaged = np.full(self.n_races, STRATEGIES.index(engine.advantaged_type), dtype=np.int8)
+        self.deadheat_lo = column([lo for lo, hi in engine.deadheat_ranges])
+        self.deadheat_hi = column([hi for lo, hi in engine.deadheat_ranges])
+        self.deadheat_targets = column(engine.deadheat_targets)
+        self._prepare()
+
+    def _prepare(self):
+        shape = self.positions.shape
+        self.burst5 = self.burst / 5
+
+        # 壱型・弐型は前半型、参型・肆型は後半型
+        self.fast = (self.strategy == ICHI) | (self.strategy == NI)
+        self.stamina_cost = strategy_table(self.balance["stamina_cost"], DTYPE)[self.strategy]
+        self.stamina_base = np.where(self.fast, DTYPE(0.8), DTYPE(0.6))
+        self.stamina_gain = np.where(self.fast, DTYPE(0.4 / 100), DTYPE(0.6 / 100))
+
+        self.finish_tick = np.full(shape, NOT_FINISHED, dtype=np.int32)
+        self.tick_count = 0
+
+        # 時計はオープニング～カウントダウン後から（全レース共通）。
+        # RaceEngine.skip_to_start と同じく1フレームずつ足して浮動小数の誤差まで揃える
+        clock = 0.0
+        for _ in range(opening_frames(self.num_horses) + self.wait_ticks):
+            clock += TICK_DT
+        self.start_time = clock
+        for _ in range(COUNTDOWN_FRAMES):
+            clock += TICK_DT
+        self.clock = clock
+        self.last_deadheat_update = 0.0
+
+        # スプリント開始ティック：最初にスプリント時刻を迎えた馬より後ろの番号は
+        # そのティックから、前の番号は次のティックから（RaceEngine.step と同じ順序）
+        first_elapsed = self.clock - self.start_time
+        sprint_tick = np.ceil((self.sprint_times - first_elapsed) / TICK_DT).astype(np.int32)
+        np.maximum(sprint_tick, 0, out=sprint_tick)
+        cummin = np.minimum.accumulate(sprint_tick, axis=0)
+        self.sprint_tick = np.minimum(cummin, cummin[-1] + 1)
+        self.deadheat_until = int(self.sprint_tick.max())
+        self.sprint_from = int(self.sprint_tick.min())
+
+    def _front_close(self):
+        # すぐ前の馬が15px以内か（同位置は番号の小さい方が前）
+        x = self.positions
+        if self.num_horses > PAIRWISE_MAX_HORSES:
+            # 多頭数は並べ替えて隣との差を見る
+            order = np.argsort(-x, axis=0, kind="stable")
+            xs = np.take_along_axis(x, order, axis=0)
+            gap = np.full(x.shape, np.inf, dtype=DTYPE)
+            gap[1:] = xs[:-1] - xs[1:]
+            close = np.empty(x.shape, dtype=bool)
+            np.put_along_axis(close, order, gap < 15, axis=0)
+            return close
+        close = np.zeros(x.shape, dtype=bool)
+        for i in range(self.num_horses):
+            for j in range(i + 1, self.num_horses):
+                d = x[j] - x[i]
+                near = np.abs(d) < 15
+                close[i] |= near & (d > 0)
+                close[j] |= near & (d <= 0)
+        return close
+
+    def step(self):
+        t = self.tick_count
+        x = self.positions
+
+        # デッドヒート範囲の再抽選（全レースで時計は共通）
+        if t < self.deadheat_until and self.clock - self.last_deadheat_update >= DEADHEAT_UPDATE_INTERVAL:
+            reroll = t < self.sprint_tick[-1]
+            lo = self._uniform(DEADHEAT_START_X, DEADHEAT_END_X - 150)
+            hi = lo + (DEADHEAT_END_X - lo - 150) * self._uniform(0, 1) + 150
+            self.deadheat_lo = np.where(reroll, lo, self.deadheat_lo)
+            self.deadheat_hi = np.where(reroll, hi, self.deadheat_hi)
+            self.deadheat_targets = np.where(reroll, lo + (hi - lo) * self._uniform(0, 1), self.deadheat_targets)
+            self.last_deadheat_update = self.clock
+
+        if t < self.deadheat_until:
+            # ----- デッドヒート移動 -----
+            delta = self._uniform(2.5, 4.0)
+            delta *= self.burst5
+            delta *= np.where(self._front_close(), DTYPE(0.3), DTYPE(1.0))
+            target = self.deadheat_targets
+            diff = target - x
+            reached = np.abs(diff) <= delta
+            np.minimum(diff, delta, out=diff)
+            np.negative(delta, out=delta)
+            np.maximum(diff, delta, out=diff)
+            if t >= self.sprint_from:
+                # 切り替わりの数ティックだけスプリント中の馬を除外
+                dh = t < self.sprint_tick
+                diff *= dh
+                reached &= dh
+            x += diff
+            np.copyto(x, target, where=reached)
+            idx = np.flatnonzero(reached)
+            if len(idx):
+                lo = self.deadheat_lo.ravel()[idx]
+                target.ravel()[idx] = lo + (self.deadheat_hi.ravel()[idx] - lo) * self.rng.random(len(idx), dtype=DTYPE)
+
+        if t >= self.sprint_from:
+            # ----- スプリント（戦術＋スタミナ補正） -----
+            sprinting = t >= self.sprint_tick
+            delta = self._uniform(5, 10)
+            delta *= self.burst5
+            delta *= self.stamina_base + self.stamina_gain * self.stamina
+            # 後半型は序盤控えめ・終盤加速
+            late = np.where(x < GOAL_X - 200, DTYPE(0.6), DTYPE(1.8))
+            np.multiply(delta, late, out=delta, where=~self.fast)
+
+            np.subtract(self.stamina, self.stamina_cost, out=self.stamina, where=sprinting)
+            # スタミナが少ないと減速
+            np.multiply(delta, DTYPE(0.5), out=delta, where=self.stamina < 10)
+            np.add(x, delta, out=x, where=sprinting)
+
+            crossed = (x >= GOAL_X) & (self.finish_tick == NOT_FINISHED)
+            self.finish_tick[crossed] = t
+
+        self.tick_count += 1
+        self.clock += TICK_DT
+
+    @property
+    def all_finished(self):
+        return self.tick_count > self.sprint_from and bool((self.finish_tick != NOT_FINISHED).all())
+
+    def finish_order(self):
+        # 同じティックでゴールした馬は番号順（results.append の順）
+        return np.argsort(self.finish_tick.T, axis=1, kind="stable").astype(np.int32)
+
+    def run(self, max_ticks=100000):
+        while not self.all_finished and self.tick_count < max_ticks:
+            self.step()
+        return self.finish_order()
+
+
+def simulate_batch(n_races, num_horses=5, seed=None, wait_ticks=0, chunk_size=8192, return_batches=False,
+                   balance=None, max_ticks=100000):
+    # メモリを抑えるため chunk_size ごとに回して (N, 頭数) の着順配列を返す
+    seeds = np.random.SeedSequence(seed).spawn((n_races + chunk_size - 1) // chunk_size)
+    orders = np.empty((n_races, num_horses), dtype=np.int32)
+    batches = []
+    for k, child in enumerate(seeds):
+        lo = k * chunk_size
+        hi = min(lo + chunk_size, n_races)
+        batch = RaceBatch(hi - lo, num_horses, seed=child, wait_ticks=wait_ticks, balance=balance)
+        orders[lo:hi] = batch.run(max_ticks)
+        if return_batches:
+            batches.append(batch)
+    if return_batches:
+        return orders, batches
+    return orders
+
+
+def strategy_win_rates(orders, strategy):
+    # 1着馬の戦術ごとの勝率（strategy は (N, 頭数)）
+    winners = orders[:, 0]
+    win_strategy = strategy[np.arange(len(orders)), winners]
+    counts = np.bincount(win_strategy, minlength=len(STRATEGIES))
+    return {STRATEGIES[k]: counts[k] / len(orders) for k in range(len(STRATEGIES))}
+
+
+def engine_win_rates(n_races, num_horses=5, seed=0):
+    # 比較用：RaceEngine を1レースずつ回した勝率
+    engine = RaceEngine(num_horses=num_horses)
+    counts = dict.fromkeys(STRATEGIES, 0)
+    for k in range(n_races):
+        engine.reset(seed * 1000003 + k)
+        winner = engine.run_to_finish()[0]
+        counts[engine.stats_list[winner]["strategy"]] += 1
+    return {s: c / n_races for s, c in counts.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="NumPy 一括レースシミュレーション")
+    parser.add_argument("-n", "--races", type=int, default=100000)
+    parser.add_argument("--horses", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk", type=int, default=8192)
+    parser.add_argument("--compare", type=int, default=0, help="RaceEngine で回す比較レース数")
+    args = parser.parse_args()
+    load_balance()
+
+    t0 = time.perf_counter()
+    orders, batches = simulate_batch(args.races, args.horses, args.seed, chunk_size=args.chunk, return_batches=True)
+    dt = time.perf_counter() - t0
+    strategy = np.concatenate([b.strategy.T for b in batches])
+    print(f"{args.races} races in {dt:.2f}s ({args.races / dt:,.0f} races/s)")
+    for name, rate in strategy_win_rates(orders, strategy).items():
+        print(f"  {name}: {rate:.4f}")
+
+    if args.compare:
+        t0 = time.perf_counter()
+        rates = engine_win_rates(args.compare, args.horses, args.seed)
+        dt = time.perf_counter() - t0
+        print(f"RaceEngine {args.compare} races in {dt:.2f}s")
+        for name, rate in rates.items():
+            print(f"  {name}: {rate:.4f}")
@@ -0,0 +1,45 @@
+# 頭数ごとの1ティックあたりのコスト（RaceEngine.step）
+#   python benchmarks/bench_field_size.py
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from race_engine import RaceEngine  # noqa: E402
+
+FIELD_SIZES = [5, 10, 20, 50, 100, 200]
+RACES = 3
+
+
+def legacy_step_order(engine):
+    # 旧実装：馬ごとに sorted() + index()（比較用に順位計算だけ再現）
+    positions = engine.positions
+    n = engine.num_horses
+    for i in range(n):
+        current_order = sorted(range(n), key=lambda x: positions[x][0], reverse=True)
+        current_order.index(i)
+
+
+def bench(n, legacy=False):
+    ticks = 0
+    spent = 0.0
+    for seed in range(RACES):
+        engine = RaceEngine(num_horses=n, seed=seed)
+        engine.skip_opening()
+        while not engine.all_finished:
+            t0 = time.perf_counter()
+            if legacy and engine.deadheat_active:
+                legacy_step_order(engine)
+            engine.step()
+            spent += time.perf_counter() - t0
+            ticks += 1
+    return spent / ticks * 1e6
+
+
+if __name__ == "__main__":
+    print(f"{'horses':>6} {'us/tick':>10} {'us/horse':>9} {'legacy us/tick':>15}")
+    for n in FIELD_SIZES:
+        us = bench(n)
+        legacy = bench(n, legacy=True) if n <= 50 else float("nan")
+        print(f"{n:>6} {us:>10.1f} {us / n:>9.2f} {legacy:>15.1f}")
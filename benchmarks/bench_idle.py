@@ -0,0 +1,78 @@
+# 待機画面（Sキー待ち）で放置している間の CPU 使用率と画面転送の回数
+#   python benchmarks/bench_idle.py [--seconds 10] [--horses 5]
+# 画面なしの SDL で game を別プロセスとして実時間で動かし、入場・紹介が終わって待機画面に入ってから
+# seconds 秒間の CPU 時間（このプロセスのみ）と flip の回数を数える。
+# CACTUS_IDLE_WAIT=0（毎フレーム転送）と 1（変化があるときだけ描いて入力を待つ）を比べる。
+# 消費電力はここでは測れないので CPU 時間を目安にする（GPU 側の転送は flip の回数に比例する）
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, ROOT)
+
+from race_engine import opening_frames  # noqa: E402
+
+SETTLE_TICKS = 30   # 待機画面に入ってから測り始めるまで
+
+
+def child(seconds):
+    # game を読み込んで走らせ、待機画面に入ったら測って結果を1行の JSON で出す
+    import pygame
+    import game
+
+    flips = [0]
+    flip = pygame.display.flip
+
+    def counting_flip():
+        flips[0] += 1
+        flip()
+
+    pygame.display.flip = counting_flip
+
+    def measure():
+        while game.engine.frames < opening_frames(game.num_cactus) + SETTLE_TICKS:
+            time.sleep(0.1)
+        cpu0, wall0, flips0 = time.process_time(), time.perf_counter(), flips[0]
+        time.sleep(seconds)
+        cpu, wall = time.process_time() - cpu0, time.perf_counter() - wall0
+        print(json.dumps({"cpu": cpu / wall, "flips": (flips[0] - flips0) / wall}), flush=True)
+        pygame.event.post(pygame.event.Event(pygame.QUIT))
+
+    threading.Thread(target=measure, daemon=True).start()
+    try:
+        game.asyncio.run(game.main())
+    except SystemExit:
+        pass
+
+
+def run(idle_wait, seconds, horses):
+    env = dict(os.environ, SDL_VIDEODRIVER="dummy", SDL_AUDIODRIVER="dummy", CACTUS_HISTORY_DB="",
+               CACTUS_RACE_STATS="", CACTUS_FIELD_SIZE=str(horses), CACTUS_IDLE_WAIT=idle_wait)
+    out = subprocess.run([sys.executable, __file__, "--child", "--seconds", str(seconds)],
+                         env=env, cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main(args):
+    print(f"{args.horses} horses, {args.seconds:g} s on the waiting screen")
+    print("CACTUS_IDLE_WAIT   CPU   flips/s")
+    for idle_wait in ("0", "1"):
+        r = run(idle_wait, args.seconds, args.horses)
+        print(f"{idle_wait:>16}  {r['cpu']:5.1%}  {r['flips']:8.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="待機画面で放置している間の CPU 使用率")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--horses", type=int, default=5)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.seconds)
+    else:
+        main(args)
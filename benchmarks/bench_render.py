@@ -0,0 +1,69 @@
+# 描画1フレームの時間：全面描き直し vs 差分矩形、描画解像度の段ごと（SDL ダミードライバで計測）
+#   python benchmarks/bench_render.py
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("CACTUS_RENDER_SCALE", "1")   # 段は下で切り替える（自動調整はしない）
+
+import game  # noqa: E402
+from render import RENDER_SCALES  # noqa: E402
+from replay import RaceRecorder, ReplayPlayer  # noqa: E402
+
+FRAMES = 300
+
+
+def timed_frames(dirty, frames=FRAMES, advance=None):
+    times = []
+    for _ in range(frames):
+        if advance:
+            advance()
+        t0 = time.perf_counter()
+        game.draw_frame(dirty=dirty)
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times) * 1000, max(times) * 1000
+
+
+def run_race():
+    game.reset_race()
+    game.engine.skip_opening()
+    recorder = RaceRecorder(game.num_cactus)
+    while not game.engine.all_finished:
+        game.engine.step()
+        recorder.record([pos[0] for pos in game.positions])
+    game.track.finished = True
+    game.track.replay_mode = False
+    game.track.result_display_index = min(len(game.results), game.RESULT_ROWS)
+    return recorder
+
+
+def report(label, full, dirty):
+    print(f"{label:<16} full {full[0]:7.3f} ms (max {full[1]:6.3f})   "
+          f"dirty {dirty[0]:7.3f} ms (max {dirty[1]:6.3f})   x{full[0] / dirty[0]:.1f}")
+
+
+def replay(recorder, dirty):
+    game.track.replay_mode = True
+    game.track.replay_player = ReplayPlayer(recorder, speed=1.0)
+    return timed_frames(dirty, advance=game.track.replay_player.update)
+
+
+if __name__ == "__main__":
+    for scale in reversed(RENDER_SCALES):
+        game.set_render_scale(scale)
+        print(f"render scale {scale:g}")
+        # レース中（背景スクロール）はどちらのモードでも全面描画
+        game.reset_race()
+        game.engine.skip_opening()
+        race = timed_frames(False, advance=game.update_race)
+        print(f"{'race (scroll)':<16} full {race[0]:7.3f} ms (max {race[1]:6.3f})")
+
+        recorder = run_race()
+        report("result screen", timed_frames(False), timed_frames(True))
+        report("full replay", replay(recorder, False), replay(recorder, True))
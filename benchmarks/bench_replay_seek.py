@@ -0,0 +1,40 @@
+# 全レース記録（RaceRecorder）のランダムシーク時間
+#   python benchmarks/bench_replay_seek.py
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from race_engine import RaceEngine, TICK_DT  # noqa: E402
+from replay import RaceRecorder, ReplayPlayer  # noqa: E402
+
+FIELD_SIZES = [5, 50, 200]
+SEEKS = 500
+
+
+def record_race(n):
+    engine = RaceEngine(num_horses=n, seed=1)
+    engine.skip_opening()
+    recorder = RaceRecorder(n)
+    while not engine.all_finished:
+        engine.step()
+        recorder.record([pos[0] for pos in engine.positions])
+    return recorder
+
+
+if __name__ == "__main__":
+    print(f"{'horses':>6} {'ticks':>6} {'bytes':>9} {'mean ms':>8} {'max ms':>7}  (budget {TICK_DT * 1000:.1f} ms)")
+    rng = random.Random(0)
+    for n in FIELD_SIZES:
+        recorder = record_race(n)
+        player = ReplayPlayer(recorder)
+        times = []
+        for _ in range(SEEKS):
+            t0 = time.perf_counter()
+            player.seek(rng.uniform(0, len(recorder) - 1))
+            player.frame()
+            times.append(time.perf_counter() - t0)
+        print(f"{n:>6} {len(recorder):>6} {recorder.nbytes:>9} "
+              f"{sum(times) / len(times) * 1000:>8.3f} {max(times) * 1000:>7.3f}")
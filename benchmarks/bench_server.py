@@ -0,0 +1,116 @@
+# server.py の負荷試験：1プロセス（1コア）で何コースを 60 ティック/秒のまま回せるか
+#   python benchmarks/bench_server.py [--tracks 10 50 100 200 400] [--horses 5] [--viewers 1] [--seconds 5]
+# コースは入場～待機を飛ばしてすぐ走らせる（走っている間がいちばん重い）。
+# 観戦者は別プロセスから各コースに --viewers 人ずつ WebSocket で繋ぎ、受信したフレーム数とバイト数を数える
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, ROOT)
+
+import server  # noqa: E402
+from race_engine import TICK_RATE  # noqa: E402
+
+TRACK_COUNTS = [10, 50, 100, 200, 400]
+SEED = 1234
+SUSTAINED_RATE = TICK_RATE * 0.99   # これ以上のティック/秒かつ取りこぼし無しなら「回せている」
+
+
+async def run_viewers(port, tracks, per_track, seconds):
+    # 子プロセス側：全員繋いだら ready を出し、seconds 秒の受信量を数えて JSON で返す
+    conns = [await server.open_viewer("127.0.0.1", port, t) for t in range(tracks) for _ in range(per_track)]
+    counts = {"frames": 0, "bytes": 0}
+
+    async def drain(reader):
+        while True:
+            _, payload = await server.read_ws_frame(reader)
+            counts["frames"] += 1
+            counts["bytes"] += len(payload)
+
+    tasks = [asyncio.ensure_future(drain(reader)) for reader, _ in conns]
+    print("ready", flush=True)
+    await asyncio.sleep(0.5)    # 計測窓の開始を親とそろえる
+    counts["frames"] = counts["bytes"] = 0
+    await asyncio.sleep(seconds)
+    print(json.dumps(counts), flush=True)
+    for task in tasks:
+        task.cancel()
+    for _, writer in conns:
+        writer.close()
+
+
+async def measure(tracks, horses, viewers, seconds):
+    srv = server.RaceServer(tracks, horses, seed=SEED, opening=False)
+    port = await srv.serve(port=0)
+    runner = asyncio.ensure_future(srv.run())
+    proc = None
+    if viewers:
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.abspath(__file__), "--viewer-port", str(port),
+            "--tracks", str(tracks), "--viewers", str(viewers), "--seconds", str(seconds),
+            stdout=asyncio.subprocess.PIPE)
+        await proc.stdout.readline()
+    await asyncio.sleep(0.5)
+
+    sched = srv.scheduler
+    ticks0, dropped0 = sched.ticks, sched.dropped
+    wall0, cpu0 = time.perf_counter(), time.process_time()
+    await asyncio.sleep(seconds)
+    wall = time.perf_counter() - wall0
+    cpu = time.process_time() - cpu0
+    ticks, dropped = sched.ticks - ticks0, sched.dropped - dropped0
+
+    received = None
+    if proc is not None:
+        received = json.loads((await proc.stdout.readline()).decode())
+        await proc.wait()
+    runner.cancel()
+    await srv.close()
+    return {
+        "tracks": tracks,
+        "ticks_per_sec": ticks / wall,
+        "dropped": dropped,
+        "cpu": cpu / wall,                          # サーバープロセスの CPU 使用率（1.0 = 1コア）
+        "tick_ms": cpu / max(ticks, 1) * 1000,      # 全コース1ティック分の CPU 時間
+        "skipped": sum(host.skipped for host in srv.hosts),
+        "received": received,
+    }
+
+
+async def main(args):
+    best = None
+    for tracks in args.tracks:
+        r = await measure(tracks, args.horses, args.viewers, args.seconds)
+        ok = r["ticks_per_sec"] >= SUSTAINED_RATE and r["dropped"] == 0
+        line = (f"{tracks:>5} tracks  {r['ticks_per_sec']:6.2f} ticks/s  dropped {r['dropped']:>5}  "
+                f"cpu {r['cpu']:5.2f}  tick {r['tick_ms']:6.3f} ms")
+        if r["received"] is not None:
+            rx = r["received"]
+            line += f"  rx {rx['frames'] / args.seconds:8.0f} frames/s {rx['bytes'] / args.seconds / 1024:8.1f} KiB/s"
+        print(line + ("" if ok else "  (not sustained)"))
+        if ok:
+            best = r
+    if best is not None:
+        # 1ティックの CPU 時間から、このコースで1コアを使い切るまでの見積もり
+        capacity = best["tracks"] / (best["tick_ms"] / (1000 / TICK_RATE))
+        print(f"sustained {best['tracks']} tracks x {args.horses} horses at {TICK_RATE} ticks/s "
+              f"(~{capacity:.0f} tracks per core by tick cost)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="server.py の負荷試験")
+    parser.add_argument("--tracks", type=int, nargs="+", default=TRACK_COUNTS)
+    parser.add_argument("--horses", type=int, default=5)
+    parser.add_argument("--viewers", type=int, default=1, help="コースごとの観戦者数（0 で送信なし）")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--viewer-port", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.viewer_port is not None:
+        asyncio.run(run_viewers(args.viewer_port, args.tracks[0], args.viewers, args.seconds))
+    else:
+        asyncio.run(main(args))
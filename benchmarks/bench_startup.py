@@ -0,0 +1,49 @@
+# 起動からタイトル画面の最初のフレームが出るまでの時間（TTFF）
+#   python benchmarks/bench_startup.py
+# ディスクキャッシュ空（初回起動）と作成済み（2回目以降）を別プロセスで測る
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+RUNS = 5
+
+# 子プロセス：最初の flip / update で経過時間を出して終了する
+CHILD = """
+import os, sys, time
+t0 = float(sys.argv[1])
+import pygame
+def first_frame(*args):
+    print(time.time() - t0, flush=True)
+    os._exit(0)
+pygame.display.flip = first_frame
+pygame.display.update = first_frame
+sys.argv = ["main.py"]
+import runpy
+runpy.run_path("main.py", run_name="__main__")
+"""
+
+
+def ttff(cache_dir):
+    env = dict(os.environ, SDL_VIDEODRIVER="dummy", SDL_AUDIODRIVER="dummy",
+               PYGAME_HIDE_SUPPORT_PROMPT="1", CACTUS_ASSET_CACHE=cache_dir)
+    out = subprocess.run([sys.executable, "-c", CHILD, repr(time.time())],
+                         cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1]) * 1000
+
+
+if __name__ == "__main__":
+    cold, warm = [], []
+    for _ in range(RUNS):
+        cache_dir = tempfile.mkdtemp()
+        try:
+            cold.append(ttff(cache_dir))
+            warm.append(ttff(cache_dir))
+        finally:
+            shutil.rmtree(cache_dir)
+    print(f"time to first frame, cold cache: {statistics.median(cold):7.1f} ms (median of {RUNS})")
+    print(f"time to first frame, warm cache: {statistics.median(warm):7.1f} ms (median of {RUNS})")
@@ -0,0 +1,197 @@
+# game.py の各処理をまとめて計測し、JSON に保存する（SDL ダミードライバ・固定シード・疑似時計）
+#   python benchmarks/bench_suite.py [--sizes 5 50 200] [--out bench.json] [--compare old.json]
+# 頭数は game の import 時に決まるので、頭数ごとに子プロセスで測る
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+FIELD_SIZES = [5, 50, 200]
+SEED = 1234
+RENDER_FRAMES = 200
+REBUILDS = 200
+RESETS = 20
+RACES = 10
+REGRESSION_THRESHOLD = 1.2   # --compare でこれ以上遅くなった項目を報告する
+
+# 値の向き（大きいほど良いもの）。それ以外は時間なので小さいほど良い
+HIGHER_IS_BETTER = {"race_ticks_per_sec"}
+
+
+def median_ms(times):
+    return statistics.median(times) * 1000
+
+
+def run_child(n):
+    t0 = time.perf_counter()
+    import pygame
+    import game
+    import_ms = (time.perf_counter() - t0) * 1000
+
+    import asyncio
+    import random
+
+    game.odds = None   # 裏のオッズ計算は計測の邪魔なので止める
+    fake_now = [0.0]
+    game.scheduler.clock = lambda: fake_now[0]
+    game.scheduler.last = 0.0
+
+    def reset(seed=SEED):
+        random.seed(seed)
+        game.reset_race()
+        game.track.replay_mode = False
+
+    # reset_race() の待ち時間
+    times = []
+    for k in range(RESETS):
+        random.seed(SEED + k)
+        t = time.perf_counter()
+        game.reset_race()
+        times.append(time.perf_counter() - t)
+    reset_ms = median_ms(times)
+
+    # オープニング（入場・紹介・待機・カウントダウン）1描画あたり。待機画面は 60 描画で S を押す
+    reset()
+    renders = [0]
+    orig_sleep = asyncio.sleep
+
+    async def fake_sleep(delay):
+        fake_now[0] += delay
+        renders[0] += 1
+        if renders[0] == game.INTRO_FRAMES + game.slide_count(n) * game.SLIDE_FRAMES + 60:
+            pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_s))
+        await orig_sleep(0)
+
+    asyncio.sleep = fake_sleep
+    t = time.perf_counter()
+    asyncio.run(game.opening_sequence())
+    opening_ms = (time.perf_counter() - t) * 1000 / renders[0]
+    asyncio.sleep = orig_sleep
+
+    # レース進行（描画なし）のティック/秒
+    ticks = 0
+    spent = 0.0
+    for k in range(RACES):
+        reset(SEED + k)
+        game.engine.skip_opening()   # start() とカウントダウンまで済ませる
+        t = time.perf_counter()
+        while not game.engine.all_finished:
+            game.update_race()
+            ticks += 1
+        spent += time.perf_counter() - t
+    race_ticks_per_sec = ticks / spent
+
+    # レース中の全面描画
+    reset()
+    game.engine.skip_opening()
+    times = []
+    for _ in range(RENDER_FRAMES):
+        game.update_race()
+        t = time.perf_counter()
+        game.draw_frame(dirty=False)
+        times.append(time.perf_counter() - t)
+    frame_ms = median_ms(times)
+
+    # 順位表の作り直し（テキストはキャッシュ済みの状態で、並べ直しと blit のみ）
+    times = []
+    for _ in range(REBUILDS):
+        game.last_display_order = []
+        t = time.perf_counter()
+        game.draw_overlays(game.canvas)
+        times.append(time.perf_counter() - t)
+    rank_rebuild_ms = median_ms(times)
+
+    # ゴール後のスローリプレイ再生
+    while not game.track.replay_mode:
+        game.update_race()
+    times = []
+    while game.track.replay_mode and not game.track.replay_player.done:
+        game.update_race()
+        t = time.perf_counter()
+        game.draw_frame()
+        times.append(time.perf_counter() - t)
+    replay_frame_ms = median_ms(times)
+
+    return {
+        "import_ms": import_ms,
+        "reset_race_ms": reset_ms,
+        "opening_frame_ms": opening_ms,
+        "race_ticks_per_sec": race_ticks_per_sec,
+        "race_frame_ms": frame_ms,
+        "rank_rebuild_ms": rank_rebuild_ms,
+        "replay_frame_ms": replay_frame_ms,
+    }
+
+
+def run_size(n):
+    env = dict(os.environ, SDL_VIDEODRIVER="dummy", SDL_AUDIODRIVER="dummy",
+               PYGAME_HIDE_SUPPORT_PROMPT="1", CACTUS_FIELD_SIZE=str(n), CACTUS_HISTORY_DB="", CACTUS_RACE_STATS="",
+               CACTUS_RENDER_SCALE="1",   # 描画時間で段が変わると前回の JSON と比べられない
+               CACTUS_IDLE_WAIT="0")      # 待機画面の入力待ちは実時間でブロックし、差し替えた時計を素通りする
+    env.pop("CACTUS_PROFILE", None)
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", str(n)],
+                         cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old, new):
+    # 同じ頭数・同じ項目どうしの比（>1 が悪化）
+    regressions = []
+    for n, metrics in new["results"].items():
+        for name, value in metrics.items():
+            before = old.get("results", {}).get(n, {}).get(name)
+            if not before or not value:
+                continue
+            ratio = before / value if name in HIGHER_IS_BETTER else value / before
+            print(f"{n:>4} {name:<20} {before:12.3f} -> {value:12.3f}  x{ratio:.2f}")
+            if ratio >= REGRESSION_THRESHOLD:
+                regressions.append((n, name, ratio))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="game.py のベンチマーク")
+    parser.add_argument("--sizes", type=int, nargs="+", default=FIELD_SIZES)
+    parser.add_argument("--out", default=None)
+    parser.add_argument("--compare", default=None)
+    parser.add_argument("--child", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        sys.path.insert(0, ROOT)
+        os.chdir(ROOT)
+        print(json.dumps(run_child(args.child)))
+        sys.exit(0)
+
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": SEED,
+        "results": {},
+    }
+    for n in args.sizes:
+        metrics = report["results"][str(n)] = run_size(n)
+        print(f"{n:>4} horses: " + "  ".join(f"{k}={v:.3f}" for k, v in metrics.items()))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report)
+        for n, name, ratio in regressions:
+            print(f"REGRESSION {n} horses {name} x{ratio:.2f}")
+        sys.exit(1 if regressions else 0)
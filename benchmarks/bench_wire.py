@@ -0,0 +1,65 @@
+# 観戦ストリーム（wire.py）の大きさとデコード速度
+#   python benchmarks/bench_wire.py [--horses 5 50 200] [--races 3]
+# server.TrackHost を入場から結果表示まで回し、ティックごとの差分の大きさを数える。
+# 比較は以前の毎ティック全状態フレーム（ヘッダー 10 バイト＋頭数 × (x 2 バイト＋順位 1 バイト)）
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, ROOT)
+
+from race_engine import TICK_RATE  # noqa: E402
+from server import TrackHost  # noqa: E402
+from wire import RACING, REPLAY, StateDecoder  # noqa: E402
+
+FIELD_SIZES = [5, 50, 200]
+SEED = 1234
+
+
+def encode_races(horses, races):
+    # races 本分のメッセージ（先頭はキーフレーム）と、各差分を作ったときのフェーズを返す
+    host = TrackHost(0, horses, seed=SEED)
+    messages, phases = [], []
+    for _ in range(races):
+        race = host.race
+        host.sync()
+        messages.append(host.encoder.keyframe())
+        phases.append(None)
+        while True:
+            host.tick()
+            if host.race != race:
+                break
+            messages.append(host.encoder.update(*host.state()))
+            phases.append(host.phase)
+    return messages, phases
+
+
+def main(args):
+    print("horses  keyframe  racing B/horse  all B/horse  full B/tick  ratio  decode msgs/s  streams@60")
+    for horses in args.horses:
+        messages, phases = encode_races(horses, args.races)
+        racing = [len(m) for m, ph in zip(messages, phases) if ph is not None and RACING <= ph <= REPLAY]
+        deltas = [len(m) for m, ph in zip(messages, phases) if ph is not None]
+        keyframe = max(len(m) for m, ph in zip(messages, phases) if ph is None)
+        full = 10 + 3 * horses
+        mean = sum(deltas) / len(deltas)
+
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            decoder = StateDecoder()
+            for m in messages:
+                decoder.feed(m)
+        rate = len(messages) * args.repeat / (time.perf_counter() - t0)
+        print(f"{horses:>6}  {keyframe:>8}  {sum(racing) / len(racing) / horses:>14.2f}  {mean / horses:>11.2f}"
+              f"  {full:>11}  {full / mean:>5.1f}  {rate:>13.0f}  {rate / TICK_RATE:>10.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="観戦ストリームの大きさとデコード速度")
+    parser.add_argument("--horses", type=int, nargs="+", default=FIELD_SIZES)
+    parser.add_argument("--races", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=3, help="デコード計測の繰り返し回数")
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,155 @@
+import argparse
+import os
+import struct
+import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import racefile
+from race_engine import BALANCE, TICK_RATE, WIDTH, HEIGHT, load_balance, opening_frames, set_balance
+from track import RaceTrack, RESULT_ROWS, RESULT_ROW_TICKS
+
+# 記録したレース（.race）やシードから、ゲーム画面と同じ描画（game.draw_frame）で
+# スタートから結果表示までの全フレームを画面なしで書き出す。フレームの範囲ごとに
+# プロセスプールへ分け、各ワーカーはスタートから自分の範囲の手前までを描かずに進めてから描く。
+#   python export_video.py out_dir --race races.race [--index 0]   # PNG 連番（frame_00000.png ～）
+#   python export_video.py out.rgb --seed 42 --format raw           # RGB24 を並べただけの1ファイル
+#   ffmpeg -framerate 60 -i out_dir/frame_%05d.png -pix_fmt yuv420p race.mp4
+#   ffmpeg -f rawvideo -pix_fmt rgb24 -s 1200x600 -framerate 60 -i out.rgb -pix_fmt yuv420p race.mp4
+HOLD_TICKS = 120          # 結果を出し切ってから最後のフレームまで
+FRAME_BYTES = WIDTH * HEIGHT * 3
+CHUNKS_PER_WORKER = 4     # 範囲を細かめに切って、描画の重いところ（リプレイ等）の偏りをならす
+PNG_LEVEL = 1             # pygame.image.save の PNG は圧縮が強すぎて1枚 0.5 秒かかるので自前で軽く圧縮する
+
+game = None               # ワーカーごとに import する game モジュール
+
+
+def race_ticks(seed, start_tick, num_horses, hold_ticks=HOLD_TICKS):
+    # スタートから結果を出し切って hold_ticks 待つまでのティック数（描画なしで数える）
+    track = RaceTrack(num_horses, seed=seed)
+    track.engine.skip_to_start(start_tick)
+    ticks = 0
+    while not track.finished:
+        track.update()
+        ticks += 1
+    return ticks + (min(num_horses, RESULT_ROWS) - 1) * RESULT_ROW_TICKS + hold_ticks
+
+
+def _png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def encode_png(rgb, width, height, level=PNG_LEVEL):
+    # RGB24 のバイト列を PNG に（行フィルタなし）
+    stride = width * 3
+    view = memoryview(rgb)
+    rows = b"".join(b"\x00" + view[y * stride:(y + 1) * stride] for y in range(height))
+    return (b"\x89PNG\r\n\x1a\n"
+            + _png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + _png_chunk(b"IDAT", zlib.compress(rows, level))
+            + _png_chunk(b"IEND", b""))
+
+
+def _init_worker(num_horses, balance):
+    # 画面なしの SDL で game を読み込む（頭数は import 時に決まる）。履歴・集計のファイルには触らない。
+    # 描画解像度は等倍に固定（書き出しは時間がかかっても全フレーム描く）。バランスは親で読んだもの
+    global game
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+    os.environ["CACTUS_RENDER_SCALE"] = "1"
+    os.environ["CACTUS_FIELD_SIZE"] = str(num_horses)
+    os.environ["CACTUS_HISTORY_DB"] = ""
+    os.environ["CACTUS_RACE_STATS"] = ""
+    import game as game_module
+    game = game_module
+    game.odds = None
+    set_balance(balance)
+
+
+def _render_range(job):
+    # job の出力フレーム [first, stop) を描いて書き出し、描いた枚数を返す
+    seed, start_tick, first, stop, step, out, fmt = job
+    import pygame
+    track = game.track
+    track.reset(seed)
+    game.engine.skip_to_start(start_tick)
+    game.horse_names[:] = game.cactus_names
+    game.refresh_race_layout()
+    game.scheduler.accumulator = game.scheduler.tick_dt   # 補間せずティックの位置をそのまま描く
+
+    for _ in range(first * step):
+        track.update()
+    f = None
+    if fmt == "raw":
+        f = open(out, "r+b")
+        f.seek(first * FRAME_BYTES)
+    try:
+        for k in range(first, stop):
+            game.draw_frame(dirty=False)
+            rgb = pygame.image.tobytes(game.screen, "RGB")
+            if f is not None:
+                f.write(rgb)
+            else:
+                with open(os.path.join(out, f"frame_{k:05d}.png"), "wb") as png:
+                    png.write(encode_png(rgb, WIDTH, HEIGHT))
+            for _ in range(step):
+                track.update()
+    finally:
+        if f is not None:
+            f.close()
+    return stop - first
+
+
+def export_race(seed, start_tick, num_horses, out, fmt="png", fps=TICK_RATE, workers=None,
+                hold_ticks=HOLD_TICKS):
+    # 書き出したフレーム数を返す。fps は TICK_RATE の約数（30 なら1ティックおき）
+    if TICK_RATE % fps:
+        raise ValueError(f"fps must divide {TICK_RATE}")
+    step = TICK_RATE // fps
+    frames = (race_ticks(seed, start_tick, num_horses, hold_ticks) + step - 1) // step
+    if fmt == "raw":
+        with open(out, "wb") as f:
+            f.truncate(frames * FRAME_BYTES)   # 各ワーカーが自分の位置に直接書く
+    else:
+        os.makedirs(out, exist_ok=True)
+
+    workers = workers or os.cpu_count() or 1
+    chunk = max(1, -(-frames // (workers * CHUNKS_PER_WORKER)))
+    jobs = [(seed, start_tick, first, min(first + chunk, frames), step, out, fmt)
+            for first in range(0, frames, chunk)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(num_horses, BALANCE)) as pool:
+        done = sum(pool.map(_render_range, jobs))
+    return done
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="レースを画面なしで動画用のフレームに書き出す")
+    parser.add_argument("out", help="PNG なら出力ディレクトリ、raw なら出力ファイル")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--race", help=".race ファイル（記録どおりに再現）")
+    source.add_argument("--seed", type=int, help="このシードで走らせ直す（待機画面なしですぐ出走）")
+    parser.add_argument("--index", type=int, default=0, help="--race の何レース目か")
+    parser.add_argument("--horses", type=int, default=5, help="--seed のときの頭数")
+    parser.add_argument("--format", choices=["png", "raw"], default="png")
+    parser.add_argument("--fps", type=int, default=TICK_RATE)
+    parser.add_argument("-j", "--workers", type=int, default=None)
+    args = parser.parse_args()
+    load_balance()
+
+    if args.race:
+        record = list(racefile.load_races(args.race))[args.index]
+        try:
+            racefile.replay_engine(record)
+        except ValueError as e:
+            sys.exit(str(e))
+        seed, start_tick, num_horses = record["seed"], record["start_tick"], len(record["stats"])
+    else:
+        seed, start_tick, num_horses = args.seed, opening_frames(args.horses), args.horses
+
+    t0 = time.perf_counter()
+    frames = export_race(seed, start_tick, num_horses, args.out, args.format, args.fps, args.workers)
+    wall = time.perf_counter() - t0
+    length = frames / args.fps
+    print(f"wrote {frames} frames ({length:.1f} s at {args.fps} fps) to {args.out} "
+          f"in {wall:.1f} s (x{length / wall:.2f} real time)")
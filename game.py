@@ -0,0 +1,856 @@
+import pygame
+import sys
+import os
+import asyncio
+import functools
+import time
+
+import racefile
+from assets import AssetManager, ASSET_DIR, BG_FILE, CACTUS_FILES, TITLE_KEYS, sprite_size
+from profiler import FrameProfiler
+from racestats import RaceStats
+from render import DirtyRenderer, ScaleController, ScaledCanvas
+from scheduler import FrameScheduler
+from textcache import TextCache
+from race_engine import (
+    WIDTH, HEIGHT, GOAL_X, GOAL_LINE_TIME, TICK_DT,
+    INTRO_FRAMES, SLIDE_FRAMES, COUNTDOWN_FRAMES, slide_count, load_balance,
+)
+from track import RaceTrack, RESULT_ROWS, field_names
+from wire import StateDecoder
+
+# 事前オッズ（NumPy＋マルチプロセス。Web版では使わない）
+try:
+    if sys.platform == "emscripten":
+        raise ImportError
+    import odds
+except ImportError:
+    odds = None
+
+# 戦術バランス（tune_balance.py が書く balance.json）。CACTUS_BALANCE=path で置き場を変える
+load_balance()
+
+# レース履歴（SQLite が使えないビルドでは直近5レースをメモリにだけ持つ）
+try:
+    from history import HistoryStore
+except ImportError:
+    HistoryStore = None
+
+# 全レースの記録。CACTUS_HISTORY_DB=path で置き場を変える（空文字で無効）
+HISTORY_DB = os.environ.get("CACTUS_HISTORY_DB", "race_history.db")
+history = HistoryStore(HISTORY_DB) if HistoryStore is not None and HISTORY_DB else None
+recent_results = history.recent_winners(5) if history is not None else []  # 待機画面用の直近5レースの1位
+
+# 勝率などの積み上げ集計。起動時にスナップショットを読み、レースが終わるたびと終了時に書き戻す
+#   CACTUS_RACE_STATS=path で置き場を変える（空文字で保存しない）
+RACE_STATS = os.environ.get("CACTUS_RACE_STATS", "race_stats.json")
+RACE_STATS_SAVE_SECONDS = 10.0   # 即決モードなどでレースが続けて終わるときは書き戻しをこの間隔に間引く
+race_stats_saved_at = float("-inf")
+try:
+    race_stats = RaceStats.load(RACE_STATS) if RACE_STATS else RaceStats()
+except ValueError:
+    race_stats = RaceStats()  # 壊れた・古い形式のスナップショットは作り直す
+horse_records = []      # 待機画面の出走馬ごとの通算成績（reset_race で作る）
+adv_record = ""         # 今回の有利戦術が有利だったときの通算成績
+
+
+pygame.init()
+
+# 順位表キャッシュ（初期化）
+rank_surfaces = []         # (Surface, (x,y)) のリスト
+last_display_order = []    # 前回の表示順（空で初期化）
+
+# 画面サイズ（race_engine と共通）
+screen = pygame.display.set_mode((WIDTH, HEIGHT))
+pygame.display.set_caption("サボテンレース")
+
+# 描画先（座標は WIDTH×HEIGHT のまま）。重い端末では小さい面に描いて拡大して出す
+# （ブラウザ版は画面ごと小さくして、CSS で引き伸ばされるキャンバスの拡大をブラウザに任せる）
+#   CACTUS_RENDER_SCALE=0.5/0.75/1 で倍率を固定、auto（既定）は描画時間を見て段を上げ下げする
+RENDER_SCALE = os.environ.get("CACTUS_RENDER_SCALE", "auto")
+scale_controller = ScaleController() if RENDER_SCALE == "auto" else None
+canvas = ScaledCanvas((WIDTH, HEIGHT), scale_controller.scale if scale_controller else float(RENDER_SCALE),
+                      display=screen, resize_display=sys.platform == "emscripten")
+
+# 画像は使う時に読み込む（assets.pack があればそこから、拡縮済みのものはディスクにも残す）
+assets = AssetManager(ASSET_DIR)
+
+# 色
+WHITE = (255, 255, 255)
+BLACK = (0, 0, 0)
+RED = (255, 0, 0)
+PANEL = (230, 230, 230)
+
+# フォント（Web向け）
+FONT_PATH = os.path.join(ASSET_DIR, "NotoSansJP-subset.ttf")
+FONT_SIZE = 60
+MID_FONT_SIZE = 40
+SMALL_FONT_SIZE = 30
+TITLE_FONT_SIZE = 22
+
+_font_cache = {}
+
+def get_font(size):
+    if size not in _font_cache:
+        _font_cache[size] = pygame.font.Font(FONT_PATH, size)
+    return _font_cache[size]
+
+# 描画済みテキストの共有キャッシュ（同じ文字列を毎フレーム描き直さない）
+text_cache = TextCache(get_font)
+
+def render_text(text, size, color=BLACK):
+    return text_cache.render(text, size, color)
+
+# サイズごとの文字送り幅（描画せずに文字列幅を測るため）
+_advance_cache = {}
+
+@functools.lru_cache(maxsize=4096)
+def text_width(text, size):
+    advances = _advance_cache.setdefault(size, {})
+    missing = [c for c in set(text) if c not in advances]
+    if missing:
+        for c, m in zip(missing, get_font(size).metrics("".join(missing))):
+            advances[c] = m[4] if m else 0
+    return sum(map(advances.__getitem__, text))
+
+def _fit_size(fits, base_size, min_size):
+    # fits(size) が真になる最大のサイズを二分探索（収まらなければ min_size）
+    if fits(base_size):
+        return base_size
+    lo, hi = min_size, base_size - 1
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if fits(mid):
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+def render_text_fit(text, max_width, base_size, min_size, color=BLACK):
+    size = _fit_size(lambda size: text_width(text, size) <= max_width, base_size, min_size)
+    return render_text(text, size, color)
+
+def get_common_font_size(strings, max_width, base_size=22, min_size=12):
+    return _fit_size(lambda size: all(text_width(s, size) <= max_width for s in strings), base_size, min_size)
+
+
+# 背景
+
+bg = assets.image(BG_FILE, (WIDTH, HEIGHT))
+
+# --- タイトル取得関数（倍率 0.50～1.00 を 0.01 刻み） ---
+def get_cached_title(scale):
+    key = min(max(int(scale * 100), TITLE_KEYS[0]), TITLE_KEYS[-1])
+    return assets.title(key)
+
+# 出走頭数（6頭以上は色・名前を自動生成する大人数レース）
+num_cactus = int(os.environ.get("CACTUS_FIELD_SIZE", len(CACTUS_FILES)))
+SPRITE_SIZE = sprite_size(num_cactus)
+
+# 馬の画像・名前・色（6頭目以降は基本5色を暗くした色違いと番号付きの名前）
+cactus_images = assets.field_sprites(num_cactus, SPRITE_SIZE)
+cactus_names, horse_colors = field_names(num_cactus)
+cactus_current_images = cactus_images  # コピーせず直接参照
+
+# 表示する行数の上限（大人数レース用）
+RANK_ROWS = 10
+LINEUP_ROWS = 8
+
+# レースの進行（背景スクロール・リプレイ・結果表示の状態は track、物理・乱数・時計は engine が持つ）
+# レース全体の記録（Fキーで全体リプレイ）。CACTUS_RECORD_RACE=1 で有効
+track = RaceTrack(num_cactus, record=os.environ.get("CACTUS_RECORD_RACE") == "1")
+engine = track.engine
+
+# 馬の位置・ステータス（engine のリストをそのまま参照）
+positions = engine.positions
+stats_list = engine.stats_list
+results = engine.results
+horse_names = []
+
+# 早送り（1～4キーで 1/2/4/16倍）と即時決着モード（Iキー：走らせずに結果画面へ）
+SPEED_KEYS = {pygame.K_1: 1, pygame.K_2: 2, pygame.K_3: 4, pygame.K_4: 16}
+instant_mode = os.environ.get("CACTUS_INSTANT") == "1"
+COMMON_KEYS = set(SPEED_KEYS) | {pygame.K_i, pygame.K_F3, pygame.K_F4}
+
+# レース記録（.race ファイル）
+#   CACTUS_RACE_ARCHIVE=path : 終わったレースを追記
+#   CACTUS_PLAY_RACE=path    : 記録されたレースを順に再現（Sキーも記録どおり）
+RACE_ARCHIVE = os.environ.get("CACTUS_RACE_ARCHIVE")
+playback_records = []
+if os.environ.get("CACTUS_PLAY_RACE"):
+    playback_records = [r for r in racefile.load_races(os.environ["CACTUS_PLAY_RACE"]) if len(r["stats"]) == num_cactus]
+playback_start_tick = None
+
+def reset_race():
+    global playback_start_tick
+
+    if playback_records:
+        record = playback_records.pop(0)
+        track.reset(record["seed"])
+        playback_start_tick = record["start_tick"]
+    else:
+        track.reset()
+        playback_start_tick = None
+    horse_names[:] = cactus_names[:]
+    refresh_race_layout()
+
+
+def refresh_race_layout():
+    # 出走馬が入れ替わるので順位表のテキストと静的層を作り直させる
+    global last_display_order, adv_record
+    last_display_order = []
+    renderer.invalidate()
+
+    # --- 順位表用フォントサイズ計算 ---
+    rank_strings = [f"{i+1}位：{horse_names[i]} ({stats_list[i]['strategy']})" for i in range(len(horse_names))]
+    rank_font_size = get_common_font_size(rank_strings, max_width=300, base_size=20, min_size=12)
+    globals()["rank_font_size"] = rank_font_size
+
+    # --- 過去データ用フォントサイズ計算 ---
+    history_strings = []
+    for row in recent_results:
+        if len(row) >= 4:
+            s = f"{row[1]}番 {row[2]}（{row[3]}）"
+            history_strings.append(s)
+    if history_strings:
+        history_font_size = get_common_font_size(history_strings, max_width=250, base_size=20, min_size=12)
+    else:
+        history_font_size = 20
+    globals()["history_font_size"] = history_font_size
+
+    # --- 通算成績（集計を引くのはレースごとに1回だけ） ---
+    horse_records[:] = []
+    for name in horse_names[:LINEUP_ROWS]:
+        s = race_stats.horse(name)
+        horse_records.append(f"出走{s['starts']}回 1着{s['wins']}回" if s["starts"] else "")
+    s = race_stats.strategy(engine.advantaged_type, engine.advantaged_type)
+    adv_record = f"出走{s['starts']}回 1着{s['wins']}回" if s["starts"] else ""
+
+
+last_adv_type = None  # 最初は None
+adv_text_surface = None
+odds_task = None          # オッズ計算中のタスク
+race_odds = None          # 計算済みオッズ（待機画面に表示）
+
+# 待機画面は中身（出走表・オッズ・通算成績・直近の結果）が変わったときだけ1枚に描き直し、
+# 変わらない間は描画も転送もせずに入力を待つ。CACTUS_IDLE_WAIT=0 で毎フレーム転送する
+IDLE_WAIT = os.environ.get("CACTUS_IDLE_WAIT", "1") == "1"
+IDLE_POLL = 0.2           # 1回に入力を待つ上限（秒）。scheduler の取り戻し上限より短くしてティックを捨てない
+IDLE_HEARTBEAT = 1.0      # 中身が変わらなくてもこの間隔で画面を送り直す
+waiting_scene = None      # 描き上げた待機画面
+waiting_scene_key = None
+
+
+def waiting_key():
+    # これが変わらない限り待機画面は描き直さない
+    odds_key = None
+    if race_odds is not None:
+        odds_key = tuple(h["odds"] for h in race_odds["horses"][:LINEUP_ROWS])
+    return (engine.advantaged_type, adv_record, tuple(horse_names[:LINEUP_ROWS]),
+            tuple(stat["strategy"] for stat in stats_list[:LINEUP_ROWS]), tuple(horse_records), odds_key,
+            tuple(tuple(row) for row in recent_results), history_font_size)
+
+
+def compose_waiting_scene(key):
+    global waiting_scene, waiting_scene_key
+    if waiting_scene is None or waiting_scene.scale != canvas.scale:
+        waiting_scene = canvas.layer()
+        waiting_scene_key = None
+    if key != waiting_scene_key:
+        draw_waiting_scene(waiting_scene)
+        waiting_scene_key = key
+    return waiting_scene
+
+
+def draw_waiting_scene(surface):
+    surface.fill(WHITE)
+    surface.blit(bg, (0, 0))
+
+    # 右上有利戦術（待機画面でも表示）
+    adv_text = render_text(f"有利戦術：{engine.advantaged_type}", SMALL_FONT_SIZE)
+    surface.blit(adv_text, (WIDTH - adv_text.get_width() - 20, 20))
+    if adv_record:
+        text = render_text(adv_record, TITLE_FONT_SIZE)
+        surface.blit(text, (WIDTH - text.get_width() - 20, 20 + adv_text.get_height()))
+
+    # 馬立ち姿
+    for idx in range(num_cactus):
+        surface.blit(cactus_images[idx], (positions[idx][0], positions[idx][1]))
+
+    # 出走馬タイトル＆一覧
+    title = render_text("今回の出走サボテン", FONT_SIZE)
+    surface.blit(title, (WIDTH//2 - title.get_width()//2, 50))
+
+    # --- 直近5レースの1位の枠（出走馬一覧の通算成績が重ならないよう先に位置を決める） ---
+    box_x = WIDTH - 300
+    box_y = HEIGHT - 230
+
+    for i in range(min(num_cactus, LINEUP_ROWS)):
+        odds_str = ""
+        if race_odds is not None and race_odds["horses"][i]["odds"] is not None:
+            odds_str = f"  {race_odds['horses'][i]['odds']:.1f}"  # 単勝オッズ（フォントは数字と . のみ）
+        text = render_text(f"{i+1}番：{horse_names[i]} ({stats_list[i]['strategy']}){odds_str}", SMALL_FONT_SIZE)
+        row_x, row_y = WIDTH//2 - 200, 150 + i*40
+        surface.blit(text, (row_x, row_y))
+        if horse_records[i]:
+            record = render_text(horse_records[i], TITLE_FONT_SIZE)
+            record_x = row_x + text.get_width() + 16
+            if row_y + 40 <= box_y or record_x + record.get_width() <= box_x - 10:
+                surface.blit(record, (record_x, row_y + 6))
+
+    box_w = 280
+    box_h = 190
+    surface.draw_rect(PANEL, (box_x, box_y, box_w, box_h))
+    surface.draw_rect(BLACK, (box_x, box_y, box_w, box_h), 2)
+
+    recent_title = render_text("直近5レースの1位", SMALL_FONT_SIZE)
+    surface.blit(recent_title, (box_x + 12, box_y + 8))
+
+    for i, row in enumerate(recent_results):
+        first_place_horse_no = row[1]
+        first_place_name = row[2]
+        first_place_strategy = row[3]
+        display_str = f"{first_place_horse_no}番 {first_place_name}（{first_place_strategy}）"
+        text = render_text(display_str, history_font_size)
+        surface.blit(text, (box_x + 12, box_y + 40 + i*28))
+
+
+async def wait_for_input(timeout):
+    # 入力が来るか timeout 秒たつまで寝て、起こしたイベントを返す（キューに戻すと後から来たものの
+    # 後ろに回って順番が崩れるので、呼び出し側で次の pygame.event.get() の前に並べる）。
+    # ブラウザ版はブロックできないので短く寝て譲る（描かないだけ）
+    if sys.platform == "emscripten":
+        await asyncio.sleep(min(timeout, 0.05))
+        return []
+    event = pygame.event.wait(int(timeout * 1000))
+    await asyncio.sleep(0)        # オッズ計算などの完了を受け取る
+    return [] if event.type == pygame.NOEVENT else [event]
+
+async def opening_sequence():
+    global cactus_current_images ,last_adv_type, odds_task, race_odds
+
+    # 紹介スライドの間に裏でオッズを計算
+    race_odds = None
+    if odds is not None:
+        odds_task = asyncio.ensure_future(odds.estimate_odds_async(engine))
+
+    # 馬入場初期位置（入場演出は描画専用の座標で動かす）
+    intro_x = [-250]*num_cactus
+    target_x = [pos[0] for pos in positions]
+
+    cactus_current_images[:] = cactus_images.copy()
+
+    frame_count = 0
+
+    # 入場アニメーション＋タイトル
+    while frame_count < INTRO_FRAMES:
+        with profiler.section("update"):
+            while frame_count < INTRO_FRAMES and scheduler.tick():
+                for idx in range(num_cactus):
+                    if intro_x[idx] < target_x[idx]:
+                        intro_x[idx] += 5
+                frame_count += 1
+                engine.idle(TICK_DT)
+        frame_count_drawn = min(frame_count, INTRO_FRAMES - 1)
+
+        with profiler.section("background"):
+            canvas.fill(WHITE)
+            canvas.blit(bg, (0, 0))
+
+        # タイトルフェード＋拡縮
+        if frame_count_drawn < 60:
+            alpha = int((frame_count_drawn/60)*255)
+            scale_factor = 0.5 + 0.5*(frame_count_drawn/60)
+        elif frame_count_drawn < 180:
+            alpha = 255
+            scale_factor = 1.0
+        else:
+            alpha = int(((240-frame_count_drawn)/60)*255)
+            scale_factor = 1.0 - 0.3*((frame_count_drawn-180)/60)
+
+        # 安全にキャッシュ取得
+        temp_image = get_cached_title(scale_factor)
+        temp_image.set_alpha(alpha)
+
+        # 描画位置を中央に計算
+        pos = (WIDTH//2 - temp_image.get_width()//2,
+                HEIGHT//2 - temp_image.get_height()//2)
+        canvas.blit(temp_image, pos)
+
+        # 馬入場
+        with profiler.section("sprites"):
+            for idx in range(num_cactus):
+                canvas.blit(cactus_current_images[idx], (intro_x[idx], positions[idx][1]))
+
+        flip_screen()
+        await scheduler.wait()
+
+    # --- 出走馬紹介スライド（2r秒×頭数） ---
+    slide_ticks = 0
+    while slide_ticks < slide_count(num_cactus) * SLIDE_FRAMES:
+        with profiler.section("update"):
+            while slide_ticks < slide_count(num_cactus) * SLIDE_FRAMES and scheduler.tick():
+                slide_ticks += 1
+                engine.idle(TICK_DT)
+        i = min(slide_ticks, slide_count(num_cactus) * SLIDE_FRAMES - 1) // SLIDE_FRAMES
+
+        with profiler.section("background"):
+            canvas.fill(WHITE)
+            canvas.blit(bg, (0, 0))
+        # 馬名・作戦
+        text = render_text(f"{i+1}番  {horse_names[i]}", MID_FONT_SIZE)
+        strat = render_text(f"作戦：{stats_list[i]['strategy']}", SMALL_FONT_SIZE)
+        canvas.blit(text, (WIDTH//2 - text.get_width()//2, HEIGHT//2 - 120))
+        canvas.blit(strat, (WIDTH//2 - strat.get_width()//2, HEIGHT//2 - 70))
+        # 立ち姿センター
+        canvas.blit(cactus_images[i], (WIDTH//2 - SPRITE_SIZE//2 - 10, HEIGHT//2 - 10))
+        flip_screen()
+        await scheduler.wait()
+
+    # --- 待機画面（Sキー押下まで）---
+    showing = True
+    shown_key = None         # 最後に画面へ送った待機画面の中身と時刻
+    shown_at = 0.0
+    woken = []               # wait_for_input が取り出したイベント（キューの残りより先）
+    while showing:
+        if odds_task is not None and odds_task.done():
+            if not odds_task.cancelled() and odds_task.exception() is None:
+                race_odds = odds_task.result()
+            odds_task = None
+
+        # 中身が変わったか、しばらく送っていなければ送り直す（計測表示中は毎フレーム）
+        idle = IDLE_WAIT and not profiler.enabled
+        key = waiting_key()
+        if not idle or key != shown_key or scheduler.clock() - shown_at >= IDLE_HEARTBEAT:
+            with profiler.section("background"):
+                canvas.blit(compose_waiting_scene(key), (0, 0))
+            flip_screen()
+            shown_key, shown_at = key, scheduler.clock()
+
+        with profiler.section("events"):
+            events = woken + pygame.event.get()
+            woken = []
+        for event in events:
+            if event.type == pygame.QUIT:
+                quit_game()
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_s and playback_start_tick is None:
+                showing = False
+                # ←ここで走り始めの時間をセット
+                engine.start()  # 走り出す瞬間から計測
+            elif event.type == pygame.KEYDOWN and event.key in COMMON_KEYS:
+                handle_common_key(event.key)
+
+        with profiler.section("update"):
+            while showing and scheduler.tick():
+                # 記録レースの再現中は記録どおりのフレームでスタート
+                if playback_start_tick is not None and engine.frames >= playback_start_tick:
+                    showing = False
+                    engine.start()
+                else:
+                    engine.idle(TICK_DT)
+        if showing:
+            if idle:
+                woken = await wait_for_input(IDLE_POLL)
+                scheduler.catch_up()
+            else:
+                await scheduler.wait()
+
+    # カウントダウン（即時決着モードでは描かずにティックだけ進める）
+    countdown_ticks = 0
+    if instant_mode:
+        for _ in range(COUNTDOWN_FRAMES):
+            engine.idle(TICK_DT)
+        countdown_ticks = COUNTDOWN_FRAMES
+    while countdown_ticks < COUNTDOWN_FRAMES:
+        with profiler.section("update"):
+            while countdown_ticks < COUNTDOWN_FRAMES and scheduler.tick():
+                countdown_ticks += 1
+                engine.idle(TICK_DT)
+        count = 3 - min(countdown_ticks, COUNTDOWN_FRAMES - 1) * 3 // COUNTDOWN_FRAMES
+
+        with profiler.section("background"):
+            canvas.fill(WHITE)
+            canvas.blit(bg, (0, 0))
+        with profiler.section("sprites"):
+            for idx in range(num_cactus):
+                canvas.blit(cactus_images[idx], (positions[idx][0], positions[idx][1]))
+        count_text = render_text(str(count), FONT_SIZE)
+        canvas.blit(count_text, (WIDTH//2 - count_text.get_width()//2, HEIGHT//2 - 50))
+        flip_screen()
+        await scheduler.wait()
+
+    # カウントダウン後は走る姿へ
+    cactus_current_images[:] = cactus_images.copy()
+
+# --- 順位表の枠（パネル・枠線・タイトル・行線）は1枚に描いておく ---
+TABLE_X, TABLE_Y = 20, 20
+TABLE_W = 320
+ROW_HEIGHT = 28
+rank_rows = min(num_cactus, RANK_ROWS)
+TABLE_H = ROW_HEIGHT * rank_rows + 36
+
+rank_panel = pygame.Surface((TABLE_W + 1, TABLE_H)).convert()
+rank_panel.fill(PANEL)
+pygame.draw.rect(rank_panel, BLACK, (0, 0, TABLE_W, TABLE_H), 2)
+rank_panel.blit(render_text("順位表", TITLE_FONT_SIZE), (7, 0))
+for _rank in range(1, rank_rows+1):
+    _row_y = 30 + (_rank-1)*ROW_HEIGHT
+    pygame.draw.line(rank_panel, BLACK, (0, _row_y), (TABLE_W, _row_y), 1)
+
+# ゴールライン（太さ5の縦線）
+goal_line_surface = pygame.Surface((5, HEIGHT)).convert()
+goal_line_surface.fill(RED)
+
+# リプレイ一時停止マーク（フォントに記号が無いので図形で）
+pause_icon = pygame.Surface((24, 30), pygame.SRCALPHA)
+pygame.draw.rect(pause_icon, BLACK, (2, 2, 7, 26))
+pygame.draw.rect(pause_icon, BLACK, (15, 2, 7, 26))
+
+# 早送りマーク
+ff_icon = pygame.Surface((30, 24), pygame.SRCALPHA)
+pygame.draw.polygon(ff_icon, BLACK, [(2, 2), (14, 12), (2, 22)])
+pygame.draw.polygon(ff_icon, BLACK, [(15, 2), (27, 12), (15, 22)])
+
+# 差分矩形描画（ゴール後の静止画面用）。CACTUS_DIRTY_RECTS=0 で毎フレーム全面描画
+DIRTY_RENDERING = os.environ.get("CACTUS_DIRTY_RECTS", "1") == "1"
+renderer = DirtyRenderer(canvas)
+
+# 縮小描画で使う倍率の分だけ、毎フレーム描く画像を起動時に縮小しておく（テキストは初めて描くときに1回）
+canvas.cache.prescale([bg, rank_panel, goal_line_surface, pause_icon, ff_icon] + list(cactus_images),
+                      scale_controller.scales if scale_controller else [canvas.scale])
+
+# シミュレーションは 60 ティック/秒固定、描画は間に合う分だけ（重いときは描画を間引く）
+scheduler = FrameScheduler()
+
+
+# フレーム内訳の計測（F3 か CACTUS_PROFILE=1 で表示、CACTUS_PROFILE_TRACE=path.json|csv で毎フレーム記録）
+profiler = FrameProfiler(
+    enabled=os.environ.get("CACTUS_PROFILE") == "1",
+    counters=lambda: {"text_renders": text_cache.misses, "text_hits": text_cache.hits},
+    trace_path=os.environ.get("CACTUS_PROFILE_TRACE"),
+)
+
+
+def handle_common_key(key):
+    # 1～4：早送り倍率　I：即時決着モードの切り替え　F3：計測表示　F4：トレース書き出し
+    global instant_mode
+    if key in SPEED_KEYS:
+        scheduler.speed = SPEED_KEYS[key]
+    elif key == pygame.K_i:
+        instant_mode = not instant_mode
+    elif key == pygame.K_F3:
+        profiler.toggle()
+    elif key == pygame.K_F4 and profiler.trace_path:
+        profiler.dump()
+
+
+def quit_game():
+    if profiler.trace_path:
+        profiler.dump()
+    if history is not None:
+        history.close()
+    save_race_stats(force=True)
+    pygame.quit()
+    sys.exit()
+
+
+def flip_screen():
+    # オープニング画面の転送（計測中は表を重ねる）
+    if profiler.enabled:
+        overlay = profiler.overlay()
+        canvas.blit(overlay, (10, HEIGHT - overlay.get_height() - 10))
+    with profiler.section("flip"):
+        canvas.present()
+    profiler.end_frame()
+
+
+def draw_goal_line(x):
+    renderer.blit(goal_line_surface, (int(x) - 2, 0))
+
+
+def current_display_order():
+    # レース中は位置順、ゴール後は確定順位
+    if track.finished or track.replay_mode:
+        return results[:rank_rows]
+    return engine.order[:rank_rows]  # engine が毎ティック差分更新している
+
+
+def draw_background(surface):
+    # 背景描画（ループスクロール）
+    with profiler.section("background"):
+        surface.blit(bg, (track.bg_x, 0))
+        surface.blit(bg, (track.bg_x + WIDTH, 0))
+
+
+def draw_overlays(surface):
+    # 順位表・有利戦術・結果パネル（馬より手前に描く層）
+    global last_display_order, last_adv_type, adv_text_surface
+
+    with profiler.section("rank_table"):
+        surface.blit(rank_panel, (TABLE_X, TABLE_Y))
+
+        # 順位が変わったらテキストSurfaceを再生成してキャッシュ更新
+        display_order = current_display_order()
+        if display_order != last_display_order:
+            rank_surfaces.clear()
+            for rank, horse_idx in enumerate(display_order, start=1):
+                row_y = TABLE_Y + 30 + (rank-1)*ROW_HEIGHT
+                display_str = f"{rank}位：{horse_colors[horse_idx]} {horse_names[horse_idx]} ({stats_list[horse_idx]['strategy']})"
+                text = render_text(display_str, rank_font_size)
+                rank_surfaces.append((text, (TABLE_X + 5, row_y + 2)))
+            last_display_order = display_order.copy()
+
+        # キャッシュしてあるテキストSurfaceを描画
+        for text, pos in rank_surfaces:
+            surface.blit(text, pos)
+
+        if engine.advantaged_type != last_adv_type:
+            adv_text_surface = render_text(f"有利戦術：{engine.advantaged_type}", SMALL_FONT_SIZE)
+            last_adv_type = engine.advantaged_type
+        surface.blit(adv_text_surface, (WIDTH - adv_text_surface.get_width() - 20, 20))
+
+    # 結果表示（ランキング風 or リプレイ）
+    with profiler.section("results"):
+        if track.finished:
+            if track.replay_mode:
+                title_text = render_text("リプレイ", FONT_SIZE)
+                surface.blit(title_text, (WIDTH//2 - title_text.get_width()//2, HEIGHT - 420))
+                # シンプルに順位と名前だけ
+                for rank, idx in enumerate(results[:RESULT_ROWS], start=1):
+                    result_text = render_text(
+                        f"{rank}着：{horse_colors[idx]} {horse_names[idx]} ({stats_list[idx]['strategy']})",
+                        SMALL_FONT_SIZE
+                    )
+                    surface.blit(result_text, (WIDTH//2 - 120, HEIGHT - 330 + (rank-1)*28))
+            else:
+                # 背景パネル
+                panel_rect = (WIDTH//2 - 260, HEIGHT - 420, 520, 340)
+                surface.draw_rect(PANEL, panel_rect)
+                surface.draw_rect(BLACK, panel_rect, 2)
+
+                title_text = render_text("結果", FONT_SIZE)
+                surface.blit(title_text, (WIDTH//2 - title_text.get_width()//2, HEIGHT - 410))
+
+                for rank, idx in enumerate(results[:min(track.result_display_index, RESULT_ROWS)], start=1):
+                    result_text = render_text(
+                        f"{rank}着：{horse_colors[idx]} {horse_names[idx]} ({stats_list[idx]['strategy']})",
+                        SMALL_FONT_SIZE
+                    )
+                    surface.blit(result_text, (WIDTH//2 - 220, HEIGHT - 330 + (rank-1)*32))
+
+
+def draw_static_layers(surface):
+    draw_background(surface)
+    draw_overlays(surface)
+
+
+def static_key():
+    # これが変わらない限り静止画面の静的層は描き直さない
+    return (track.bg_x, track.replay_mode, track.result_display_index, tuple(current_display_order()), engine.advantaged_type)
+
+
+def update_race():
+    # 1フレーム分の状態更新（描画はしない）。全馬ゴールしたティックで結果を保存
+    if not track.update():
+        return
+    idx = results[0]  # 1位の馬のインデックス
+    recent_results.append([1, idx+1, horse_names[idx], stats_list[idx]["strategy"]])
+    if len(recent_results) > 5:
+        recent_results.pop(0)  # 最新5件だけ保持
+    if playback_start_tick is None:
+        record = racefile.race_record(engine)
+        if RACE_ARCHIVE:
+            racefile.append_race(RACE_ARCHIVE, record)
+        if history is not None:
+            record["race_ticks"] = engine.tick_count
+            record["race_seconds"] = engine.elapsed
+            history.record(record, horse_names)  # 書き込みは裏のスレッド
+        race_stats.add_race(record, horse_names)
+        save_race_stats()
+
+
+def save_race_stats(force=False):
+    # 強制終了やクラッシュでも集計を失わないよう、レースごとに（間引いて）書き戻す
+    global race_stats_saved_at
+    if not RACE_STATS:
+        return
+    now = time.monotonic()
+    if force or now - race_stats_saved_at >= RACE_STATS_SAVE_SECONDS:
+        race_stats.save(RACE_STATS)
+        race_stats_saved_at = now
+
+
+def finish_instantly():
+    # 残りのティックを描画せずに回し、リプレイと写真判定を飛ばして全着順を出す
+    while not engine.all_finished:
+        update_race()
+    track.replay_mode = False
+    track.finished = True
+    track.result_display_index = min(len(results), RESULT_ROWS)
+
+
+def set_render_scale(scale):
+    # 描画解像度の段を切り替える（静的層と待機画面は次に描くときに作り直す）
+    canvas.set_scale(scale)
+    renderer.rescale()
+
+
+def draw_frame(dirty=None):
+    # 背景が止まっている（ゴール後）ときは差分矩形、スクロール中は全面描き直し
+    started = scheduler.clock()
+    if dirty is None:
+        dirty = DIRTY_RENDERING
+    if track.finished and dirty:
+        renderer.begin(static_key(), draw_static_layers)
+    else:
+        renderer.begin_full()
+        draw_background(canvas)
+        if not track.finished:
+            # ----- ゴールライン描画 -----
+            if engine.elapsed >= GOAL_LINE_TIME:
+                draw_goal_line(engine.goal_line_x)
+
+            # ----- 馬描画（前のティックとの間を補間） -----
+            with profiler.section("sprites"):
+                alpha = scheduler.alpha
+                for i in range(num_cactus):
+                    x = track.prev_x[i] + (positions[i][0] - track.prev_x[i]) * alpha
+                    renderer.blit(cactus_current_images[i], (x, positions[i][1]))
+        draw_overlays(canvas)
+
+    # --- リプレイモード描画 ---
+    with profiler.section("replay"):
+        if track.replay_mode:
+            if not track.replay_player.done:
+                frame = track.replay_player.frame()  # 前後のフレームを補間
+                for i in range(num_cactus):
+                    x = frame[i]
+                    y = positions[i][1]  # 上下揺れ
+                    renderer.blit(cactus_current_images[i], (x, y))
+                # 再生速度（倍率の数字だけ）と一時停止マーク
+                speed_text = render_text(f"{track.replay_player.speed:g}", SMALL_FONT_SIZE)
+                speed_rect = renderer.blit(speed_text, (WIDTH - speed_text.get_width() - 20, HEIGHT - 50))
+                if track.replay_player.paused:
+                    renderer.blit(pause_icon, (speed_rect.x - 36, HEIGHT - 45))
+            elif track.photo_finish_timer < 120:
+                text = render_text("写真判定中...", FONT_SIZE)
+                renderer.blit(text, (WIDTH//2 - 100, HEIGHT//2))
+            else:
+                text = render_text("確定！", FONT_SIZE)
+                renderer.blit(text, (WIDTH//2 - 50, HEIGHT//2))
+
+            # ゴールライン描画
+            draw_goal_line(GOAL_X)
+
+    # 早送り中は右上に倍率
+    if scheduler.speed != 1:
+        ff_text = render_text(str(scheduler.speed), SMALL_FONT_SIZE)
+        ff_rect = renderer.blit(ff_text, (WIDTH - ff_text.get_width() - 20, 60))
+        renderer.blit(ff_icon, (ff_rect.x - 36, 66))
+
+    if profiler.enabled:
+        overlay = profiler.overlay()
+        renderer.blit(overlay, (10, HEIGHT - overlay.get_height() - 10))
+
+    with profiler.section("flip"):
+        renderer.end()
+    profiler.end_frame()
+
+    # 描画にかかった時間で解像度の段を選び直す（変わったら次のフレームから）
+    if scale_controller is not None:
+        scale = scale_controller.record(scheduler.clock() - started)
+        if scale is not None:
+            set_render_scale(scale)
+
+
+# 初期化＆オープニング
+async def main():
+    reset_race()
+    await opening_sequence()
+
+    while True:
+        with profiler.section("events"):
+            events = pygame.event.get()
+        for event in events:
+            if event.type == pygame.QUIT:
+                quit_game()
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_r:
+                    reset_race()
+                    await opening_sequence()
+                elif event.key in COMMON_KEYS:
+                    handle_common_key(event.key)
+                elif event.key == pygame.K_f and track.finished and not track.replay_mode and track.recorder is not None:
+                    # レース全体を等速でリプレイ
+                    track.play_full_replay()
+                elif track.replay_mode and track.replay_player is not None:
+                    # ←→：1秒シーク　↑↓：速度　スペース：一時停止　, .：コマ送り
+                    if event.key == pygame.K_LEFT:
+                        track.replay_player.seek_by(-60)
+                    elif event.key == pygame.K_RIGHT:
+                        track.replay_player.seek_by(60)
+                    elif event.key == pygame.K_UP:
+                        track.replay_player.faster()
+                    elif event.key == pygame.K_DOWN:
+                        track.replay_player.slower()
+                    elif event.key == pygame.K_SPACE:
+                        track.replay_player.toggle_pause()
+                    elif event.key == pygame.K_COMMA:
+                        track.replay_player.step_frames(-1)
+                    elif event.key == pygame.K_PERIOD:
+                        track.replay_player.step_frames(1)
+
+        if instant_mode and not track.finished and not track.replay_mode:
+            finish_instantly()
+
+        # 溜まった分だけティックを進めてから1回描く
+        with profiler.section("update"):
+            while scheduler.tick():
+                update_race()
+        draw_frame()
+        await scheduler.wait()
+
+
+async def watch(address):
+    # 観戦モード：server.py の1コースを受信し、届いた状態をそのまま描く（操作は終了と計測表示だけ）
+    from server import open_viewer, read_ws_frame, OP_BINARY, OP_CLOSE
+    host, port, track_id = address.replace("/tracks/", "/").replace("/", ":").split(":")
+    reader, writer = await open_viewer(host, int(port), int(track_id))
+    decoder = StateDecoder()
+
+    async def receive():
+        while True:
+            opcode, payload = await read_ws_frame(reader)
+            if opcode == OP_CLOSE:
+                break
+            if opcode == OP_BINARY:
+                try:
+                    decoder.feed(payload)
+                except ValueError:
+                    pass  # 取りこぼしたら次のキーフレームまで待つ
+
+    receiver = asyncio.ensure_future(receive())
+    race = None
+    while not receiver.done():
+        with profiler.section("events"):
+            events = pygame.event.get()
+        for event in events:
+            if event.type == pygame.QUIT:
+                quit_game()
+            elif event.type == pygame.KEYDOWN and event.key in (pygame.K_F3, pygame.K_F4):
+                handle_common_key(event.key)
+
+        while scheduler.tick():
+            pass  # 進行はサーバー側。描画の間隔だけ合わせる
+        if decoder.ready:
+            if decoder.num_horses != num_cactus:
+                sys.exit(f"track has {decoder.num_horses} horses; set CACTUS_FIELD_SIZE={decoder.num_horses}")
+            decoder.apply(track, horse_names)
+            if decoder.setup["race"] != race:
+                race = decoder.setup["race"]
+                refresh_race_layout()
+            draw_frame()
+        await scheduler.wait()
+    writer.close()
+    quit_game()
+
@@ -0,0 +1,203 @@
+import atexit
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+# レース履歴（SQLite, WAL）。races に1レース1行、entries に1頭1行
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS races (
+    id INTEGER PRIMARY KEY,
+    finished_at REAL NOT NULL,       -- 実時間（UNIX 秒）
+    seed INTEGER NOT NULL,
+    num_horses INTEGER NOT NULL,
+    advantaged_type TEXT NOT NULL,
+    start_tick INTEGER NOT NULL,     -- Sキー押下フレーム
+    race_ticks INTEGER NOT NULL,     -- スタートから全馬ゴールまでのティック数
+    race_seconds REAL NOT NULL,      -- 同上（シミュレーション秒）
+    winner INTEGER NOT NULL,         -- 1着の馬番号（0 始まり）
+    winner_name TEXT NOT NULL,
+    winner_strategy TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    race_id INTEGER NOT NULL,
+    horse INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    strategy TEXT NOT NULL,
+    stamina REAL NOT NULL,
+    burst REAL NOT NULL,
+    place INTEGER NOT NULL,          -- 着順（1 始まり）
+    PRIMARY KEY (race_id, horse)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS races_finished_at ON races (finished_at);
+CREATE INDEX IF NOT EXISTS entries_name ON entries (name, race_id);
+CREATE INDEX IF NOT EXISTS entries_strategy ON entries (strategy, place);
+"""
+
+MAX_BATCH = 500
+
+log = logging.getLogger(__name__)
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class HistoryStore:
+    """全レースの着順・出走時ステータス・シード・所要時間を SQLite に残す。
+
+    record() はキューに積むだけで、書き込みは裏のスレッドがまとめて1トランザクションで行う
+    （スレッドを作れない環境では record() の中で書く）。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = _connect(path)
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._writer, name="race-history", daemon=True)
+        try:
+            self.thread.start()
+        except RuntimeError:
+            self.thread = None
+        atexit.register(self.close)
+
+    def record(self, race, names):
+        # race は racefile.race_record() の形（seed, start_tick, advantaged_type, stats, results）に
+        # race_ticks と race_seconds を足したもの
+        row = (time.time(), race, list(names))
+        if self.thread is None:
+            self._write_logged(self.conn, [row])
+        else:
+            self.queue.put(row)
+
+    def flush(self):
+        if self.thread is not None:
+            self.queue.join()
+
+    def close(self):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def _writer(self):
+        conn = _connect(self.path)
+        while True:
+            row = self.queue.get()
+            if row is None:
+                self.queue.task_done()
+                break
+            batch = [row]
+            while len(batch) < MAX_BATCH:
+                try:
+                    row = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if row is None:
+                    self.queue.put(None)   # 終了の合図は次の周回で受け取る
+                    self.queue.task_done()
+                    break
+                batch.append(row)
+            # 書き込みに失敗しても取り出した分は必ず task_done し、次のバッチへ進む
+            # （でないと flush() の queue.join() が終わらない）
+            try:
+                self._write_logged(conn, batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+        conn.close()
+
+    @classmethod
+    def _write_logged(cls, conn, batch):
+        # 失敗したバッチはロールバックして1レースずつ書き直し、それでも書けないものはログに残して捨てる
+        try:
+            cls._write(conn, batch)
+        except Exception:
+            if len(batch) > 1:
+                for row in batch:
+                    cls._write_logged(conn, [row])
+            else:
+                log.exception("race history: failed to write race (seed %s)", batch[0][1].get("seed"))
+
+    @staticmethod
+    def _write(conn, batch):
+        with conn:
+            for finished_at, race, names in batch:
+                results = race["results"]
+                winner = results[0]
+                cur = conn.execute(
+                    "INSERT INTO races (finished_at, seed, num_horses, advantaged_type, start_tick,"
+                    " race_ticks, race_seconds, winner, winner_name, winner_strategy)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (finished_at, race["seed"], len(race["stats"]), race["advantaged_type"], race["start_tick"],
+                     race["race_ticks"], race["race_seconds"], winner, names[winner],
+                     race["stats"][winner]["strategy"]))
+                place = {idx: rank for rank, idx in enumerate(results, start=1)}
+                conn.executemany(
+                    "INSERT INTO entries (race_id, horse, name, strategy, stamina, burst, place)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(cur.lastrowid, i, names[i], stat["strategy"], stat["stamina"], stat["burst"], place[i])
+                     for i, stat in enumerate(race["stats"])])
+
+    # --- 読み出し（どれも索引で引く。テーブル全体は走査しない） ---
+
+    def recent_winners(self, limit=5):
+        # 直近 limit レースの1着（古い順）。待機画面の「直近5レースの1位」の形 [1, 馬番, 名前, 作戦]
+        rows = self.conn.execute(
+            "SELECT winner, winner_name, winner_strategy FROM races ORDER BY id DESC LIMIT ?", (limit,)
+        ).fetchall()
+        return [[1, winner + 1, name, strategy] for winner, name, strategy in reversed(rows)]
+
+    def horse_history(self, name, limit=50):
+        # その馬の直近の出走（新しい順）：(race_id, 着順, 作戦)
+        return self.conn.execute(
+            "SELECT race_id, place, strategy FROM entries WHERE name = ? ORDER BY race_id DESC LIMIT ?",
+            (name, limit),
+        ).fetchall()
+
+    def strategy_record(self, strategy, since=None, until=None):
+        # 作戦ごとの (1着数, 出走数)。since/until は finished_at の範囲
+        if since is None and until is None:
+            starts, wins = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(place = 1), 0) FROM entries WHERE strategy = ?",
+                (strategy,),
+            ).fetchone()
+        else:
+            starts, wins = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(e.place = 1), 0) FROM races r"
+                " JOIN entries e ON e.race_id = r.id"
+                " WHERE r.finished_at BETWEEN ? AND ? AND e.strategy = ?",
+                (since if since is not None else 0.0, until if until is not None else float("inf"), strategy),
+            ).fetchone()
+        return wins, starts
+
+    def races_between(self, since, until, limit=1000):
+        return self.conn.execute(
+            "SELECT id, finished_at, seed, advantaged_type, winner_name, winner_strategy, race_seconds"
+            " FROM races WHERE finished_at BETWEEN ? AND ? ORDER BY finished_at LIMIT ?",
+            (since, until, limit),
+        ).fetchall()
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM races").fetchone()[0]
+
+    def last_id(self):
+        # 書き込み待ちを流してから、最後のレースの id（空なら 0）
+        self.flush()
+        return self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM races").fetchone()[0]
+
+    def discard_after(self, race_id):
+        # race_id より後に書いたレースを消す（途中で止まった一括投入をやり直す前に）
+        self.flush()
+        with self.conn:
+            self.conn.execute("DELETE FROM entries WHERE race_id > ?", (race_id,))
+            self.conn.execute("DELETE FROM races WHERE id > ?", (race_id,))
@@ -0,0 +1,139 @@
+import asyncio
+import copy
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+
+import numpy as np
+
+from batch_sim import RaceBatch
+from race_engine import BALANCE, place_slots, set_balance
+
+Z95 = 1.959963984540054   # 95% 信頼区間
+ODDS_TIME_LIMIT = 8.0     # 紹介スライド（約10秒）の間に収める
+STOP_CHECK_TICKS = 64     # ワーカーが打ち切りを確かめる間隔（ティック）
+MAX_CHUNK_TICKS = 100000  # 1チャンクの上限（batch_sim の run と同じ）
+# 紹介スライドを描くプロセスのために1コア空けておく（1コアの環境でもワーカーは1つ）
+ODDS_WORKERS = max(1, (os.cpu_count() or 1) - 1)
+
+_pool = None
+# 推定の世代。推定を始めるときと締め切ったときに進め、ワーカーは自分の世代でなくなったら途中でやめる
+_generation = None
+
+
+def _init_worker(generation, balance):
+    global _generation
+    _generation = generation
+    set_balance(balance)
+
+
+def get_pool(workers=None):
+    # プロセスプールは使い回す（起動コストをレースごとに払わない）
+    global _pool, _generation
+    if _pool is None:
+        _generation = multiprocessing.Value("i", 0)
+        _pool = ProcessPoolExecutor(max_workers=workers or ODDS_WORKERS,
+                                    initializer=_init_worker, initargs=(_generation, BALANCE))
+    return _pool
+
+
+def _next_generation():
+    with _generation.get_lock():
+        _generation.value += 1
+        return _generation.value
+
+
+def wilson_interval(k, n, z=Z95):
+    if n == 0:
+        return 0.0, 1.0
+    p = k / n
+    denom = 1 + z*z/n
+    center = (p + z*z/(2*n)) / denom
+    half = z * math.sqrt(p*(1 - p)/n + z*z/(4*n*n)) / denom
+    return max(0.0, center - half), min(1.0, center + half)
+
+
+def _run_chunk(engine, n_sims, seed_seq, wait_ticks, generation):
+    # ワーカー側：同じ出走条件から n_sims 通りの続きを走らせて着順を数える。
+    # 締め切られた（世代が変わった）ら途中でやめて None
+    if _generation.value != generation:
+        return None
+    batch = RaceBatch(n_sims, seed=seed_seq, wait_ticks=wait_ticks, engine=engine)
+    while not batch.all_finished and batch.tick_count < MAX_CHUNK_TICKS:
+        batch.step()
+        if batch.tick_count % STOP_CHECK_TICKS == 0 and _generation.value != generation:
+            return None
+    orders = batch.finish_order()
+    h = engine.num_horses
+    win = np.bincount(orders[:, 0], minlength=h)
+    place = np.bincount(orders[:, :place_slots(h)].ravel(), minlength=h)
+    return win, place, n_sims
+
+
+def estimate_odds(engine, n_sims=32768, seed=None, chunk_size=None, wait_ticks=0,
+                  time_limit=ODDS_TIME_LIMIT, workers=None):
+    # reset() 直後の engine から勝率・複勝率を推定する。時間切れの分は捨てて集計
+    deadline = time.perf_counter() + time_limit
+    if chunk_size is None:
+        # 1チャンクが 0.25 秒程度で終わるよう頭数に合わせて小さくする（締め切りの取りこぼしを減らす）
+        chunk_size = max(64, 512 * 5 // engine.num_horses)
+    pool = get_pool(workers)
+    generation = _next_generation()
+    n_chunks = max(1, n_sims // chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(n_chunks)
+    futures = [pool.submit(_run_chunk, engine, chunk_size, s, wait_ticks, generation) for s in seeds]
+
+    done, not_done = wait(futures, timeout=max(0.0, deadline - time.perf_counter()))
+    # 走り始めたチャンクは cancel() では止まらないので、世代を進めて次のレースまで持ち越させない
+    _next_generation()
+    for future in not_done:
+        future.cancel()
+
+    h = engine.num_horses
+    win = np.zeros(h, dtype=np.int64)
+    place = np.zeros(h, dtype=np.int64)
+    total = 0
+    for future in done:
+        result = future.result()
+        if result is None:
+            continue
+        w, p, n = result
+        win += w
+        place += p
+        total += n
+
+    odds = []
+    for i in range(h):
+        p_win = win[i] / total if total else 0.0
+        odds.append({
+            "win": p_win,
+            "win_ci": wilson_interval(int(win[i]), total),
+            "place": place[i] / total if total else 0.0,
+            "place_ci": wilson_interval(int(place[i]), total),
+            # 控除なしの単勝オッズ（0.1倍刻み、最低1.0倍）
+            "odds": max(1.0, math.floor(10 / p_win) / 10) if p_win > 0 else None,
+        })
+    return {"sims": total, "horses": odds}
+
+
+async def estimate_odds_async(engine, **kwargs):
+    # 描画ループを止めないようにスレッドから投げる（engine はコピーして渡す）
+    loop = asyncio.get_running_loop()
+    snapshot = copy.deepcopy(engine)
+    return await loop.run_in_executor(None, lambda: estimate_odds(snapshot, **kwargs))
+
+
+if __name__ == "__main__":
+    from race_engine import RaceEngine
+
+    engine = RaceEngine(seed=1)
+    t0 = time.perf_counter()
+    result = estimate_odds(engine, seed=1)
+    dt = time.perf_counter() - t0
+    print(f"advantaged: {engine.advantaged_type}  sims: {result['sims']}  {dt:.2f}s")
+    for i, (stat, row) in enumerate(zip(engine.stats_list, result["horses"])):
+        lo, hi = row["win_ci"]
+        print(f"{i+1}番 {stat['strategy']} win {row['win']:.3f} [{lo:.3f}, {hi:.3f}]"
+              f"  place {row['place']:.3f}  odds {row['odds']}")
@@ -0,0 +1,128 @@
+import contextlib
+import csv
+import json
+import time
+from collections import deque
+
+import pygame
+
+PROFILE_WINDOW = 300        # p50/p95/max を出す直近フレーム数
+TRACE_LIMIT = 100_000       # トレースに残す最大フレーム数
+OVERLAY_REFRESH = 15        # オーバーレイを作り直す間隔（フレーム）
+
+_NULL_SECTION = contextlib.nullcontext()
+
+
+class _Section:
+    __slots__ = ("profiler", "name", "t0")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+
+    def __exit__(self, *exc):
+        current = self.profiler.current
+        current[self.name] = current.get(self.name, 0.0) + time.perf_counter() - self.t0
+
+
+class FrameProfiler:
+    """フレーム内の各処理の時間を測り、直近の分布とトレースを持つ。
+
+    無効のときの section() は共有の nullcontext を返すだけなので、計測コードを
+    ホットパスに置いたままでよい。counters はフレームごとの差分を取りたい累計値
+    （テキストキャッシュのヒット数など）を返す関数。
+    """
+
+    def __init__(self, enabled=False, counters=None, window=PROFILE_WINDOW, trace_path=None):
+        self.enabled = enabled
+        self.counters = counters
+        self.window = window
+        self.trace_path = trace_path
+        self.samples = {}
+        self.trace = deque(maxlen=TRACE_LIMIT)
+        self.current = {}
+        self.frame = 0
+        self._last_counts = counters() if counters else {}
+        self._overlay = None
+        self._font = None
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self.current = {}
+        self._overlay = None
+
+    def section(self, name):
+        if not self.enabled:
+            return _NULL_SECTION
+        return _Section(self, name)
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        times = self.current
+        self.current = {}
+        times["total"] = sum(times.values())
+        for name, t in times.items():
+            samples = self.samples.get(name)
+            if samples is None:
+                samples = self.samples[name] = deque(maxlen=self.window)
+            samples.append(t)
+        row = {"frame": self.frame}
+        row.update({name: round(t * 1000, 4) for name, t in times.items()})
+        if self.counters:
+            counts = self.counters()
+            row.update({name: value - self._last_counts.get(name, 0) for name, value in counts.items()})
+            self._last_counts = counts
+        if self.trace_path:
+            self.trace.append(row)
+        self.frame += 1
+
+    def stats(self):
+        # 処理名 -> (p50, p95, max) [ms]
+        result = {}
+        for name, samples in self.samples.items():
+            ordered = sorted(samples)
+            n = len(ordered)
+            result[name] = (ordered[n // 2] * 1000, ordered[min(n - 1, n * 95 // 100)] * 1000, ordered[-1] * 1000)
+        return result
+
+    def dump(self, path=None):
+        # 拡張子 .csv なら CSV、それ以外は JSON
+        path = path or self.trace_path
+        rows = list(self.trace)
+        if path.endswith(".csv"):
+            fields = ["frame"] + sorted({key for row in rows for key in row} - {"frame"})
+            with open(path, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=fields)
+                writer.writeheader()
+                writer.writerows(rows)
+        else:
+            with open(path, "w") as f:
+                json.dump(rows, f)
+        return path
+
+    def overlay(self):
+        # 計測値の表（デバッグ用なので英数字だけ。日本語サブセットフォントは使わない）
+        if self._overlay is not None and self.frame % OVERLAY_REFRESH:
+            return self._overlay
+        if self._font is None:
+            self._font = pygame.font.Font(None, 20)
+        font = self._font
+        stats = self.stats()
+        lines = [("ms", "p50", "p95", "max")]
+        for name in sorted(stats, key=lambda k: (k == "total", k)):
+            lines.append((name,) + tuple(f"{v:.2f}" for v in stats[name]))
+        if self.counters:
+            counts = self.counters()
+            lines.append(tuple(f"{name} {value}" for name, value in counts.items()))
+        surface = pygame.Surface((300, 16 * len(lines) + 8), pygame.SRCALPHA)
+        surface.fill((0, 0, 0, 170))
+        for row, cols in enumerate(lines):
+            for col, text in enumerate(cols):
+                x = 6 + (col * 150 if len(cols) == 2 else (0 if col == 0 else 80 + (col - 1) * 70))
+                surface.blit(font.render(text, True, (255, 255, 255)), (x, 4 + row * 16))
+        self._overlay = surface
+        return surface
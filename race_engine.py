@@ -0,0 +1,354 @@
+import json
+import math
+import os
+import random
+import warnings
+
+# 画面・コース定数（game.py と共有）
+WIDTH, HEIGHT = 1200, 600
+GOAL_X = WIDTH - 200
+START_X = 50
+LANE_Y = 175
+LANE_HEIGHT = 80
+LANE_SPAN = 4 * LANE_HEIGHT   # 5頭立てで使う縦幅（多頭数はこの中に詰める）
+
+# デッドヒート範囲
+DEADHEAT_START_X = 150
+DEADHEAT_END_X = 650
+DEADHEAT_UPDATE_INTERVAL = 30
+
+# ゴールライン
+GOAL_LINE_TIME = 20          # スタートからゴールラインが現れるまで（秒）
+GOAL_LINE_START_X = WIDTH + 50
+BG_SPEED = 3
+
+STRATEGIES = ["参型", "壱型", "弐型", "肆型"]
+
+# 戦術バランスの定数。balance.json（tune_balance.py が書く）があれば load_balance() で上書きする
+BALANCE_VERSION = 1
+BALANCE_FILE = "balance.json"
+BALANCE = {
+    "advantaged_burst": [1.3, 1.6],       # 有利戦術のバースト倍率
+    "yon_advantaged_bonus": [1.2, 1.4],   # 肆型が有利戦術のときの上乗せ
+    "other_burst": {s: [0.9, 1.2] for s in STRATEGIES},   # 有利戦術でない馬のバースト倍率（戦術別）
+    "deadheat": {                         # 戦術別のデッドヒート範囲（最初の 30 秒まで）
+        "参型": [DEADHEAT_START_X + 100, DEADHEAT_END_X - 200],   # 中央付近
+        "壱型": [DEADHEAT_END_X - 200, DEADHEAT_END_X],           # 右寄り
+        "弐型": [DEADHEAT_END_X - 200, DEADHEAT_END_X],
+        "肆型": [DEADHEAT_START_X, DEADHEAT_START_X + 200],       # 左寄り
+    },
+    "stamina_cost": {"参型": 0.15, "壱型": 0.2, "弐型": 0.2, "肆型": 0.15},  # スプリント中の1ティックの消費
+}
+
+
+def _same_shape(value, default):
+    # value が既定値と同じ形（同じキーの dict・同じ長さの list・有限の数）か
+    if isinstance(default, dict):
+        return (isinstance(value, dict) and value.keys() == default.keys()
+                and all(_same_shape(value[k], default[k]) for k in default))
+    if isinstance(default, list):
+        return (isinstance(value, list) and len(value) == len(default)
+                and all(_same_shape(v, d) for v, d in zip(value, default)))
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def load_balance(path=None):
+    # path（既定は CACTUS_BALANCE か balance.json）があれば BALANCE を上書きする。読めたら True
+    # 壊れた・古い・形の合わないファイルは警告を出して既定値のまま（起動時に読むので例外にしない）
+    if path is None:
+        path = os.environ.get("CACTUS_BALANCE", BALANCE_FILE)
+    if not path:
+        return False
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return False
+    except (OSError, ValueError) as e:
+        warnings.warn(f"{path}: cannot read balance file ({e}); using defaults", stacklevel=2)
+        return False
+    if not isinstance(data, dict) or data.get("version") != BALANCE_VERSION:
+        version = data.get("version") if isinstance(data, dict) else None
+        warnings.warn(f"{path}: unsupported balance file version {version!r}; using defaults", stacklevel=2)
+        return False
+    bad = [key for key in BALANCE if not _same_shape(data.get(key), BALANCE[key])]
+    if bad:
+        warnings.warn(f"{path}: missing or malformed {', '.join(bad)}; using defaults", stacklevel=2)
+        return False
+    BALANCE.update((key, data[key]) for key in BALANCE)
+    return True
+
+
+def set_balance(balance):
+    # ワーカープロセスの initializer 用。spawn・forkserver で起動したワーカーは親が load_balance() で
+    # 読んだ値を引き継がないので、プールを作るときに initargs=(BALANCE,) で渡す
+    BALANCE.update(balance)
+
+# 固定タイムステップ（1ティック＝60FPSの1フレーム）
+TICK_RATE = 60
+TICK_DT = 1 / TICK_RATE
+
+# オープニング演出の長さ（フレーム数）
+INTRO_FRAMES = 240
+SLIDE_FRAMES = 120
+COUNTDOWN_FRAMES = 180
+MAX_SLIDES = 5               # 紹介スライドは先頭5頭まで
+
+
+def lane_y(i, num_horses=5):
+    if num_horses <= 5:
+        return LANE_Y + i*LANE_HEIGHT
+    return LANE_Y + i*LANE_SPAN / (num_horses - 1)
+
+
+def slide_count(num_horses):
+    return min(num_horses, MAX_SLIDES)
+
+
+def opening_frames(num_horses):
+    # 入場演出＋紹介スライドのフレーム数（待機画面に入るまで）
+    return INTRO_FRAMES + SLIDE_FRAMES * slide_count(num_horses)
+
+
+def place_slots(num_horses):
+    # 複勝の対象：7頭以下は2着まで、8頭以上は3着まで
+    return 2 if num_horses < 8 else 3
+
+
+class RaceEngine:
+    """描画を持たないレース本体。乱数・時計はすべてレースごとに保持する。"""
+
+    def __init__(self, num_horses=5, seed=None):
+        self.num_horses = num_horses
+        self.rng = random.Random()
+
+        # リストは reset() で中身だけ入れ替える（外部からの参照を保つため）
+        self.positions = []
+        self.stats_list = []
+        self.deadheat_ranges = []
+        self.deadheat_targets = []
+        self.sprint_times = []
+        self.results = []
+        self.finish_ticks = []       # results と同じ順に、ゴールしたティック（スタートから数えて 1 始まり）
+        self.order = []              # 現在の順位（先頭から馬番号）
+        self.rank = []               # 馬番号 → order 内の位置
+        self.goaled = []
+        self.reset(seed)
+
+    def reset(self, seed=None):
+        if seed is None:
+            seed = random.getrandbits(32)
+        self.seed = seed
+        rng = self.rng
+        rng.seed(seed)
+        n = self.num_horses
+
+        self.positions[:] = [[START_X, lane_y(i, n)] for i in range(n)]
+        self.deadheat_active = True
+
+        # 各馬のステータスを初期化
+        self.stats_list[:] = []
+        for _ in range(n):
+            self.stats_list.append({
+                "stamina": rng.uniform(50, 100),
+                "burst": rng.uniform(3, 6),
+                "strategy": rng.choice(STRATEGIES)
+            })
+
+        self.clock = 0.0             # reset からの経過（シミュレーション秒）
+        self.frames = 0              # reset からのフレーム数（idle と step の合計）
+        self.start_time = 0.0        # Sキー押下時の clock
+        self.start_tick = None       # Sキー押下時の frames
+        self.started = False
+        self.tick_count = 0
+        self.results[:] = []
+        self.finish_ticks[:] = []
+        self.goaled[:] = [False] * n
+        # 全馬同位置なので番号順
+        self.order[:] = list(range(n))
+        self.rank[:] = list(range(n))
+        self.goal_line_x = GOAL_LINE_START_X
+        self.sprint_times[:] = [rng.uniform(22, 25) for _ in range(n)]
+        self.last_deadheat_update = 0.0
+
+        self.advantaged_type = rng.choice(STRATEGIES)
+
+        # --- デッドヒート範囲を戦術別に設定 ---
+        self.deadheat_ranges[:] = []
+        self.deadheat_targets[:] = []
+        for stat in self.stats_list:
+            dh_range = tuple(BALANCE["deadheat"][stat["strategy"]])
+            self.deadheat_ranges.append(dh_range)
+            self.deadheat_targets.append(rng.uniform(*dh_range))
+
+        # --- 有利戦術による補正 ---
+        for stat in self.stats_list:
+            if stat["strategy"] == self.advantaged_type:
+                # 通常有利補正
+                stat["burst"] *= rng.uniform(*BALANCE["advantaged_burst"])
+
+                # 特別：肆型が有利戦術のときはさらに強化
+                if self.advantaged_type == "肆型":
+                    stat["burst"] *= rng.uniform(*BALANCE["yon_advantaged_bonus"])
+            else:
+                stat["burst"] *= rng.uniform(*BALANCE["other_burst"][stat["strategy"]])
+        self.stamina_costs = [BALANCE["stamina_cost"][stat["strategy"]] for stat in self.stats_list]
+
+        # 出走時のステータス（スタミナはレース中に減るので控えておく）
+        self.initial_stats = [dict(stat) for stat in self.stats_list]
+
+    def random_deadheat_range(self):
+        start = self.rng.uniform(DEADHEAT_START_X, DEADHEAT_END_X - 150)
+        end = self.rng.uniform(start + 150, DEADHEAT_END_X)
+        return start, end
+
+    # --- 時計 ---
+    @property
+    def elapsed(self):
+        return self.clock - self.start_time
+
+    @property
+    def all_finished(self):
+        # ゴール線を越えるのはスプリント中だけなので results の長さで判定できる
+        return len(self.results) == self.num_horses
+
+    def idle(self, dt=TICK_DT):
+        # 馬を動かさずに時計だけ進める（オープニング・カウントダウン中）
+        self.clock += dt
+        self.frames += 1
+
+    def start(self):
+        # Sキー押下＝走り始めの時刻
+        self.start_time = self.clock
+        self.start_tick = self.frames
+        self.started = True
+
+    def skip_opening(self, wait_ticks=0):
+        # opening_sequence() と同じだけ時計を進める
+        self.skip_to_start(opening_frames(self.num_horses) + wait_ticks)
+
+    def skip_to_start(self, start_tick):
+        # 描画側と同じく1フレームずつ足す（浮動小数の誤差まで揃えるため）
+        while self.frames < start_tick:
+            self.idle(TICK_DT)
+        self.start()
+        for _ in range(COUNTDOWN_FRAMES):
+            self.idle(TICK_DT)
+
+    # --- 順位の差分更新 ---
+    def _reorder(self, i):
+        # 馬 i だけ動いたので隣と比べて入れ替える（sorted(..., reverse=True) と同じ並び）
+        positions = self.positions
+        order = self.order
+        rank = self.rank
+        x = positions[i][0]
+        r = rank[i]
+        while r > 0:
+            j = order[r - 1]
+            xj = positions[j][0]
+            if xj > x or (xj == x and j < i):
+                break
+            order[r] = j
+            rank[j] = r
+            r -= 1
+        while r < len(order) - 1:
+            j = order[r + 1]
+            xj = positions[j][0]
+            if x > xj or (x == xj and i < j):
+                break
+            order[r] = j
+            rank[j] = r
+            r += 1
+        order[r] = i
+        rank[i] = r
+
+    # --- 1ティック分のレース進行 ---
+    def step(self, dt=TICK_DT):
+        rng = self.rng
+        positions = self.positions
+        stats_list = self.stats_list
+        n = self.num_horses
+        elapsed = self.elapsed
+
+        # デッドヒート更新
+        if self.deadheat_active and self.clock - self.last_deadheat_update >= DEADHEAT_UPDATE_INTERVAL:
+            self.deadheat_ranges[:] = [self.random_deadheat_range() for _ in range(n)]
+            self.deadheat_targets[:] = [rng.uniform(*self.deadheat_ranges[i]) for i in range(n)]
+            self.last_deadheat_update = self.clock
+
+        # ゴールライン接近
+        if elapsed >= GOAL_LINE_TIME and self.goal_line_x > GOAL_X:
+            self.goal_line_x -= BG_SPEED
+
+        # ----- 馬移動（ゴール後も右に進む） -----
+        for i in range(n):
+            stat = stats_list[i]
+            if self.deadheat_active and elapsed < self.sprint_times[i]:
+                # デッドヒート移動
+                target = self.deadheat_targets[i]
+                idx_in_order = self.rank[i]
+                speed_factor = 1.0
+                if idx_in_order > 0:
+                    front_idx = self.order[idx_in_order - 1]
+                    dist_front = positions[front_idx][0] - positions[i][0]
+                    if dist_front < 15:
+                        speed_factor = 0.3
+                delta = rng.uniform(2.5, 4.0) * speed_factor * stat["burst"]/5.0
+                if positions[i][0] < target:
+                    positions[i][0] += delta
+                    if positions[i][0] > target:
+                        positions[i][0] = target
+                else:
+                    positions[i][0] -= delta
+                    if positions[i][0] < target:
+                        positions[i][0] = target
+                if positions[i][0] == target:
+                    self.deadheat_targets[i] = rng.uniform(*self.deadheat_ranges[i])
+                self._reorder(i)
+            else:
+                self.deadheat_active = False
+
+                # 基本スピード
+                base_delta = rng.uniform(5, 10) * stat["burst"] / 5.0
+
+                # --- 戦術＋スタミナ補正 ---
+                stamina_factor = stat["stamina"] / 100  # 0.5～1.0
+                strategy = stat["strategy"]
+
+                if strategy in ["壱型", "弐型"]:
+                    # 序盤はスタミナ依存で少し早く、スタミナ消費で減速
+                    delta = base_delta * (0.8 + 0.4 * stamina_factor)
+                else:  # 参型・肆型
+                    # 序盤は控えめ、終盤はスタミナに応じて加速
+                    if positions[i][0] < GOAL_X - 200:
+                        delta = base_delta * (0.6 + 0.6 * stamina_factor) * 0.6  # 前半控えめ
+                    else:
+                        delta = base_delta * (0.6 + 0.6 * stamina_factor) * 1.8  # 終盤加速
+                stat["stamina"] -= self.stamina_costs[i]  # 消費
+
+                # スタミナが少ないと減速
+                if stat["stamina"] < 10:
+                    delta *= 0.5
+
+                positions[i][0] += delta
+                self._reorder(i)
+
+                # ゴール判定（順位記録のみ）
+                if positions[i][0] >= GOAL_X and not self.goaled[i]:
+                    self.goaled[i] = True
+                    self.results.append(i)
+                    self.finish_ticks.append(self.tick_count + 1)
+
+        self.tick_count += 1
+        self.clock += dt
+        self.frames += 1
+
+    def run_to_finish(self, max_ticks=100000):
+        # 描画なしで全馬ゴールまで回す
+        if not self.started:
+            self.skip_opening()
+        ticks = 0
+        while not self.all_finished and ticks < max_ticks:
+            self.step()
+            ticks += 1
+        return list(self.results)
@@ -0,0 +1,161 @@
+import argparse
+import struct
+import sys
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+from race_engine import BALANCE, RaceEngine, STRATEGIES, load_balance, set_balance
+
+# .race ファイル：シード・Sキー押下フレーム・出走時ステータス・着順だけを持つ。
+# 位置は RaceEngine で再計算する（1レース 100 バイト前後）
+MAGIC = b"RACE"
+VERSION = 1
+HEADER = struct.Struct("<4sBQHIB")   # magic, version, seed, 頭数, Sキー押下フレーム, 有利戦術
+HORSE = struct.Struct("<ddB")        # stamina, burst, strategy
+RESULT = struct.Struct("<H")
+
+
+def race_record(engine):
+    # レース終了後の engine から記録を作る
+    return {
+        "seed": engine.seed,
+        "start_tick": engine.start_tick,
+        "advantaged_type": engine.advantaged_type,
+        "stats": [dict(stat) for stat in engine.initial_stats],
+        "results": list(engine.results),
+        "finish_ticks": list(engine.finish_ticks),   # .race には書かない（再計算できる）
+    }
+
+
+def encode_race(record):
+    stats = record["stats"]
+    parts = [HEADER.pack(MAGIC, VERSION, record["seed"], len(stats), record["start_tick"],
+                         STRATEGIES.index(record["advantaged_type"]))]
+    for stat in stats:
+        parts.append(HORSE.pack(stat["stamina"], stat["burst"], STRATEGIES.index(stat["strategy"])))
+    for idx in record["results"]:
+        parts.append(RESULT.pack(idx))
+    return b"".join(parts)
+
+
+def decode_race(buf, offset=0):
+    # 途中で切れた・壊れた記録は ValueError
+    start = offset
+    try:
+        magic, version, seed, n, start_tick, adv = HEADER.unpack_from(buf, offset)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"not a race record at offset {start}")
+        offset += HEADER.size
+        stats = []
+        for _ in range(n):
+            stamina, burst, strategy = HORSE.unpack_from(buf, offset)
+            stats.append({"stamina": stamina, "burst": burst, "strategy": STRATEGIES[strategy]})
+            offset += HORSE.size
+        results = []
+        for _ in range(n):
+            results.append(RESULT.unpack_from(buf, offset)[0])
+            offset += RESULT.size
+        record = {
+            "seed": seed,
+            "start_tick": start_tick,
+            "advantaged_type": STRATEGIES[adv],
+            "stats": stats,
+            "results": results,
+        }
+    except (struct.error, IndexError):
+        raise ValueError(f"truncated or corrupt race record at offset {start}") from None
+    return record, offset
+
+
+def append_race(path, record):
+    with open(path, "ab") as f:
+        f.write(encode_race(record))
+
+
+def _read_races(path):
+    # (最後の完全な記録までのリスト, 壊れていればその理由 or None)
+    with open(path, "rb") as f:
+        buf = f.read()
+    records = []
+    offset = 0
+    while offset < len(buf):
+        try:
+            record, offset = decode_race(buf, offset)
+        except ValueError as e:
+            return records, f"{path}: {e}"
+        records.append(record)
+    return records, None
+
+
+def load_races(path):
+    # 書き込み中に落ちて末尾が切れたファイルなどは、警告を出して最後の完全な記録までを返す
+    records, error = _read_races(path)
+    if error:
+        warnings.warn(f"{error}; ignoring the rest of the file", stacklevel=2)
+    return records
+
+
+def replay_engine(record):
+    # 記録からレースを作り直し、カウントダウン明け（最初の step の直前）まで進める
+    engine = RaceEngine(num_horses=len(record["stats"]), seed=record["seed"])
+    if engine.initial_stats != record["stats"] or engine.advantaged_type != record["advantaged_type"]:
+        raise ValueError(f"seed {record['seed']} does not reproduce the recorded stats")
+    engine.skip_to_start(record["start_tick"])
+    return engine
+
+
+def frame_at(record, tick):
+    # tick 回 step した後の全馬の位置
+    engine = replay_engine(record)
+    for _ in range(tick):
+        engine.step()
+    return [list(pos) for pos in engine.positions]
+
+
+def verify_race(record):
+    try:
+        engine = replay_engine(record)
+    except ValueError:
+        return False
+    return engine.run_to_finish() == record["results"]
+
+
+def verify_archive(paths, workers=None, chunksize=64):
+    # 複数ファイルの全レースを並列に再計算し、(レース数, 着順が合わないもの, 壊れたファイルの理由) を返す
+    # 壊れたファイルも読めた記録までは確かめる
+    records, corrupt = [], []
+    for path in paths:
+        races, error = _read_races(path)
+        records.extend((path, i, record) for i, record in enumerate(races))
+        if error:
+            corrupt.append(error)
+    with ProcessPoolExecutor(max_workers=workers, initializer=set_balance, initargs=(BALANCE,)) as pool:
+        oks = pool.map(verify_race, [r for _, _, r in records], chunksize=chunksize)
+        mismatches = [(path, i) for (path, i, _), ok in zip(records, oks) if not ok]
+    return len(records), mismatches, corrupt
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=".race ファイルの表示・検証")
+    sub = parser.add_subparsers(dest="command", required=True)
+    show = sub.add_parser("show")
+    show.add_argument("path")
+    verify = sub.add_parser("verify")
+    verify.add_argument("paths", nargs="+")
+    verify.add_argument("-j", "--workers", type=int, default=None)
+    args = parser.parse_args()
+    load_balance()
+
+    if args.command == "show":
+        for i, record in enumerate(load_races(args.path)):
+            order = " ".join(str(idx + 1) for idx in record["results"])
+            print(f"#{i} seed={record['seed']} start={record['start_tick']} "
+                  f"adv={record['advantaged_type']} order={order}")
+    else:
+        total, mismatches, corrupt = verify_archive(args.paths, args.workers)
+        for path, i in mismatches:
+            print(f"MISMATCH {path} #{i}")
+        for error in corrupt:
+            print(f"CORRUPT {error}")
+        print(f"{total - len(mismatches)}/{total} races verified")
+        sys.exit(1 if mismatches or corrupt else 0)
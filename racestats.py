@@ -0,0 +1,272 @@
+import argparse
+import json
+import math
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from race_engine import BALANCE, STRATEGIES, TICK_DT, load_balance, place_slots, set_balance
+
+# レースごとの集計（勝率・複勝率・着順と走破時間の平均/分散）を積み上げで持つ。
+# 1頭あたり決まった数のバケツを1回ずつ更新するだけなので、レースが何件溜まっても追加は定数時間。
+# 集計どうしは足し合わせられる（別プロセス・別マシンのスナップショットをまとめられる）
+SNAPSHOT_VERSION = 1
+STAMINA_BIN = 10        # 出走時スタミナ（50～100）の区切り
+BURST_BIN = 1.0         # 出走時バースト（有利補正込み）の区切り
+
+
+class Running:
+    """件数・平均・偏差平方和（Welford 法）。merge は Chan らの式で2つの集計をまとめる。"""
+
+    __slots__ = ("n", "mean", "m2")
+
+    def __init__(self, n=0, mean=0.0, m2=0.0):
+        self.n = n
+        self.mean = mean
+        self.m2 = m2
+
+    def add(self, x):
+        self.n += 1
+        d = x - self.mean
+        self.mean += d / self.n
+        self.m2 += d * (x - self.mean)
+
+    def merge(self, other):
+        if other.n == 0:
+            return
+        n = self.n + other.n
+        d = other.mean - self.mean
+        self.mean += d * other.n / n
+        self.m2 += other.m2 + d * d * self.n * other.n / n
+        self.n = n
+
+    @property
+    def variance(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else 0.0
+
+    @property
+    def stdev(self):
+        return math.sqrt(self.variance)
+
+
+class Bucket:
+    """1つの切り口（馬・作戦×有利戦術・スタミナ帯など）の出走数・1着数・複勝数と着順/走破時間。"""
+
+    __slots__ = ("starts", "wins", "places", "position", "time")
+
+    def __init__(self):
+        self.starts = 0
+        self.wins = 0
+        self.places = 0
+        self.position = Running()
+        self.time = Running()      # 走破時間（秒）。finish_ticks の無い記録では数えない
+
+    def add(self, place, slots, seconds):
+        self.starts += 1
+        self.wins += place == 1
+        self.places += place <= slots
+        self.position.add(place)
+        if seconds is not None:
+            self.time.add(seconds)
+
+    def merge(self, other):
+        self.starts += other.starts
+        self.wins += other.wins
+        self.places += other.places
+        self.position.merge(other.position)
+        self.time.merge(other.time)
+
+    def summary(self):
+        starts = self.starts
+        return {
+            "starts": starts,
+            "wins": self.wins,
+            "win_rate": self.wins / starts if starts else 0.0,
+            "place_rate": self.places / starts if starts else 0.0,
+            "mean_place": self.position.mean,
+            "place_sd": self.position.stdev,
+            "mean_time": self.time.mean if self.time.n else None,
+            "time_sd": self.time.stdev if self.time.n else None,
+        }
+
+    def to_list(self):
+        return [self.starts, self.wins, self.places,
+                [self.position.n, self.position.mean, self.position.m2],
+                [self.time.n, self.time.mean, self.time.m2]]
+
+    @classmethod
+    def from_list(cls, row):
+        bucket = cls()
+        bucket.starts, bucket.wins, bucket.places = row[0], row[1], row[2]
+        bucket.position = Running(*row[3])
+        bucket.time = Running(*row[4])
+        return bucket
+
+
+def stamina_band(stamina):
+    return int(stamina // STAMINA_BIN * STAMINA_BIN)
+
+
+def burst_band(burst):
+    return math.floor(burst / BURST_BIN) * BURST_BIN
+
+
+class RaceStats:
+    """終わったレースを add_race() で足していく集計。バケツのキーは次のタプル。
+
+    ("horse", 名前) / ("strategy", 作戦, 有利戦術) / ("stamina", 帯の下限) / ("burst", 帯の下限)
+    問い合わせは辞書を引いて数個のバケツをまとめるだけなので、描画ループから呼んでよい。
+    """
+
+    def __init__(self):
+        self.races = 0
+        self.buckets = {}
+
+    def bucket(self, key):
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = Bucket()
+        return bucket
+
+    def add_race(self, record, names=None):
+        # record は racefile.race_record() の形。names が無ければ馬ごとの集計は飛ばす
+        results = record["results"]
+        stats = record["stats"]
+        finish_ticks = record.get("finish_ticks")
+        advantaged = record["advantaged_type"]
+        slots = place_slots(len(results))
+        for place, idx in enumerate(results, start=1):
+            stat = stats[idx]
+            seconds = finish_ticks[place - 1] * TICK_DT if finish_ticks else None
+            if names is not None:
+                self.bucket(("horse", names[idx])).add(place, slots, seconds)
+            self.bucket(("strategy", stat["strategy"], advantaged)).add(place, slots, seconds)
+            self.bucket(("stamina", stamina_band(stat["stamina"]))).add(place, slots, seconds)
+            self.bucket(("burst", burst_band(stat["burst"]))).add(place, slots, seconds)
+        self.races += 1
+
+    def merge(self, other):
+        self.races += other.races
+        for key, bucket in other.buckets.items():
+            self.bucket(key).merge(bucket)
+        return self
+
+    def combined(self, keys):
+        total = Bucket()
+        for key in keys:
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                total.merge(bucket)
+        return total
+
+    # --- 問い合わせ ---
+
+    def horse(self, name):
+        return self.combined([("horse", name)]).summary()
+
+    def strategy(self, strategy, advantaged_type=None):
+        # advantaged_type=None なら有利戦術を問わず合計。作戦が有利のときだけなら advantaged_type=strategy
+        if advantaged_type is None:
+            keys = [("strategy", strategy, adv) for adv in STRATEGIES]
+        else:
+            keys = [("strategy", strategy, advantaged_type)]
+        return self.combined(keys).summary()
+
+    def stamina(self, stamina):
+        return self.combined([("stamina", stamina_band(stamina))]).summary()
+
+    def burst(self, burst):
+        return self.combined([("burst", burst_band(burst))]).summary()
+
+    # --- スナップショット ---
+
+    def to_dict(self):
+        return {
+            "version": SNAPSHOT_VERSION,
+            "races": self.races,
+            "buckets": [[list(key), bucket.to_list()] for key, bucket in self.buckets.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"unsupported stats snapshot version: {data.get('version')}")
+        stats = cls()
+        stats.races = data["races"]
+        stats.buckets = {tuple(key): Bucket.from_list(row) for key, row in data["buckets"]}
+        return stats
+
+    def save(self, path):
+        # 書きかけのファイルを読まないよう一時名で書いてから置き換える
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path):
+        # ファイルが無ければ空の集計から始める
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return cls()
+        return cls.from_dict(data)
+
+
+def _stats_for_archive(path):
+    # ワーカー側：.race を再計算して走破時間も含めた集計を返す（.race に名前は無いので馬ごとは無し）
+    import racefile
+    stats = RaceStats()
+    for record in racefile.load_races(path):
+        engine = racefile.replay_engine(record)
+        engine.run_to_finish()
+        stats.add_race(racefile.race_record(engine))
+    return stats.to_dict()
+
+
+def print_summary(stats):
+    print(f"{stats.races} races")
+    print("strategy  advantaged  starts  win    place  mean_place  mean_time")
+    for strategy in STRATEGIES:
+        for adv in STRATEGIES + [None]:
+            s = stats.strategy(strategy, adv)
+            if not s["starts"]:
+                continue
+            mean_time = f"{s['mean_time']:.2f}" if s["mean_time"] is not None else "-"
+            print(f"{strategy}      {adv or '計':<4}      {s['starts']:>6}  {s['win_rate']:.3f}  {s['place_rate']:.3f}"
+                  f"  {s['mean_place']:>6.2f}±{s['place_sd']:.2f}  {mean_time}")
+    for kind, label in (("horse", "horse"), ("stamina", "stamina"), ("burst", "burst")):
+        for key in sorted(k for k in stats.buckets if k[0] == kind):
+            s = stats.buckets[key].summary()
+            print(f"{label} {key[1]}: starts {s['starts']} win {s['win_rate']:.3f} "
+                  f"place {s['place_rate']:.3f} mean_place {s['mean_place']:.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="レース集計スナップショットの表示・結合・作成")
+    sub = parser.add_subparsers(dest="command", required=True)
+    show = sub.add_parser("show")
+    show.add_argument("path")
+    merge = sub.add_parser("merge")
+    merge.add_argument("out")
+    merge.add_argument("paths", nargs="+")
+    archive = sub.add_parser("archive", help=".race ファイルから集計を作る（ファイルごとに並列）")
+    archive.add_argument("out")
+    archive.add_argument("paths", nargs="+")
+    archive.add_argument("-j", "--workers", type=int, default=None)
+    args = parser.parse_args()
+    load_balance()
+
+    if args.command == "show":
+        print_summary(RaceStats.load(args.path))
+        sys.exit(0)
+    total = RaceStats()
+    if args.command == "merge":
+        for path in args.paths:
+            total.merge(RaceStats.load(path))
+    else:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=set_balance, initargs=(BALANCE,)) as pool:
+            for part in pool.map(_stats_for_archive, args.paths):
+                total.merge(RaceStats.from_dict(part))
+    total.save(args.out)
+    print(f"wrote {args.out} ({total.races} races, {len(total.buckets)} buckets)")
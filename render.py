@@ -0,0 +1,267 @@
+import math
+import weakref
+from collections import deque
+
+import pygame
+
+from race_engine import TICK_DT
+
+# 描画解像度の段階（画面に対する倍率）。いちばん重い端末でも最低の段で 60fps に収める
+RENDER_SCALES = (0.5, 0.75, 1.0)
+
+
+class ScaleCache:
+    """画像の倍率ごとの縮小版。
+
+    元の Surface をキーに弱参照で持つので、テキストキャッシュから追い出された文字列の
+    縮小版も一緒に消える。縮小は1つの画像・倍率につき1回だけ（smoothscale）。
+    """
+
+    def __init__(self):
+        self.levels = {}
+        self.misses = 0
+
+    def get(self, surface, scale):
+        table = self.levels.setdefault(scale, weakref.WeakKeyDictionary())
+        scaled = table.get(surface)
+        if scaled is None:
+            w, h = surface.get_size()
+            size = (max(1, round(w * scale)), max(1, round(h * scale)))
+            if surface.get_bitsize() >= 24:
+                scaled = pygame.transform.smoothscale(surface, size)
+            else:
+                scaled = pygame.transform.scale(surface, size)
+            table[surface] = scaled
+            self.misses += 1
+        # 透明度は描く側が毎フレーム変えることがある（タイトルのフェード）
+        alpha = surface.get_alpha()
+        if scaled.get_alpha() != alpha:
+            scaled.set_alpha(alpha)
+        return scaled
+
+    def prescale(self, surfaces, scales):
+        # 起動時に縮小しておく（段を切り替えた最初のフレームで詰まらないように）
+        for scale in scales:
+            if scale != 1:
+                for surface in surfaces:
+                    self.get(surface, scale)
+
+
+class ScaledCanvas:
+    """論理座標（画面の大きさ）のまま描ける描画先。
+
+    scale が 1 のときは画面（または同じ大きさのオフスクリーン）にそのまま描く。
+    1 未満のときは縮小した面に、縮小済みの画像を座標だけ換算して描く。縮小した面は
+    resize_display なら画面そのもの（ブラウザ版：キャンバスは CSS で引き伸ばされるので拡大は
+    ブラウザが GPU でする）、そうでなければオフスクリーンで、present() で画面の大きさに1回拡大する。
+    blit() は論理座標の矩形を返す（差分矩形やレイアウトはそのまま使える）。
+    """
+
+    def __init__(self, size, scale=1.0, cache=None, display=None, resize_display=False):
+        self.size = size
+        self.rect = pygame.Rect((0, 0), size)
+        self.cache = cache if cache is not None else ScaleCache()
+        self.display = display
+        self.resize_display = resize_display
+        self.scale = None
+        self.set_scale(scale)
+
+    def set_scale(self, scale):
+        if scale == self.scale:
+            return
+        self.scale = scale
+        w, h = self.size
+        size = (round(w * scale), round(h * scale))
+        if self.display is None:
+            self.surface = pygame.Surface(size).convert()
+        elif self.resize_display:
+            if self.display.get_size() != size:
+                self.display = pygame.display.set_mode(size)
+            self.surface = self.display
+        elif scale == 1:
+            self.surface = self.display
+        else:
+            self.surface = pygame.Surface(size).convert()
+
+    def layer(self):
+        # 同じ倍率・キャッシュの描画先（静的層など。画面には出さない）
+        return ScaledCanvas(self.size, self.scale, self.cache)
+
+    def get_size(self):
+        return self.size
+
+    def get_width(self):
+        return self.size[0]
+
+    def get_height(self):
+        return self.size[1]
+
+    def physical_rect(self, rect):
+        # 論理座標の矩形を覆う、縮小後の矩形
+        s = self.scale
+        x0, y0 = math.floor(rect[0] * s), math.floor(rect[1] * s)
+        x1, y1 = math.ceil((rect[0] + rect[2]) * s), math.ceil((rect[1] + rect[3]) * s)
+        return pygame.Rect(x0, y0, x1 - x0, y1 - y0)
+
+    def fill(self, color, rect=None):
+        if rect is not None and self.scale != 1:
+            rect = self.physical_rect(rect)
+        self.surface.fill(color, rect)
+
+    def blit(self, source, pos, area=None):
+        if isinstance(source, ScaledCanvas):
+            image = source.surface        # 同じ倍率の層
+        elif self.scale == 1:
+            image = source
+        else:
+            image = self.cache.get(source, self.scale)
+        if self.scale == 1:
+            return self.surface.blit(image, pos, area)
+        s = self.scale
+        self.surface.blit(image, (math.floor(pos[0] * s), math.floor(pos[1] * s)),
+                          None if area is None else self.physical_rect(area))
+        # 縮小後の丸めで 1px はみ出しても差分矩形で消し残さないよう、少し大きめに返す
+        w, h = source.get_size() if area is None else (area[2], area[3])
+        return pygame.Rect(math.floor(pos[0]), math.floor(pos[1]), w + 2, h + 2).clip(self.rect)
+
+    def draw_rect(self, color, rect, width=0):
+        if self.scale != 1:
+            rect = self.physical_rect(rect)
+            width = max(1, round(width * self.scale)) if width else 0
+        pygame.draw.rect(self.surface, color, rect, width)
+
+    def present(self, rects=None):
+        # 画面へ転送。rects があればその部分だけ（オフスクリーンから拡大するときは全面）
+        if self.surface is not self.display:
+            pygame.transform.scale(self.surface, self.size, self.display)
+            pygame.display.flip()
+        elif rects is None:
+            pygame.display.flip()
+        elif self.scale == 1:
+            pygame.display.update(rects)
+        else:
+            pygame.display.update([self.physical_rect(rect) for rect in rects])
+
+
+class ScaleController:
+    """描画時間を見て描画解像度の段を上げ下げする。
+
+    直近 window フレームの描画時間の中央値が予算（1フレームの budget 割合）を超えたら1段下げ、
+    1段上げても（時間は画素数に比例すると見積もって）予算の headroom 割合に収まりそうなら1段上げる。
+    段を変えた後の cooldown フレームは様子を見る。下げても min_gain 倍より速くならなかった
+    （画素数でなく馬の数などで重い、拡大の手間の方が大きい）ときは戻して、以後その段より下げない。
+    速い端末では最初の等倍のまま動かない。
+    """
+
+    def __init__(self, scales=RENDER_SCALES, frame_dt=TICK_DT, budget=0.75, headroom=0.6,
+                 window=30, cooldown=120, min_gain=0.85):
+        self.scales = scales
+        self.level = len(scales) - 1
+        self.floor = 0
+        self.limit = frame_dt * budget
+        self.headroom = headroom
+        self.min_gain = min_gain
+        self.samples = deque(maxlen=window)
+        self.cooldown = cooldown
+        self.wait = 0
+        self.trial = None           # 下げる前の (段, 描画時間)
+        self.changes = 0
+
+    @property
+    def scale(self):
+        return self.scales[self.level]
+
+    def record(self, seconds):
+        # 1フレーム分の描画時間を入れる。段を変えたら新しい倍率を返す
+        self.samples.append(seconds)
+        if self.wait:
+            self.wait -= 1
+            return None
+        if len(self.samples) < self.samples.maxlen:
+            return None
+        cost = sorted(self.samples)[len(self.samples) // 2]
+        level = self.level
+        if self.trial is not None:
+            before_level, before_cost = self.trial
+            self.trial = None
+            if cost > before_cost * self.min_gain:
+                self.floor = before_level
+                return self._set(before_level)
+        if cost > self.limit and level > self.floor:
+            self.trial = (level, cost)
+            return self._set(level - 1)
+        if level < len(self.scales) - 1:
+            ratio = (self.scales[level + 1] / self.scales[level]) ** 2
+            if cost * ratio < self.limit * self.headroom:
+                return self._set(level + 1)
+        return None
+
+    def _set(self, level):
+        self.level = level
+        self.samples.clear()
+        self.wait = self.cooldown
+        self.changes += 1
+        return self.scale
+
+
+class DirtyRenderer:
+    """差分矩形描画。
+
+    動かない層（背景・順位表・結果パネルなど）は static_key が変わったときだけ
+    オフスクリーンに描き直し、動くもの（スプライト・演出テキスト）は blit() 経由で
+    描いて矩形を記録する。次のフレームでは前回の矩形だけ静的層から復元し、
+    pygame.display.update(rects) で変わった部分だけ転送する。
+    背景がスクロールするフレームは begin_full() で全面描き直しにする。
+    screen は ScaledCanvas（縮小描画中は転送が毎回全面になる）。
+    """
+
+    def __init__(self, screen):
+        self.screen = screen
+        self.static_layer = screen.layer()
+        self.static_key = None
+        self.full = True
+        self.prev_rects = []
+        self.rects = []
+
+    def invalidate(self):
+        self.static_key = None
+
+    def rescale(self):
+        # 描画先の倍率が変わったら静的層を作り直す
+        self.static_layer = self.screen.layer()
+        self.static_key = None
+        self.prev_rects = []
+
+    def begin_full(self):
+        # 呼び出し側が screen に全部描く
+        self.static_key = None
+        self.full = True
+        self.rects = []
+
+    def begin(self, static_key, draw_static):
+        if static_key != self.static_key:
+            draw_static(self.static_layer)
+            self.screen.blit(self.static_layer, (0, 0))
+            self.static_key = static_key
+            self.full = True
+        else:
+            # 前フレームで動くものを描いた所だけ静的層で消す
+            for rect in self.prev_rects:
+                self.screen.blit(self.static_layer, rect, rect)
+            self.full = False
+        self.rects = []
+
+    def blit(self, surface, pos):
+        rect = self.screen.blit(surface, pos)
+        self.rects.append(rect)
+        return rect
+
+    def end(self):
+        if self.full:
+            self.screen.present()
+        else:
+            changed = self.prev_rects + self.rects
+            if changed:
+                self.screen.present(changed)
+        self.prev_rects = self.rects
+        return self.full
@@ -0,0 +1,207 @@
+from array import array
+
+# 全レース記録の量子化（1/16px 単位）
+POSITION_SCALE = 16
+MAX_RECORD_TICKS = 60 * 120     # 2分で打ち切り（メモリ上限を固定するため）
+KEYFRAME_INTERVAL = 60          # このティックごとに差分を切って絶対値から書き直す
+
+# リプレイ再生速度の段階
+REPLAY_SPEEDS = [0.25, 0.5, 1.0, 2.0, 4.0, 8.0]
+
+
+class FrameRing:
+    """直近 capacity フレームを持つ固定長リングバッファ（float32 × 頭数）。"""
+
+    def __init__(self, capacity, num_horses):
+        self.capacity = capacity
+        self.num_horses = num_horses
+        self.buf = array("f", bytes(4 * capacity * num_horses))
+        self.view = memoryview(self.buf)
+        self.head = 0     # 次に書き込む行
+        self.count = 0
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
+
+    def append(self, xs):
+        n = self.num_horses
+        base = self.head * n
+        buf = self.buf
+        for k, x in enumerate(xs):
+            buf[base + k] = x
+        self.head = (self.head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, k):
+        # k 番目に古いフレーム（コピーせず memoryview の行を返す）
+        if k < 0:
+            k += self.count
+        if not 0 <= k < self.count:
+            raise IndexError(k)
+        row = (self.head - self.count + k) % self.capacity
+        n = self.num_horses
+        return self.view[row*n:(row + 1)*n]
+
+    @property
+    def nbytes(self):
+        return self.buf.itemsize * len(self.buf)
+
+
+def _zigzag(v):
+    return (v << 1) ^ (v >> 63)
+
+
+def _unzigzag(u):
+    return (u >> 1) ^ -(u & 1)
+
+
+class RaceRecorder:
+    """全ティックの位置を量子化＋差分＋可変長整数で詰めて記録する。
+
+    KEYFRAME_INTERVAL ごとに差分の基準を 0 に戻し、そのバイト位置を keyframes に
+    控えるので、任意のティックへは最寄りのキーフレームから読めばよい。
+    """
+
+    def __init__(self, num_horses, max_ticks=MAX_RECORD_TICKS):
+        self.num_horses = num_horses
+        self.max_ticks = max_ticks
+        self.clear()
+
+    def clear(self):
+        self.data = bytearray()
+        self.keyframes = array("I")   # キーフレームごとの data 内の開始位置
+        self.ticks = 0
+        self.truncated = False
+        self._last = [0] * self.num_horses
+        # 順再生用のデコード位置
+        self._cursor_tick = 0
+        self._cursor_pos = 0
+        self._cursor_frame = [0] * self.num_horses
+
+    def record(self, xs):
+        if self.ticks >= self.max_ticks:
+            self.truncated = True
+            return
+        data = self.data
+        if self.ticks % KEYFRAME_INTERVAL == 0:
+            self.keyframes.append(len(data))
+            self._last = [0] * self.num_horses
+        last = self._last
+        for k, x in enumerate(xs):
+            q = round(x * POSITION_SCALE)
+            u = _zigzag(q - last[k])
+            last[k] = q
+            while u >= 0x80:
+                data.append((u & 0x7F) | 0x80)
+                u >>= 7
+            data.append(u)
+        self.ticks += 1
+
+    def __len__(self):
+        return self.ticks
+
+    def __getitem__(self, k):
+        # 順再生ならデコード済みの続きから、離れた位置へは k を含む区間のキーフレームから読む
+        if k < 0:
+            k += self.ticks
+        if not 0 <= k < self.ticks:
+            raise IndexError(k)
+        key = k - k % KEYFRAME_INTERVAL
+        if not key < self._cursor_tick <= k + 1:
+            self._cursor_tick = key
+            self._cursor_pos = self.keyframes[key // KEYFRAME_INTERVAL]
+            self._cursor_frame = [0] * self.num_horses
+        while self._cursor_tick <= k:
+            self._decode_next()
+        return [q / POSITION_SCALE for q in self._cursor_frame]
+
+    def _decode_next(self):
+        data = self.data
+        pos = self._cursor_pos
+        frame = self._cursor_frame
+        for k in range(self.num_horses):
+            u = 0
+            shift = 0
+            while True:
+                b = data[pos]
+                pos += 1
+                u |= (b & 0x7F) << shift
+                if b < 0x80:
+                    break
+                shift += 7
+            frame[k] += _unzigzag(u)
+        self._cursor_pos = pos
+        self._cursor_tick += 1
+
+    @property
+    def nbytes(self):
+        return len(self.data) + self.keyframes.itemsize * len(self.keyframes)
+
+
+class ReplayPlayer:
+    """フレーム列（FrameRing / RaceRecorder）を可変速で再生・シークする。"""
+
+    def __init__(self, frames, speed=0.5):
+        self.frames = frames
+        self.position = 0.0      # 小数のフレーム位置（間は補間して描く）
+        self.speed = speed
+        self.paused = False
+        self._cache = {}
+
+    def __len__(self):
+        return len(self.frames)
+
+    @property
+    def done(self):
+        return self.position > len(self.frames) - 1
+
+    def _frame(self, i):
+        # 補間で前後2フレームを毎回引くので直近だけ覚えておく
+        frame = self._cache.get(i)
+        if frame is None:
+            if len(self._cache) >= 4:
+                self._cache.clear()
+            frame = self._cache[i] = list(self.frames[i])
+        return frame
+
+    def frame(self):
+        last = len(self.frames) - 1
+        pos = min(max(self.position, 0.0), last)
+        i0 = int(pos)
+        frac = pos - i0
+        a = self._frame(i0)
+        if frac == 0.0 or i0 >= last:
+            return a
+        b = self._frame(i0 + 1)
+        return [x0 + (x1 - x0) * frac for x0, x1 in zip(a, b)]
+
+    def update(self):
+        if not self.paused:
+            self.position += self.speed
+
+    def seek(self, tick):
+        self.position = float(min(max(tick, 0), len(self.frames) - 1))
+
+    def seek_by(self, ticks):
+        self.seek(self.position + ticks)
+
+    def step_frames(self, n):
+        # コマ送り（一時停止にして整数フレームへ）
+        self.paused = True
+        self.seek(int(self.position) + n)
+
+    def toggle_pause(self):
+        self.paused = not self.paused
+
+    def faster(self):
+        i = REPLAY_SPEEDS.index(self.speed) if self.speed in REPLAY_SPEEDS else 1
+        self.speed = REPLAY_SPEEDS[min(i + 1, len(REPLAY_SPEEDS) - 1)]
+
+    def slower(self):
+        i = REPLAY_SPEEDS.index(self.speed) if self.speed in REPLAY_SPEEDS else 1
+        self.speed = REPLAY_SPEEDS[max(i - 1, 0)]
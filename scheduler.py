@@ -0,0 +1,59 @@
+import asyncio
+import time
+
+from race_engine import TICK_DT
+
+# 描画が止まっていた（タブが裏に回った等）ときに取り戻す上限。これを超えた分は捨てる
+MAX_CATCHUP_TICKS = 15
+
+
+class FrameScheduler:
+    """シミュレーションは固定ティック、描画はホストが回せる頻度で行う。
+
+    wait() で経過した実時間を貯め、tick() が True を返すたびに 1 ティック分取り出す。
+    描画が重くて間に合わないときは 1 回の描画の前に複数ティック進むので、
+    描画フレームが間引かれるだけでレースの速さは変わらない。
+    alpha は次のティックまでの端数（0～1）で、描画側の補間に使う。
+    speed を上げると実時間 1 秒あたりのティック数がその倍になる（早送り）。
+    """
+
+    def __init__(self, tick_dt=TICK_DT, frame_dt=TICK_DT, max_catchup=MAX_CATCHUP_TICKS, clock=time.perf_counter):
+        self.tick_dt = tick_dt
+        self.frame_dt = frame_dt      # 描画の最短間隔（早送り中も描画は増やさない）
+        self.max_catchup = max_catchup
+        self.clock = clock
+        self.last = clock()
+        self.accumulator = 0.0
+        self.speed = 1
+        self.ticks = 0
+        self.renders = 0
+        self.dropped = 0
+
+    def tick(self):
+        # 浮動小数の誤差で 1 ティック分に僅かに足りず止まらないよう少し甘く比べる
+        if self.accumulator >= self.tick_dt - 1e-9:
+            self.accumulator -= self.tick_dt
+            self.ticks += 1
+            return True
+        return False
+
+    @property
+    def alpha(self):
+        return min(max(self.accumulator / self.tick_dt, 0.0), 1.0)
+
+    async def wait(self):
+        # 描画1回ごとに呼ぶ。次のティックの時刻（早いときは次の描画の時刻）まで寝てから経過時間を貯める
+        self.renders += 1
+        due = max((self.tick_dt - self.accumulator) / self.speed, self.frame_dt)
+        await asyncio.sleep(max(due - (self.clock() - self.last), 0))
+        self.catch_up()
+
+    def catch_up(self):
+        # 前回からの経過時間を貯める（wait() を通らずに寝ていた後、例えば待機画面で入力を待った後にも呼ぶ）
+        now = self.clock()
+        self.accumulator += (now - self.last) * self.speed
+        self.last = now
+        limit = self.max_catchup * self.tick_dt * self.speed
+        if self.accumulator > limit:
+            self.dropped += int((self.accumulator - limit) / self.tick_dt)
+            self.accumulator = limit
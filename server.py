@@ -0,0 +1,323 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import random
+import struct
+
+from race_engine import COUNTDOWN_FRAMES, load_balance, opening_frames
+from scheduler import FrameScheduler
+from track import RaceTrack, RESULT_ROWS, RESULT_ROW_TICKS, field_names
+from wire import StateEncoder, OPENING, WAITING, COUNTDOWN, RACING, REPLAY, PHOTO, RESULTS
+
+# ヘッドレスのレースサーバー：1プロセス・1つの asyncio ループで複数コースを固定ティックで進め、
+# 観戦クライアントへ WebSocket でティックごとの状態を送る（描画も pygame も使わない）
+#   python server.py [--tracks 24] [--horses 5] [--host 127.0.0.1] [--port 8765]
+#   ws://host:port/tracks/<コース番号> に接続すると、そのコースの状態が流れてくる
+# 中身は wire.py の形式のバイナリフレーム（接続直後とレースごとにキーフレーム、あとはティックごとの差分）
+
+WAIT_TICKS = 300            # 待機画面の長さ（Sキーを押す人はいないので時間で走り出す）
+RESULT_HOLD_TICKS = 300     # 結果を出し切ってから次のレースまで
+MAX_BUFFERED = 64 * 1024    # 観戦側の受信が追いつかずこれ以上溜まったら、そのティックは送らない
+MAX_CLIENT_FRAME = 4096     # 観戦者から受け取るフレームの上限（来るのは ping と close だけ）
+
+WS_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+OP_TEXT, OP_BINARY, OP_CLOSE, OP_PING, OP_PONG = 0x1, 0x2, 0x8, 0x9, 0xA
+
+
+def ws_frame(payload, opcode=OP_BINARY):
+    # サーバーから送るフレーム（マスクなし・分割なし）
+    n = len(payload)
+    if n < 126:
+        head = struct.pack("!BB", 0x80 | opcode, n)
+    elif n < 1 << 16:
+        head = struct.pack("!BBH", 0x80 | opcode, 126, n)
+    else:
+        head = struct.pack("!BBQ", 0x80 | opcode, 127, n)
+    return head + payload
+
+
+async def read_ws_frame(reader, max_size=None):
+    # 1フレーム読んで (opcode, payload)。クライアントからのフレームはマスクされている
+    # max_size を超える長さが来たら、中身を読む前に ConnectionError
+    b0, b1 = await reader.readexactly(2)
+    n = b1 & 0x7F
+    if n == 126:
+        n = struct.unpack("!H", await reader.readexactly(2))[0]
+    elif n == 127:
+        n = struct.unpack("!Q", await reader.readexactly(8))[0]
+    if max_size is not None and n > max_size:
+        raise ConnectionError(f"websocket frame too large: {n} bytes")
+    mask = await reader.readexactly(4) if b1 & 0x80 else None
+    payload = await reader.readexactly(n)
+    if mask:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return b0 & 0x0F, payload
+
+
+class TrackHost:
+    """サーバー上の1コース。レースを自動で繰り返し、観戦者にティックごとの状態を送る。
+
+    opening=False なら入場・紹介・待機・カウントダウンを飛ばして（時計だけ進めて）すぐ走る。
+    観戦者がいない間は差分を作らず、次に誰かが繋いだときに基準を作り直す。
+    """
+
+    def __init__(self, track_id, num_horses, seed=None, opening=True,
+                 wait_ticks=WAIT_TICKS, hold_ticks=RESULT_HOLD_TICKS):
+        self.track_id = track_id
+        self.num_horses = num_horses
+        self.names, self.colors = field_names(num_horses)
+        self.rng = random.Random(seed)
+        self.opening = opening
+        self.wait_ticks = wait_ticks
+        self.hold_ticks = hold_ticks
+        self.track = RaceTrack(num_horses)
+        self.encoder = StateEncoder(num_horses)
+        self.viewers = set()
+        self.pending = set()      # 次のティックでキーフレームを送る観戦者（受信が遅れて差分を飛ばした人）
+        self.stale = True         # encoder の基準が今の状態より古い
+        self.race = 0
+        self.sent = 0
+        self.skipped = 0
+        self.start_race()
+
+    def start_race(self):
+        track = self.track
+        engine = track.engine
+        track.reset(self.rng.getrandbits(32))
+        self.race += 1
+        self.ticks = 0            # このレースで進めたティック数（ストリームの通し番号）
+        self.phase = OPENING
+        self.phase_ticks = 0
+        if not self.opening:
+            engine.skip_opening()
+            self.phase = RACING
+        self.setup = {
+            "race": self.race,
+            "seed": engine.seed,
+            "advantaged_type": engine.advantaged_type,
+            "names": self.names,
+            "colors": self.colors,
+            "strategies": [stat["strategy"] for stat in engine.initial_stats],
+        }
+        self.stale = True
+        if self.viewers:
+            self.sync()
+            frame = ws_frame(self.encoder.keyframe())
+            for writer in self.viewers:
+                if not writer.is_closing():
+                    writer.write(frame)
+            self.pending.clear()
+
+    def tick(self):
+        track = self.track
+        engine = track.engine
+        # フェーズの切り替えは前のティックまでの長さで決め、このティックは新しいフェーズとして進める
+        # phase_ticks は切り替えたティックを 0 と数える（wire と同じ）ので、切り替えで入ったフェーズの
+        # それまでの長さは phase_ticks + 1（待機・カウントダウンを RaceEngine.skip_opening と同じ長さにする）
+        phase = self.phase
+        if phase == OPENING and self.phase_ticks >= opening_frames(self.num_horses):
+            phase = WAITING
+        elif phase == WAITING and self.phase_ticks + 1 >= self.wait_ticks:
+            engine.start()
+            phase = COUNTDOWN
+        elif phase == COUNTDOWN and self.phase_ticks + 1 >= COUNTDOWN_FRAMES:
+            phase = RACING
+        elif phase == RESULTS and self.phase_ticks >= self.num_result_ticks() + self.hold_ticks:
+            self.start_race()
+            return
+
+        if phase < RACING:
+            engine.idle()
+        else:
+            track.update()
+            if track.finished:
+                phase = RESULTS
+            elif track.replay_mode:
+                phase = PHOTO if track.replay_player.done else REPLAY
+        self.ticks += 1
+        if phase == self.phase:
+            self.phase_ticks += 1
+        else:
+            self.phase, self.phase_ticks = phase, 0
+
+        if self.viewers:
+            self.broadcast()
+        else:
+            self.stale = True
+
+    def num_result_ticks(self):
+        # 結果を全行出し切るまでのティック数（RaceTrack.update の1行ずつ表示と同じ）
+        return min(self.num_horses, RESULT_ROWS) * RESULT_ROW_TICKS
+
+    def state(self):
+        # (ティック数, フェーズ, x, 順位, ゴール線 x, 背景 x)。リプレイ中の x は再生中のフレーム
+        track = self.track
+        engine = track.engine
+        if self.phase == REPLAY:
+            xs = track.replay_player.frame()
+        else:
+            xs = [pos[0] for pos in engine.positions]
+        # ゴール後は確定順位、それまでは位置順
+        order = engine.results if engine.all_finished else engine.order
+        return self.ticks, self.phase, xs, order, engine.goal_line_x, track.bg_x
+
+    def sync(self):
+        # 差分を作っていなかった間の分、基準を今の状態に置き換える
+        frames, phase, xs, order, goal_x, bg_x = self.state()
+        self.encoder.reset(self.setup, frames, phase, self.phase_ticks, xs, order, goal_x, bg_x)
+        self.stale = False
+
+    def join(self, writer):
+        if self.stale:
+            self.sync()
+        writer.write(ws_frame(self.encoder.keyframe()))
+        self.viewers.add(writer)
+
+    def leave(self, writer):
+        self.viewers.discard(writer)
+        self.pending.discard(writer)
+
+    def broadcast(self):
+        if self.stale:
+            self.sync()
+            self.pending.update(self.viewers)
+            delta = None
+        else:
+            delta = ws_frame(self.encoder.update(*self.state()))
+        keyframe = None
+        for writer in self.viewers:
+            if writer.is_closing():
+                continue      # 切れた接続は受信タスクが viewers から外す
+            # 受信が遅い観戦者にはこのティックを飛ばし、追いついたらキーフレームから送り直す
+            if writer.transport.get_write_buffer_size() > MAX_BUFFERED:
+                self.pending.add(writer)
+                self.skipped += 1
+                continue
+            if writer in self.pending or delta is None:
+                if keyframe is None:
+                    keyframe = ws_frame(self.encoder.keyframe())
+                writer.write(keyframe)
+                self.pending.discard(writer)
+            else:
+                writer.write(delta)
+            self.sent += 1
+
+
+class RaceServer:
+    """複数の TrackHost を1つの FrameScheduler で進め、WebSocket の接続を受ける。"""
+
+    def __init__(self, num_tracks, num_horses=5, seed=None, **host_options):
+        rng = random.Random(seed)
+        self.hosts = [TrackHost(i, num_horses, rng.getrandbits(32), **host_options) for i in range(num_tracks)]
+        self.scheduler = FrameScheduler()
+        self.server = None
+        self.clients = set()      # 接続ごとの受信タスク
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        self.server = await asyncio.start_server(self.handle_client, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def run(self, duration=None):
+        # duration 秒（None なら止めるまで）ティックを回す。描画は無いので wait は次のティックまで寝るだけ
+        scheduler = self.scheduler
+        scheduler.last = scheduler.clock()
+        end = None if duration is None else scheduler.last + duration
+        hosts = self.hosts
+        while end is None or scheduler.last < end:
+            while scheduler.tick():
+                for host in hosts:
+                    host.tick()
+            await scheduler.wait()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for host in self.hosts:
+            for writer in list(host.viewers):
+                writer.close()
+            host.viewers.clear()
+        # 切断に気づいた受信タスクが終わるのを待つ
+        await asyncio.gather(*self.clients, return_exceptions=True)
+
+    async def handle_client(self, reader, writer):
+        try:
+            request = await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            writer.close()
+            return
+        lines = request.decode("latin-1").split("\r\n")
+        parts = lines[0].split()
+        headers = dict(line.split(":", 1) for line in lines[1:] if ":" in line)
+        headers = {k.strip().lower(): v.strip() for k, v in headers.items()}
+        host = self.lookup(parts[1] if len(parts) > 1 else "")
+        key = headers.get("sec-websocket-key")
+        if host is None or key is None:
+            writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n")
+            await writer.drain()
+            writer.close()
+            return
+        accept = base64.b64encode(hashlib.sha1(key.encode() + WS_GUID).digest()).decode()
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+        host.join(writer)
+        self.clients.add(asyncio.current_task())
+        try:
+            # 観戦者からは ping と close しか来ない想定
+            while True:
+                opcode, payload = await read_ws_frame(reader, MAX_CLIENT_FRAME)
+                if opcode == OP_CLOSE:
+                    writer.write(ws_frame(payload[:2], OP_CLOSE))
+                    break
+                if opcode == OP_PING:
+                    writer.write(ws_frame(payload, OP_PONG))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            host.leave(writer)
+            self.clients.discard(asyncio.current_task())
+            writer.close()
+
+    def lookup(self, path):
+        # "/tracks/<番号>" → TrackHost
+        prefix = "/tracks/"
+        if not path.startswith(prefix) or not path[len(prefix):].isdigit():
+            return None
+        track_id = int(path[len(prefix):])
+        return self.hosts[track_id] if track_id < len(self.hosts) else None
+
+
+async def open_viewer(host, port, track_id):
+    # 観戦クライアント（ベンチマーク・動作確認用）。ハンドシェイクまで済ませた (reader, writer) を返す
+    reader, writer = await asyncio.open_connection(host, port)
+    key = base64.b64encode(random.randbytes(16)).decode()
+    writer.write((f"GET /tracks/{track_id} HTTP/1.1\r\nHost: {host}:{port}\r\nUpgrade: websocket\r\n"
+                  f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n").encode())
+    response = await reader.readuntil(b"\r\n\r\n")
+    if not response.startswith(b"HTTP/1.1 101"):
+        writer.close()
+        raise ConnectionError(response.split(b"\r\n", 1)[0].decode("latin-1"))
+    return reader, writer
+
+
+async def _serve_forever(args):
+    server = RaceServer(args.tracks, args.horses, seed=args.seed)
+    port = await server.serve(args.host, args.port)
+    print(f"{args.tracks} tracks x {args.horses} horses on ws://{args.host}:{port}/tracks/<0-{args.tracks - 1}>")
+    await server.run()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ヘッドレスのレースサーバー")
+    parser.add_argument("--tracks", type=int, default=24)
+    parser.add_argument("--horses", type=int, default=5)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    load_balance()
+    try:
+        asyncio.run(_serve_forever(args))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from batch_sim import RaceBatch  # noqa: E402
+from race_engine import RaceEngine  # noqa: E402
+
+
+@pytest.mark.parametrize("num_horses", [5, 6, 50])
+def test_start_time_matches_engine(num_horses):
+    # 紹介スライドは5頭で打ち止め（opening_frames）。6頭以上でも RaceEngine と同じ時計で走り出す
+    engine = RaceEngine(num_horses, seed=1)
+    engine.skip_opening()
+    batch = RaceBatch(4, num_horses, seed=1)
+    assert batch.start_time == engine.start_time
+    assert batch.clock == engine.clock
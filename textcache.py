@@ -0,0 +1,49 @@
+from collections import OrderedDict
+
+
+class TextCache:
+    """文字列描画の LRU キャッシュ。キーは (文字列, フォントサイズ, 色, アンチエイリアス)。
+
+    返す Surface は共有なので呼び出し側で書き換えないこと。
+    """
+
+    def __init__(self, get_font, max_entries=512, max_bytes=32 * 1024 * 1024):
+        self.get_font = get_font
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def render(self, text, size, color=(0, 0, 0), antialias=True):
+        key = (text, size, tuple(color), antialias)
+        surface = self.entries.get(key)
+        if surface is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return surface
+
+        self.misses += 1
+        surface = self.get_font(size).render(text, antialias, color)
+        self.entries[key] = surface
+        self.nbytes += surface.get_bytesize() * surface.get_width() * surface.get_height()
+        while len(self.entries) > self.max_entries or (self.nbytes > self.max_bytes and len(self.entries) > 1):
+            _, old = self.entries.popitem(last=False)
+            self.nbytes -= old.get_bytesize() * old.get_width() * old.get_height()
+            self.evictions += 1
+        return surface
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "bytes": self.nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,360 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import racefile
+from race_engine import BALANCE, RaceEngine, load_balance, set_balance
+from racestats import RaceStats
+from track import field_names
+
+# シーズン：予選ラウンドを何周も回し、勝ち点上位で準決勝・決勝を行う（画面なし）。
+# 1レースはゲームと同じく RaceEngine.reset(シード) → skip_opening() → 全馬ゴールまで step。
+# 1周目は抽選、2周目からは勝ち点の近い馬どうしで組む（スイス式）。各ラウンドの組み合わせと
+# シードはシーズンのシードと勝ち点だけで決まるので、チェックポイントから再開しても同じレースになる。
+#   python tournament.py season.json [--roster 500] [--rounds 200] [--seed 1]
+#                                    [--history race_history.db] [--archive season.race] [--stats race_stats.json]
+# season.json が既にあれば続きから回す（組み合わせ・出力先は最初に決めたもの）
+CHECKPOINT_VERSION = 1
+HEAT_SIZE = 5
+POINTS = [10, 6, 4, 2, 1]     # 着順ごとの勝ち点（6着以下は 0）
+BATCH_HEATS = 256             # 1回ワーカーに渡すレース数の上限
+CHECKPOINT_SECONDS = 10.0
+PROGRESS_SECONDS = 2.0
+
+_engines = {}                 # ワーカーごとに頭数別の RaceEngine を使い回す
+
+
+def heat_seed(season_seed, stage, index):
+    # 文字列のシードは random のバージョン2で決まった値になる
+    return random.Random(f"{season_seed}:{stage}:{index}").getrandbits(32)
+
+
+def split_heats(order, heat_size):
+    # 並び順のまま、なるべく同じ頭数の組に分ける
+    count = max(1, -(-len(order) // heat_size))
+    size, extra = divmod(len(order), count)
+    heats = []
+    pos = 0
+    for k in range(count):
+        n = size + (k < extra)
+        heats.append(order[pos:pos + n])
+        pos += n
+    return heats
+
+
+def run_heats(seeds, sizes):
+    # ワーカー側：各レースを最後まで走らせて racefile.race_record の形で返す
+    records = []
+    for seed, n in zip(seeds, sizes):
+        engine = _engines.get(n)
+        if engine is None:
+            engine = _engines[n] = RaceEngine(num_horses=n)
+        engine.reset(seed)
+        engine.skip_opening()
+        engine.run_to_finish()
+        record = racefile.race_record(engine)
+        record["race_ticks"] = engine.tick_count
+        record["race_seconds"] = engine.elapsed
+        records.append(record)
+    return records
+
+
+class Season:
+    """シーズン全体の状態。to_dict() をそのままチェックポイントに書く。
+
+    stage は "round:<番号>"・"semi"・"final"・"done"。plan はその段の組み合わせ（名前のリスト）で、
+    done はそのうち結果まで取り込んだ組の数。
+    """
+
+    def __init__(self, seed, roster, rounds, heat_size=HEAT_SIZE, outputs=None):
+        self.seed = seed
+        self.roster = field_names(roster)[0]
+        self.rounds = rounds
+        self.heat_size = heat_size
+        self.outputs = outputs or {}
+        self.table = {name: [0, 0, 0, 0] for name in self.roster}    # 勝ち点, 出走, 1着, 3着内
+        self.stats = RaceStats()
+        self.races = 0
+        self.semis = []           # 準決勝の着順（名前）
+        self.final = None
+        self.stage = None
+        self.plan = []
+        self.done = 0
+        self.history_id = None    # 前回のチェックポイントまでに履歴へ書いたレースの id（None は書き始める前）
+        self.archive_size = None  # 同じくレース記録ファイルの長さ
+        self.stats_saved = False  # 終わった後に集計スナップショットへ足したか
+        self.start_stage("round:0")
+
+    # --- 組み合わせ ---
+
+    def standings(self):
+        return sorted(self.roster, key=lambda name: (-self.table[name][0], -self.table[name][2], name))
+
+    def start_stage(self, stage):
+        self.stage = stage
+        self.done = 0
+        if stage.startswith("round:"):
+            r = int(stage[6:])
+            rng = random.Random(f"{self.seed}:draw:{r}")
+            if r == 0:
+                order = list(self.roster)
+                rng.shuffle(order)
+            else:
+                # 勝ち点の近い馬どうし（同点の並びは抽選）
+                order = sorted(self.roster, key=lambda name: (-self.table[name][0], rng.random()))
+            self.plan = split_heats(order, self.heat_size)
+        elif stage == "semi":
+            top = self.standings()[:self.heat_size * self.heat_size]
+            count = max(1, -(-len(top) // self.heat_size))
+            self.plan = [top[k::count] for k in range(count)]     # 上位を散らして組む
+        elif stage == "final":
+            self.plan = [[places[0] for places in self.semis]] if self.semis else [self.standings()[:self.heat_size]]
+        else:
+            self.plan = []
+
+    def next_stage(self):
+        if self.stage.startswith("round:"):
+            r = int(self.stage[6:]) + 1
+            if r < self.rounds:
+                self.start_stage(f"round:{r}")
+            else:
+                # 1組に収まる頭数なら準決勝は無し
+                self.start_stage("semi" if len(self.roster) > self.heat_size else "final")
+        elif self.stage == "semi":
+            self.start_stage("final")
+        else:
+            self.start_stage("done")
+
+    def pending(self):
+        # まだ走らせていない組：(シード, 出走馬の名前)
+        return [(heat_seed(self.seed, self.stage, k), self.plan[k]) for k in range(self.done, len(self.plan))]
+
+    # --- 結果の取り込み ---
+
+    def add(self, entrants, record):
+        places = [entrants[idx] for idx in record["results"]]
+        for place, name in enumerate(places, start=1):
+            row = self.table[name]
+            if self.stage.startswith("round:"):
+                row[0] += POINTS[place - 1] if place <= len(POINTS) else 0
+            row[1] += 1
+            row[2] += place == 1
+            row[3] += place <= 3
+        self.stats.add_race(record, entrants)
+        self.races += 1
+        if self.stage == "semi":
+            self.semis.append(places)
+        elif self.stage == "final":
+            self.final = places
+        self.done += 1
+
+    # --- チェックポイント ---
+
+    def to_dict(self):
+        return {
+            "version": CHECKPOINT_VERSION,
+            "seed": self.seed,
+            "roster": len(self.roster),
+            "rounds": self.rounds,
+            "heat_size": self.heat_size,
+            "outputs": self.outputs,
+            "table": self.table,
+            "stats": self.stats.to_dict(),
+            "races": self.races,
+            "semis": self.semis,
+            "final": self.final,
+            "stage": self.stage,
+            "plan": self.plan,
+            "done": self.done,
+            "history_id": self.history_id,
+            "archive_size": self.archive_size,
+            "stats_saved": self.stats_saved,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get("version") != CHECKPOINT_VERSION:
+            raise ValueError(f"unsupported season checkpoint version: {data.get('version')}")
+        season = cls(data["seed"], data["roster"], data["rounds"], data["heat_size"], data["outputs"])
+        season.table = data["table"]
+        season.stats = RaceStats.from_dict(data["stats"])
+        season.races = data["races"]
+        season.semis = data["semis"]
+        season.final = data["final"]
+        season.stage = data["stage"]
+        season.plan = data["plan"]
+        season.done = data["done"]
+        season.history_id = data["history_id"]
+        season.archive_size = data["archive_size"]
+        season.stats_saved = data["stats_saved"]
+        return season
+
+    def save(self, path):
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+    def total_races(self):
+        # 予選の残りは組数から、準決勝・決勝は頭数から見積もる
+        per_round = -(-len(self.roster) // self.heat_size)
+        semis = 0
+        if len(self.roster) > self.heat_size:
+            semis = -(-min(len(self.roster), self.heat_size * self.heat_size) // self.heat_size)
+        return self.rounds * per_round + semis + 1
+
+
+class ResultSink:
+    """レース結果の書き出し先（履歴 DB・.race ファイル）。チェックポイントより後の分は開くときに捨てる。
+
+    新しいシーズンは既にあるファイルの今の末尾を起点にし、それより前のレースには触らない。
+    """
+
+    def __init__(self, season):
+        self.season = season
+        outputs = season.outputs
+        self.history = None
+        if outputs.get("history"):
+            from history import HistoryStore
+            self.history = HistoryStore(outputs["history"])
+            if season.history_id is None:
+                season.history_id = self.history.last_id()
+            else:
+                self.history.discard_after(season.history_id)
+        self.archive = None
+        if outputs.get("archive"):
+            self.archive = open(outputs["archive"], "ab")
+            if season.archive_size is None:
+                season.archive_size = self.archive.seek(0, os.SEEK_END)
+            else:
+                self.archive.truncate(season.archive_size)
+                self.archive.seek(season.archive_size)
+
+    def write(self, heats, records):
+        if self.history is not None:
+            for entrants, record in zip(heats, records):
+                self.history.record(record, entrants)     # 書き込みは裏のスレッドがまとめて行う
+        if self.archive is not None:
+            self.archive.write(b"".join(racefile.encode_race(record) for record in records))
+
+    def mark(self):
+        # チェックポイントに書く直前：ここまでの分を書き切って位置を覚える
+        if self.history is not None:
+            self.season.history_id = self.history.last_id()
+        if self.archive is not None:
+            self.archive.flush()
+            os.fsync(self.archive.fileno())
+            self.season.archive_size = self.archive.tell()
+
+    def close(self):
+        if self.history is not None:
+            self.history.close()
+        if self.archive is not None:
+            self.archive.close()
+
+
+def run_season(season, path, workers=None, log=print):
+    sink = ResultSink(season)
+    season.save(path)   # 起点を先に残す（最初のチェックポイント前に落ちても、再開で書きかけの分だけ捨てる）
+    total = season.total_races()
+    workers = workers or os.cpu_count() or 1
+    t0 = last_progress = last_checkpoint = time.perf_counter()
+    races0 = season.races
+
+    def checkpoint():
+        sink.mark()
+        season.save(path)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=set_balance, initargs=(BALANCE,)) as pool:
+            while season.stage != "done":
+                heats = season.pending()
+                # ワーカー数の数倍に切って、遅い組があっても手の空くワーカーを作らない
+                size = max(1, min(BATCH_HEATS, -(-len(heats) // (workers * 4))))
+                batches = [heats[k:k + size] for k in range(0, len(heats), size)]
+                futures = [pool.submit(run_heats, [seed for seed, _ in batch], [len(names) for _, names in batch])
+                           for batch in batches]
+                # 出した順に取り込む（done が「先頭から何組目まで済んだか」になるように）
+                for batch, future in zip(batches, futures):
+                    entrants = [names for _, names in batch]
+                    records = future.result()
+                    for names, record in zip(entrants, records):
+                        season.add(names, record)
+                    sink.write(entrants, records)
+
+                    now = time.perf_counter()
+                    if now - last_checkpoint >= CHECKPOINT_SECONDS:
+                        checkpoint()
+                        last_checkpoint = now
+                    if now - last_progress >= PROGRESS_SECONDS:
+                        rate = (season.races - races0) / (now - t0)
+                        eta = (total - season.races) / rate if rate else 0.0
+                        log(f"{season.stage:<10} {season.races:>8}/{total} races  {rate:7.0f} races/s  "
+                            f"eta {eta / 60:5.1f} min")
+                        last_progress = now
+                season.next_stage()
+                checkpoint()
+                last_checkpoint = time.perf_counter()
+    finally:
+        sink.close()
+    return season
+
+
+def print_season(season, top=10):
+    print(f"{season.races} races, {season.rounds} rounds x {len(season.roster)} cacti")
+    print("rank  name                    points  starts  wins  top3")
+    for rank, name in enumerate(season.standings()[:top], start=1):
+        points, starts, wins, top3 = season.table[name]
+        print(f"{rank:>4}  {name:<20}  {points:>6}  {starts:>6}  {wins:>4}  {top3:>4}")
+    for k, places in enumerate(season.semis, start=1):
+        print(f"semi {k}: " + " > ".join(places))
+    if season.final:
+        print("final: " + " > ".join(season.final))
+        print(f"champion: {season.final[0]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="予選ラウンド＋準決勝・決勝のシーズンを画面なしで回す")
+    parser.add_argument("checkpoint", help="シーズンの状態を書くファイル（あれば続きから）")
+    parser.add_argument("--roster", type=int, default=500, help="出走する馬の数")
+    parser.add_argument("--rounds", type=int, default=200, help="予選ラウンド数（1ラウンドで全馬が1回走る）")
+    parser.add_argument("--heat-size", type=int, default=HEAT_SIZE)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--history", help="レース履歴 DB（history.py）に書く")
+    parser.add_argument("--archive", help=".race ファイルに追記する")
+    parser.add_argument("--stats", help="終わったら集計をこのスナップショット（racestats.py）に足す")
+    parser.add_argument("-j", "--workers", type=int, default=None)
+    args = parser.parse_args()
+    load_balance()
+
+    if os.path.exists(args.checkpoint):
+        try:
+            season = Season.load(args.checkpoint)
+        except ValueError as e:
+            sys.exit(str(e))
+        print(f"resuming {args.checkpoint} at {season.stage} ({season.races} races done)")
+    else:
+        seed = args.seed if args.seed is not None else random.getrandbits(32)
+        outputs = {"history": args.history, "archive": args.archive, "stats": args.stats}
+        season = Season(seed, args.roster, args.rounds, args.heat_size, outputs)
+
+    if season.stage != "done":
+        t0 = time.perf_counter()
+        races0 = season.races
+        run_season(season, args.checkpoint, args.workers)
+        wall = time.perf_counter() - t0
+        print(f"ran {season.races - races0} races in {wall:.1f} s ({(season.races - races0) / wall:.0f} races/s)")
+    stats_path = season.outputs.get("stats")
+    if stats_path and not season.stats_saved:
+        RaceStats.load(stats_path).merge(season.stats).save(stats_path)
+        season.stats_saved = True
+        season.save(args.checkpoint)
+    print_season(season)
@@ -0,0 +1,122 @@
+from race_engine import RaceEngine, WIDTH, BG_SPEED, TICK_DT
+from replay import FrameRing, RaceRecorder, ReplayPlayer
+
+HISTORY_LENGTH = 150      # 2.5秒分の履歴（60FPS×2.5秒）
+RESULT_ROWS = 8           # 結果表示の行数の上限（大人数レース用）
+RESULT_ROW_TICKS = 60     # 結果を1行ずつ出す間隔
+PHOTO_FINISH_TICKS = 240  # スローリプレイ後の写真判定の表示時間
+
+# 馬の名前（神話系）と色
+CACTUS_NAMES = ["スカーレット", "アズール", "ソレイユ", "ヴェルデ", "ブラン"]
+HORSE_COLORS = ["赤", "青", "黄", "緑", "白"]
+
+
+def field_names(n):
+    # 6頭目以降は基本5色の色違い（赤2, 青2, ...）と番号付きの名前（スカーレット2, ...）を作る。
+    # 同梱フォントは数字・カタカナと限られた漢字だけなので、名前に足すのは数字だけ
+    names, colors = [], []
+    base = len(CACTUS_NAMES)
+    for i in range(n):
+        gen = i // base
+        if gen > 0:
+            names.append(f"{CACTUS_NAMES[i % base]}{gen + 1}")
+            colors.append(f"{HORSE_COLORS[i % base]}{gen + 1}")
+        else:
+            names.append(CACTUS_NAMES[i])
+            colors.append(HORSE_COLORS[i])
+    return names, colors
+
+
+class RaceTrack:
+    """1コース分のレース進行（描画なし）。
+
+    engine に加えて、背景スクロール・直近フレームの履歴・ゴール後のスローリプレイ・
+    結果を1行ずつ出す演出の状態を持つ。ゲーム画面（game.py）は1本だけ、
+    ヘッドレスのサーバー（server.py）は何本でも同じループで進める。
+    """
+
+    def __init__(self, num_horses, seed=None, record=False, history_length=HISTORY_LENGTH):
+        self.num_horses = num_horses
+        self.engine = RaceEngine(num_horses=num_horses, seed=seed)
+        self.frame_history = FrameRing(history_length, num_horses)  # 常時最新フレームを保存
+        self.recorder = RaceRecorder(num_horses) if record else None  # レース全体の記録（全体リプレイ用）
+        self.prev_x = [0.0] * num_horses  # 直前ティックの x（描画時にティック間を補間する）
+        self._clear()
+
+    def reset(self, seed=None):
+        self.engine.reset(seed)
+        self._clear()
+
+    def _clear(self):
+        self.bg_x = 0
+        self.finished = False
+        self.replay_mode = False        # リプレイ中かどうか
+        self.replay_player = None       # リプレイ再生（frame_history / recorder をそのまま参照）
+        self.photo_finish_timer = 0     # リプレイ終了後の写真判定表示用
+        self.result_display_index = 0
+        self.result_display_ticks = 0
+        self.results_saved = False      # 結果保存の一度きりフラグ
+        self.frame_history.clear()
+        if self.recorder is not None:
+            self.recorder.clear()
+        self.prev_x[:] = [pos[0] for pos in self.engine.positions]
+
+    def update(self):
+        # 1ティック分の状態更新。全馬がゴールしたティックだけ True を返す（結果の保存は呼び出し側で）
+        engine = self.engine
+
+        # --- リプレイ進行 ---
+        if self.replay_mode:
+            if not self.replay_player.done:
+                self.replay_player.update()  # 少しずつ進める
+            else:
+                # リプレイ終了 → 写真判定演出
+                self.photo_finish_timer += 1
+                if self.photo_finish_timer >= PHOTO_FINISH_TICKS:
+                    self.replay_mode = False
+                    self.finished = True
+                    self.result_display_ticks = 0
+
+        # 結果を1秒ごとに1行ずつ表示
+        if self.finished and not self.replay_mode:
+            if self.result_display_index < min(len(engine.results), RESULT_ROWS):
+                if self.result_display_ticks >= self.result_display_index * RESULT_ROW_TICKS:
+                    self.result_display_index += 1
+                self.result_display_ticks += 1
+
+        if self.finished:
+            return False
+
+        # 背景スクロール
+        self.bg_x -= BG_SPEED
+        if self.bg_x <= -WIDTH:
+            self.bg_x = 0
+
+        # レース進行
+        positions = engine.positions
+        self.prev_x[:] = [pos[0] for pos in positions]
+        engine.step(TICK_DT)
+
+        # --- フレーム履歴に保存（リプレイ中は止めてバッファをそのまま見せる） ---
+        if not self.replay_mode:
+            frame_snapshot = [pos[0] for pos in positions]
+            self.frame_history.append(frame_snapshot)
+            if self.recorder is not None:
+                self.recorder.record(frame_snapshot)
+
+        # 全馬ゴールしたら → リプレイ突入（0.5倍速のスロー）
+        if not self.replay_mode and engine.all_finished:
+            self.replay_player = ReplayPlayer(self.frame_history, speed=0.5)
+            self.replay_mode = True
+            self.photo_finish_timer = 0
+
+        if not self.results_saved and engine.all_finished:
+            self.results_saved = True
+            return True
+        return False
+
+    def play_full_replay(self):
+        # レース全体を等速でリプレイ（record=True のときだけ）
+        self.replay_player = ReplayPlayer(self.recorder, speed=1.0)
+        self.replay_mode = True
+        self.photo_finish_timer = 0
@@ -0,0 +1,232 @@
+import argparse
+import copy
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from batch_sim import NOT_FINISHED, simulate_batch
+from race_engine import BALANCE, BALANCE_FILE, BALANCE_VERSION, GOAL_X, START_X, STRATEGIES, load_balance
+
+# 戦術バランスの自動調整。batch_sim で一括シミュレーションして有利戦術 × 1着の戦術の勝数を数え、
+# 戦術別の勝率が目標に近づくようにパラメータを動かす（パターンサーチ：全部のつまみを ± 1 歩ずつ並列に試し、
+# 良くなった動きを全部合わせた候補と、いちばん良かった1つのうち良い方を採る。どれも良くならなければ歩幅を半分に）。
+# 候補はすべて同じシードで比べる（乱数をそろえると差だけが見えるので少ないレース数で足りる）。
+#   python tune_balance.py [--races 16384] [--iterations 20] [--target 参型=0.25,壱型=0.25,...]
+#                          [--advantaged-win 0.4] [--out balance.json]
+# 結果は balance.json に書き、ゲームは起動時に読む（race_engine.load_balance）。
+# 同じパラメータ・シード・レース数の結果は .balance_cache.json に残して、反復の間と次回の実行で使い回す
+CACHE_FILE = ".balance_cache.json"
+MAX_RACE_TICKS = 60 * 60  # 1分で打ち切り。ゴールしない馬が出るパラメータ（スタミナが負で後退する等）は失格
+STALL_PENALTY = 1.0
+MIN_STEP_RATIO = 1 / 16   # 歩幅が最初のこれ未満になったら止める
+
+# つまみ：(名前, 最初の歩幅, 下限, 上限)。範囲を持つものは幅を保ったまま下端を動かす
+KNOBS = (
+    [(f"stamina_cost:{s}", 0.05, 0.05, 0.4) for s in STRATEGIES]      # 上げすぎるとスタミナが負になり後退する
+    + [(f"deadheat:{s}", 100, START_X, GOAL_X - 400) for s in STRATEGIES]
+    + [(f"other_burst:{s}", 0.1, 0.5, 1.5) for s in STRATEGIES]
+    + [("yon_advantaged_bonus", 0.1, 1.0, 2.0)]
+)
+ADVANTAGED_KNOB = ("advantaged_burst", 0.1, 1.0, 2.5)   # --advantaged-win のときだけ動かす
+
+
+def get_knob(balance, name):
+    key, _, strategy = name.partition(":")
+    value = balance[key][strategy] if strategy else balance[key]
+    return value[0] if isinstance(value, list) else value
+
+
+def set_knob(balance, name, value):
+    key, _, strategy = name.partition(":")
+    table, key = (balance[key], strategy) if strategy else (balance, key)
+    old = table[key]
+    value = round(value, 4)
+    if isinstance(old, list):
+        table[key] = [value, round(value + old[1] - old[0], 4)]
+    else:
+        table[key] = value
+
+
+def cache_key(balance, races, horses, seed):
+    return json.dumps([balance, races, horses, seed], sort_keys=True, ensure_ascii=False)
+
+
+def simulate(balance, races, horses, seed):
+    # ワーカー側：有利戦術（行）× 1着の戦術（列）のレース数と、打ち切りまでに全馬ゴールしなかったレース数
+    orders, batches = simulate_batch(races, horses, seed, return_batches=True, balance=balance,
+                                     max_ticks=MAX_RACE_TICKS)
+    strategy = np.concatenate([b.strategy.T for b in batches])
+    advantaged = np.concatenate([b.advantaged for b in batches])
+    stalled = sum(int((b.finish_tick == NOT_FINISHED).any(axis=0).sum()) for b in batches)
+    winner = strategy[np.arange(races), orders[:, 0]]
+    k = len(STRATEGIES)
+    counts = np.bincount(advantaged.astype(np.int64) * k + winner, minlength=k * k).reshape(k, k)
+    return {"counts": counts.tolist(), "stalled": stalled}
+
+
+class Tuner:
+    def __init__(self, target, advantaged_win=None, races=16384, horses=5, seed=0,
+                 cache_path=CACHE_FILE, workers=None):
+        self.target = np.array([target[s] for s in STRATEGIES])
+        self.advantaged_win = advantaged_win
+        self.races = races
+        self.horses = horses
+        self.seed = seed
+        self.cache_path = cache_path
+        self.workers = workers
+        self.cache = {}
+        self.hits = 0
+        if cache_path and os.path.exists(cache_path):
+            with open(cache_path, encoding="utf-8") as f:
+                self.cache = json.load(f)
+        self.knobs = list(KNOBS) + ([ADVANTAGED_KNOB] if advantaged_win is not None else [])
+
+    def save_cache(self):
+        if self.cache_path:
+            with open(self.cache_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(self.cache, f, ensure_ascii=False)
+            os.replace(self.cache_path + ".tmp", self.cache_path)
+
+    def counts(self, pool, balances, seed=None):
+        # 各候補の勝数表。キャッシュに無いものだけ並列に回す
+        seed = self.seed if seed is None else seed
+        keys = [cache_key(b, self.races, self.horses, seed) for b in balances]
+        missing = {}
+        for key, balance in zip(keys, balances):
+            if key in self.cache:
+                self.hits += 1
+            elif key not in missing:
+                missing[key] = pool.submit(simulate, balance, self.races, self.horses, seed)
+        for key, future in missing.items():
+            self.cache[key] = future.result()
+        return [self.cache[key] for key in keys]
+
+    def error(self, result):
+        # 戦術別勝率と目標の差の二乗和（有利戦術の勝率の目標があればそれも）＋打ち切りレースの割合の罰
+        counts = np.array(result["counts"])
+        total = counts.sum()
+        rates = counts.sum(axis=0) / total
+        err = float(((rates - self.target) ** 2).sum())
+        if self.advantaged_win is not None:
+            err += (np.trace(counts) / total - self.advantaged_win) ** 2
+        return err + STALL_PENALTY * result["stalled"] / total
+
+    def neighbours(self, balance, steps):
+        # (つまみ, 動かした値, 候補)
+        for name, _, lo, hi in self.knobs:
+            value = get_knob(balance, name)
+            for sign in (1, -1):
+                moved = value + sign * steps[name]
+                if lo <= moved <= hi:
+                    candidate = copy.deepcopy(balance)
+                    set_knob(candidate, name, moved)
+                    yield name, moved, candidate
+
+    def run(self, balance, iterations, log=print):
+        steps = {name: step for name, step, _, _ in self.knobs}
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            best_err = self.error(self.counts(pool, [balance])[0])
+            log(f"start  error {best_err:.6f}")
+            for it in range(1, iterations + 1):
+                t0 = time.perf_counter()
+                moves = list(self.neighbours(balance, steps))
+                candidates = [candidate for _, _, candidate in moves]
+                errors = [self.error(c) for c in self.counts(pool, candidates)]
+                # つまみごとに良くなった向きを選んで、まとめて動かした候補も作る
+                improved = {}
+                for (name, moved, _), err in zip(moves, errors):
+                    if err < best_err and err < improved.get(name, (None, best_err))[1]:
+                        improved[name] = (moved, err)
+                if len(improved) > 1:
+                    combined = copy.deepcopy(balance)
+                    for name, (moved, _) in improved.items():
+                        set_knob(combined, name, moved)
+                    candidates.append(combined)
+                    errors.append(self.error(self.counts(pool, [combined])[0]))
+                self.save_cache()
+                k = int(np.argmin(errors))
+                if errors[k] < best_err:
+                    note = f"accept ({'combined' if k == len(moves) else moves[k][0]})"
+                    balance, best_err = candidates[k], errors[k]
+                else:
+                    for name in steps:
+                        steps[name] /= 2
+                    note = "halve steps"
+                log(f"iter {it:>3}  error {best_err:.6f}  {len(candidates)} candidates  "
+                    f"cache hits {self.hits}  {time.perf_counter() - t0:5.1f} s  {note}")
+                if all(steps[name] < step * MIN_STEP_RATIO for name, step, _, _ in self.knobs):
+                    break
+        return balance, best_err
+
+    def measure(self, balance, seed):
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            result = self.counts(pool, [balance], seed)[0]
+        self.save_cache()
+        return np.array(result["counts"])
+
+
+def win_table(counts):
+    # {"overall": {戦術: 勝率}, "<有利戦術>": {戦術: 勝率}}
+    table = {"overall": dict(zip(STRATEGIES, (counts.sum(axis=0) / counts.sum()).round(4).tolist()))}
+    for adv, row in zip(STRATEGIES, counts):
+        table[adv] = dict(zip(STRATEGIES, (row / max(row.sum(), 1)).round(4).tolist()))
+    return table
+
+
+def print_counts(label, counts):
+    print(f"{label}: {counts.sum()} races")
+    print("advantaged  " + "  ".join(f"{s:>6}" for s in STRATEGIES))
+    for name, rates in win_table(counts).items():
+        print(f"{name:<10}  " + "  ".join(f"{rates[s]:6.3f}" for s in STRATEGIES))
+
+
+def save_balance(path, balance, extra):
+    data = {"version": BALANCE_VERSION, **balance, **extra}
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def parse_target(text):
+    target = dict.fromkeys(STRATEGIES, 1 / len(STRATEGIES))
+    if text:
+        for item in text.split(","):
+            name, value = item.split("=")
+            target[name] = float(value)
+    return target
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="戦術バランスの自動調整")
+    parser.add_argument("--races", type=int, default=16384, help="1候補あたりのレース数")
+    parser.add_argument("--horses", type=int, default=5)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--target", default=None, help="戦術別の目標勝率（既定は全戦術 1/4）")
+    parser.add_argument("--advantaged-win", type=float, default=None, help="有利戦術の馬が勝つ割合の目標")
+    parser.add_argument("--start", default=None, help="このパラメータファイルから始める（既定は今の balance.json）")
+    parser.add_argument("--out", default=BALANCE_FILE)
+    parser.add_argument("--cache", default=CACHE_FILE, help="シミュレーション結果の置き場（空文字で使わない）")
+    parser.add_argument("-j", "--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    load_balance(args.start)
+    start = copy.deepcopy(BALANCE)
+    target = parse_target(args.target)
+    tuner = Tuner(target, args.advantaged_win, args.races, args.horses, args.seed, args.cache, args.workers)
+
+    print_counts("before", tuner.measure(start, args.seed))
+    balance, err = tuner.run(start, args.iterations)
+    # 探索に使っていないシードでも確かめる（同じ乱数への合わせ込みになっていないか）
+    counts = tuner.measure(balance, args.seed + 1)
+    print_counts("after (validation seed)", counts)
+    save_balance(args.out, balance, {
+        "target": target,
+        "advantaged_win": args.advantaged_win,
+        "win_rates": win_table(counts),
+        "races": int(counts.sum()),
+    })
+    print(f"wrote {args.out} (error {err:.6f})")
@@ -0,0 +1,265 @@
+import struct
+
+from race_engine import BG_SPEED, GOAL_LINE_START_X, GOAL_LINE_TIME, STRATEGIES, WIDTH
+from replay import POSITION_SCALE, _unzigzag, _zigzag
+from track import RESULT_ROWS, RESULT_ROW_TICKS
+
+# 観戦用のレース状態ストリーム（server.py → 観戦画面）。
+# 接続直後とレースの切り替わりにキーフレーム（出走表＋その時点の全状態）を1つ送り、
+# 以降はティックごとに前のティックからの差分だけを送る。x は 1/16px に量子化し、
+# 差分はジグザグ符号化した可変長整数（走っている間はほぼ 1～2 バイト/頭）。
+#
+# キーフレーム：KEY_HEADER, 頭数 × (作戦 B, 名前, 色)［文字列は varint 長＋UTF-8］,
+#               頭数 × x (uint16), 順位（先頭から馬番号, varint）
+# 差分        ：DELTA_HEADER（種別, ティックの下位8ビット, フラグ）, [フェーズ B], [ゴール線 x h],
+#               頭数 × dx (varint), [順位が変わった枠の数, (枠, 馬番号) × 数]
+WIRE_VERSION = 1
+KEYFRAME, DELTA = 1, 2
+KEY_HEADER = struct.Struct("<BBIIBHIBHhh")   # 種別, 版, レース番号, シード, 有利戦術, 頭数, ティック, フェーズ, フェーズ内ティック, 背景 x, ゴール線 x
+DELTA_HEADER = struct.Struct("<BBB")
+PHASE_CHANGED, GOAL_MOVED, ORDER_CHANGED = 1, 2, 4
+
+# フェーズ（ゲーム画面の opening_sequence → main() と同じ並び）
+OPENING, WAITING, COUNTDOWN, RACING, REPLAY, PHOTO, RESULTS = range(7)
+
+
+def _put_varint(out, u):
+    while u >= 0x80:
+        out.append((u & 0x7F) | 0x80)
+        u >>= 7
+    out.append(u)
+
+
+def _get_varint(buf, pos):
+    u = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        u |= (b & 0x7F) << shift
+        if b < 0x80:
+            return u, pos
+        shift += 7
+
+
+def _put_text(out, text):
+    data = text.encode()
+    _put_varint(out, len(data))
+    out += data
+
+
+def _get_text(buf, pos):
+    n, pos = _get_varint(buf, pos)
+    return bytes(buf[pos:pos + n]).decode(), pos + n
+
+
+def quantize(x):
+    return min(max(round(x * POSITION_SCALE), 0), 0xFFFF)
+
+
+class StateEncoder:
+    """1コース分のストリームを作る。ティックごとに update() で差分を作り、基準を進める。
+
+    keyframe() は「今の基準」をそのまま書くので、途中から繋いだ観戦者にはキーフレームを、
+    ほかの観戦者には同じティックの差分を送れば、次のティックからは全員同じ差分でよい。
+    """
+
+    def __init__(self, num_horses):
+        self.num_horses = num_horses
+        self.setup = None
+
+    def reset(self, setup, frames, phase, phase_ticks, xs, order, goal_x, bg_x):
+        # 基準を丸ごと置き換える（新しいレース、または差分を作っていなかった間の後）。
+        # setup は race, seed, advantaged_type, names, colors, strategies
+        self.setup = setup
+        self.frames = frames
+        self.phase = phase
+        self.phase_ticks = phase_ticks
+        self.xs = [quantize(x) for x in xs]
+        self.order = list(order)
+        self.goal_x = int(goal_x)
+        self.bg_x = int(bg_x)
+
+    def keyframe(self):
+        setup = self.setup
+        n = self.num_horses
+        out = bytearray(KEY_HEADER.pack(
+            KEYFRAME, WIRE_VERSION, setup["race"], setup["seed"], STRATEGIES.index(setup["advantaged_type"]),
+            n, self.frames, self.phase, min(self.phase_ticks, 0xFFFF), self.bg_x, self.goal_x))
+        for strategy, name, color in zip(setup["strategies"], setup["names"], setup["colors"]):
+            out.append(STRATEGIES.index(strategy))
+            _put_text(out, name)
+            _put_text(out, color)
+        out += struct.pack(f"<{n}H", *self.xs)
+        for idx in self.order:
+            _put_varint(out, idx)
+        return bytes(out)
+
+    def update(self, frames, phase, xs, order, goal_x, bg_x):
+        # 1ティック進めて差分を返す
+        flags = 0
+        head = bytearray()
+        if phase != self.phase:
+            flags |= PHASE_CHANGED
+            head.append(phase)
+            self.phase = phase
+            self.phase_ticks = 0
+        else:
+            self.phase_ticks += 1
+        goal_x = int(goal_x)
+        if goal_x != self.goal_x:
+            flags |= GOAL_MOVED
+            head += struct.pack("<h", goal_x)
+            self.goal_x = goal_x
+        self.frames = frames
+        self.bg_x = int(bg_x)
+
+        body = bytearray()
+        last = self.xs
+        for k, x in enumerate(xs):
+            q = quantize(x)
+            _put_varint(body, _zigzag(q - last[k]))
+            last[k] = q
+
+        last_order = self.order
+        changes = [(slot, idx) for slot, (idx, prev) in enumerate(zip(order, last_order)) if idx != prev]
+        if changes:
+            flags |= ORDER_CHANGED
+            _put_varint(body, len(changes))
+            for slot, idx in changes:
+                _put_varint(body, slot)
+                _put_varint(body, idx)
+                last_order[slot] = idx
+        return DELTA_HEADER.pack(DELTA, frames & 0xFF, flags) + head + body
+
+
+class StateDecoder:
+    """ストリームを受けて最新の状態を持つ。差分の前にキーフレームが要る。"""
+
+    def __init__(self):
+        self.ready = False
+        self.setup = None
+
+    def feed(self, buf):
+        # 1メッセージ分を適用する。順序が崩れていたら ValueError（次のキーフレームまで待つ）
+        if buf[0] == KEYFRAME:
+            self._keyframe(buf)
+        elif buf[0] == DELTA:
+            if not self.ready:
+                raise ValueError("delta before keyframe")
+            self._delta(buf)
+        else:
+            raise ValueError(f"unknown message type {buf[0]}")
+
+    def _keyframe(self, buf):
+        (_, version, race, seed, adv, n, frames, phase, phase_ticks,
+         bg_x, goal_x) = KEY_HEADER.unpack_from(buf)
+        if version != WIRE_VERSION:
+            raise ValueError(f"unsupported wire version {version}")
+        pos = KEY_HEADER.size
+        strategies, names, colors = [], [], []
+        for _ in range(n):
+            strategies.append(STRATEGIES[buf[pos]])
+            name, pos = _get_text(buf, pos + 1)
+            color, pos = _get_text(buf, pos)
+            names.append(name)
+            colors.append(color)
+        self.xs = list(struct.unpack_from(f"<{n}H", buf, pos))
+        pos += 2 * n
+        order = []
+        for _ in range(n):
+            idx, pos = _get_varint(buf, pos)
+            order.append(idx)
+        self.setup = {"race": race, "seed": seed, "advantaged_type": STRATEGIES[adv],
+                      "names": names, "colors": colors, "strategies": strategies}
+        self.num_horses = n
+        self.frames = frames
+        self.phase = phase
+        self.phase_ticks = phase_ticks
+        self.bg_x = bg_x
+        self.goal_x = goal_x
+        self.order = order
+        self.ready = True
+
+    def _delta(self, buf):
+        _, seq, flags = DELTA_HEADER.unpack_from(buf)
+        if seq != (self.frames + 1) & 0xFF:
+            self.ready = False
+            raise ValueError(f"delta out of sequence ({seq} after {self.frames & 0xFF})")
+        self.frames += 1
+        pos = DELTA_HEADER.size
+        if flags & PHASE_CHANGED:
+            self.phase = buf[pos]
+            self.phase_ticks = 0
+            pos += 1
+        else:
+            self.phase_ticks += 1
+        if flags & GOAL_MOVED:
+            self.goal_x = struct.unpack_from("<h", buf, pos)[0]
+            pos += 2
+        # 背景はレース中（結果表示まで）だけ流れる（RaceTrack.update と同じ）
+        if RACING <= self.phase < RESULTS:
+            self.bg_x -= BG_SPEED
+            if self.bg_x <= -WIDTH:
+                self.bg_x = 0
+
+        xs = self.xs
+        for k in range(self.num_horses):
+            u = 0
+            shift = 0
+            while True:
+                b = buf[pos]
+                pos += 1
+                u |= (b & 0x7F) << shift
+                if b < 0x80:
+                    break
+                shift += 7
+            xs[k] += _unzigzag(u)
+        if flags & ORDER_CHANGED:
+            count, pos = _get_varint(buf, pos)
+            order = self.order
+            for _ in range(count):
+                slot, pos = _get_varint(buf, pos)
+                order[slot], pos = _get_varint(buf, pos)
+
+    def positions(self):
+        return [q / POSITION_SCALE for q in self.xs]
+
+    def apply(self, track, horse_names):
+        # 受信した状態を RaceTrack に書き込み、game.draw_frame でそのまま描けるようにする
+        engine = track.engine
+        setup = self.setup
+        xs = self.positions()
+        for pos, x in zip(engine.positions, xs):
+            pos[0] = x
+        track.prev_x[:] = xs          # 補間はしない（届いたティックをそのまま描く）
+        engine.order[:] = self.order
+        engine.results[:] = self.order if self.phase >= REPLAY else []
+        engine.advantaged_type = setup["advantaged_type"]
+        for stat, strategy in zip(engine.stats_list, setup["strategies"]):
+            stat["strategy"] = strategy
+        horse_names[:] = setup["names"]
+        # draw_frame はゴール線を経過時間で出すので、線が動き出していたら時計をそこまで進めておく
+        engine.goal_line_x = self.goal_x
+        engine.start_time = 0.0
+        engine.clock = GOAL_LINE_TIME if self.goal_x < GOAL_LINE_START_X else 0.0
+        track.bg_x = self.bg_x
+        track.finished = self.phase == RESULTS
+        track.replay_mode = self.phase in (REPLAY, PHOTO)
+        track.replay_player = _RemoteReplay(xs, self.phase == PHOTO) if track.replay_mode else None
+        track.photo_finish_timer = self.phase_ticks if self.phase == PHOTO else 0
+        if track.finished:
+            track.result_display_index = min(self.num_horses, RESULT_ROWS, self.phase_ticks // RESULT_ROW_TICKS + 1)
+
+
+class _RemoteReplay:
+    # 観戦側のスローリプレイ：サーバーが再生中のフレームを送ってくるので、それを見せるだけ
+    speed = 0.5
+    paused = False
+
+    def __init__(self, xs, done):
+        self.xs = xs
+        self.done = done
+
+    def frame(self):
+        return self.xs